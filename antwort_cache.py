@@ -0,0 +1,131 @@
+# antwort_cache.py
+"""
+Semantischer Antwort-Cache für den RAG-Chatbot.
+
+Statt auf den exakten Fragetext wird auf das Embedding der normalisierten Frage
+(normalisiere_anfrage) geschlüsselt: Eine gespeicherte Antwort wird wiederverwendet, wenn
+eine nahezu gleiche Frage (Kosinus-Ähnlichkeit >= Schwelle) gegen denselben Kontext-Fall
+beantwortet wurde. Eviction nach LRU, TTL und einem Speicherlimit; abgelaufene Einträge
+werden in Einfügereihenfolge vom Anfang entfernt, ohne den ganzen Cache zu durchsuchen.
+"""
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict, deque
+from dataclasses import dataclass
+
+import numpy as np
+
+from vektor_suche import normalisiere
+
+
+def normalisiere_anfrage(text):
+    """Kleinschreibung, Unicode-NFKC, ohne Satzzeichen (außer §) und überflüssige Leerzeichen."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = re.sub(r"[^\w\s§]", " ", text)
+    return " ".join(text.split())
+
+
+@dataclass
+class CacheEintrag:
+    normalisiert: str
+    vektor: np.ndarray
+    antwort: str
+    kontext_titel: str
+    zeitpunkt: float
+    groesse: int
+
+
+class SemantischerAntwortCache:
+    """Thread-sicherer LRU/TTL-Cache, geteilt von allen Sessions eines Prozesses."""
+
+    def __init__(self, schwelle=0.95, max_eintraege=2000, ttl_sekunden=3600, max_bytes=64 * 1024 * 1024):
+        self.schwelle = schwelle
+        self.max_eintraege = max_eintraege
+        self.ttl_sekunden = ttl_sekunden
+        self.max_bytes = max_bytes
+        self._eintraege = OrderedDict()  # (kontext_titel, normalisiert) -> CacheEintrag, älteste zuerst
+        self._pro_kontext = defaultdict(set)  # kontext_titel -> Schlüssel seiner Einträge
+        self._ablauf = deque()  # (zeitpunkt, schluessel) in Einfügereihenfolge, evtl. mit veralteten Paaren
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._treffer_exakt = 0
+        self._treffer_semantisch = 0
+        self._fehlschlaege = 0
+
+    def _entferne(self, schluessel):
+        eintrag = self._eintraege.pop(schluessel)
+        self._bytes -= eintrag.groesse
+        schluessel_im_kontext = self._pro_kontext[schluessel[0]]
+        schluessel_im_kontext.discard(schluessel)
+        if not schluessel_im_kontext:
+            del self._pro_kontext[schluessel[0]]
+
+    def _entferne_abgelaufene(self, jetzt):
+        """Nur die abgelaufenen Paare am Anfang von self._ablauf; Aufwand O(abgelaufen)."""
+        while self._ablauf and jetzt - self._ablauf[0][0] > self.ttl_sekunden:
+            zeitpunkt, schluessel = self._ablauf.popleft()
+            eintrag = self._eintraege.get(schluessel)
+            # Ersetzte oder schon verdrängte Einträge haben hier nur ein veraltetes Paar
+            if eintrag is not None and eintrag.zeitpunkt == zeitpunkt:
+                self._entferne(schluessel)
+
+    def suche(self, normalisiert, vektor, kontext_titel):
+        """Gibt die gespeicherte Antwort zurück oder None. `vektor` ist das Embedding von `normalisiert`."""
+        jetzt = time.time()
+        with self._lock:
+            self._entferne_abgelaufene(jetzt)
+
+            # Schneller Pfad: gleiche Frage nach Normalisierung
+            schluessel = (kontext_titel, normalisiert)
+            if schluessel in self._eintraege:
+                self._eintraege.move_to_end(schluessel)
+                self._treffer_exakt += 1
+                return self._eintraege[schluessel].antwort
+
+            kandidaten = list(self._pro_kontext.get(kontext_titel, ()))
+            if kandidaten:
+                matrix = np.stack([self._eintraege[k].vektor for k in kandidaten])
+                scores = matrix @ normalisiere(vektor)
+                bester = int(np.argmax(scores))
+                if scores[bester] >= self.schwelle:
+                    self._eintraege.move_to_end(kandidaten[bester])
+                    self._treffer_semantisch += 1
+                    return self._eintraege[kandidaten[bester]].antwort
+
+            self._fehlschlaege += 1
+            return None
+
+    def speichere(self, normalisiert, vektor, kontext_titel, antwort):
+        vektor = normalisiere(vektor)
+        groesse = vektor.nbytes + len(antwort.encode("utf-8")) + len(normalisiert.encode("utf-8")) + 256
+        if groesse > self.max_bytes:
+            return
+        with self._lock:
+            schluessel = (kontext_titel, normalisiert)
+            if schluessel in self._eintraege:
+                self._entferne(schluessel)
+            jetzt = time.time()
+            self._eintraege[schluessel] = CacheEintrag(normalisiert, vektor, antwort, kontext_titel, jetzt, groesse)
+            self._pro_kontext[kontext_titel].add(schluessel)
+            self._ablauf.append((jetzt, schluessel))
+            self._bytes += groesse
+            while len(self._eintraege) > self.max_eintraege or self._bytes > self.max_bytes:
+                self._entferne(next(iter(self._eintraege)))
+            if len(self._ablauf) > 2 * max(len(self._eintraege), 1):
+                # Veraltete Paare verdrängter oder ersetzter Einträge abräumen
+                self._ablauf = deque(sorted(((e.zeitpunkt, k) for k, e in self._eintraege.items()), key=lambda paar: paar[0]))
+
+    def statistik(self):
+        with self._lock:
+            treffer = self._treffer_exakt + self._treffer_semantisch
+            anfragen = treffer + self._fehlschlaege
+            return {
+                "eintraege": len(self._eintraege),
+                "bytes": self._bytes,
+                "treffer_exakt": self._treffer_exakt,
+                "treffer_semantisch": self._treffer_semantisch,
+                "fehlschlaege": self._fehlschlaege,
+                "trefferquote": treffer / anfragen if anfragen else 0.0,
+            }
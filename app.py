@@ -1,21 +1,35 @@
 import streamlit as st
 # from dotenv import load_dotenv # Auskommentiert für Deployment
-from streamlit_autorefresh import st_autorefresh
+import streamlit.components.v1 as components
 from datetime import datetime
-import pandas as pd
+import time
+import uuid
+
+import start_profil
+start_profil.starte()
+_lauf_start = time.perf_counter()
 
 # Importe aus unseren Modulen
-from datenbank import lade_faelle, lade_embedding_modell, erstelle_fall_embeddings
-from klausur_logik import generiere_fall_gemini, bewerte_loesung_gemini
-from chatbot_logik import get_chatbot_response
-from gamification_logik import check_achievements, ACHIEVEMENTS
+# Schwere Abhängigkeiten (sentence_transformers/torch, pandas, google-generativeai) werden
+# erst in den Funktionen importiert, die sie brauchen.
+with start_profil.stufe("import_app_module"):
+    from datenbank import lade_retrieval_ressourcen, starte_vorwaermen
+    from klausur_logik import generiere_fall_gemini, bewerte_loesung_gemini_stream, ist_vollstaendige_bewertung, lade_fall_pool
+    from chatbot_logik import get_chatbot_response_stream, neuer_gespraechsverlauf
+    from gamification_logik import verarbeite_ergebnis, LernAggregate, ACHIEVEMENTS
+    from lern_speicher import lade_lern_speicher
+    from kompakte_datensaetze import Lernhistorie
+    from lern_statistik import LernStatistik
+from einstellungen import (
+    VORWAERMEN, STARTPROFIL, FALLDATENBANK, DASHBOARD_SEITENGROESSE, MESSUNG_METRIK_PORT, CHAT_SEITENGROESSE,
+)
+from messung import span, erfasse_dauer, prometheus_text, starte_metrik_server
 
 # --- KONFIGURATION & DATEN LADEN ---
 st.set_page_config(page_title="JuraKI-Mentor", page_icon="⚖️", layout="wide")
 # load_dotenv() # Auskommentiert für Deployment
-wissensdatenbank = lade_faelle("zivilrecht-faelle-json.json")
-embedding_modell = lade_embedding_modell()
-fall_embeddings = erstelle_fall_embeddings(wissensdatenbank, embedding_modell)
+with start_profil.stufe("lade_lern_speicher"):
+    lern_speicher = lade_lern_speicher()
 
 
 # --- UI/UX VERBESSERUNGEN ---
@@ -73,6 +87,17 @@ def apply_custom_styling():
     """, unsafe_allow_html=True)
 
 # --- SESSION STATE INITIALISIERUNG ---
+if "user_id" not in st.session_state:
+    # Die Nutzer-ID steht in der URL, damit ein Reload oder Redeploy denselben Fortschritt lädt.
+    # Sie ist KEINE Authentifizierung: Wer die URL kennt, kann Lernhistorie und Profil dieses
+    # Nutzers lesen und ändern. Für einen öffentlichen Betrieb gehört die App hinter eine
+    # Anmeldung, deren Nutzerkennung dann hier statt "uid" verwendet wird.
+    user_id = st.query_params.get("uid") or uuid.uuid4().hex
+    st.query_params["uid"] = user_id
+    st.session_state.user_id = user_id
+    st.session_state.user_profile = lern_speicher.lade_profil(user_id)
+    st.session_state.lernhistorie = Lernhistorie.aus_ergebnissen(lern_speicher.lade_historie(user_id))
+    st.session_state.unlocked_achievements = lern_speicher.lade_erfolge(user_id)
 if "app_mode" not in st.session_state:
     st.session_state.app_mode = "Klausur-Training"
 if "user_profile" not in st.session_state:
@@ -87,12 +112,21 @@ if "timer_is_active" not in st.session_state:
     st.session_state.timer_is_active = False
 if "remaining_seconds" not in st.session_state:
     st.session_state.remaining_seconds = 0
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+if "timer_deadline" not in st.session_state:
+    st.session_state.timer_deadline = None
+if "gespraech" not in st.session_state:
+    # Fenster der letzten Runden + Zusammenfassung; ältere Nachrichten nur noch seitenweise
+    st.session_state.gespraech = neuer_gespraechsverlauf()
 if "lernhistorie" not in st.session_state:
-    st.session_state.lernhistorie = []
+    st.session_state.lernhistorie = Lernhistorie()
 if "unlocked_achievements" not in st.session_state:
     st.session_state.unlocked_achievements = []
+if "lern_aggregate" not in st.session_state:
+    # Einmaliger Durchlauf beim Session-Start, danach nur noch O(1)-Updates pro Ergebnis
+    st.session_state.lern_aggregate = LernAggregate.aus_historie(st.session_state.lernhistorie)
+if "lern_statistik" not in st.session_state:
+    # Dashboard-Kennzahlen ebenso: einmal aufbauen, dann pro Ergebnis fortschreiben
+    st.session_state.lern_statistik = LernStatistik.aus_historie(st.session_state.lernhistorie)
 
 # --- UI FUNKTIONEN ---
 
@@ -119,22 +153,58 @@ def show_onboarding_screen():
             if "Schuldrecht BT" in fokus: tags.append("fokus_schuldrecht_bt")
             if "Sachenrecht" in fokus: tags.append("fokus_sachenrecht")
             st.session_state.user_profile = {"situation": situation, "bundesland": bundesland, "fokus": fokus, "start_schwierigkeit": start_schwierigkeit, "tags": tags}
+            lern_speicher.speichere_profil(st.session_state.user_id, st.session_state.user_profile)
             st.success("Dein Profil wurde gespeichert!")
             st.rerun()
 
+def verbleibende_sekunden():
+    """Restzeit der Klausur, bei laufendem Timer aus der serverseitigen Deadline abgeleitet."""
+    if st.session_state.timer_is_active and st.session_state.timer_deadline is not None:
+        return max(0.0, st.session_state.timer_deadline - time.time())
+    return st.session_state.remaining_seconds
+
+def render_countdown(sekunden, laeuft):
+    """
+    Zeigt die Restzeit an. Bei laufendem Timer zählt der Browser selbst herunter,
+    der Server wird dafür nicht erneut ausgeführt.
+    """
+    secs = int(sekunden)
+    timer_display = f"{secs // 3600:02d}:{(secs % 3600) // 60:02d}:{secs % 60:02d}"
+    components.html(f"""
+        <div style="font-family: 'Inter', sans-serif; color: #212529;">
+            <div style="font-size: 0.875rem;">Verbleibende Zeit</div>
+            <div id="countdown" style="font-size: 2.25rem; line-height: 1.3;">{timer_display}</div>
+        </div>
+        <script>
+            const laeuft = {'true' if laeuft else 'false'};
+            // Relativ zur Browser-Uhr rechnen, damit Zeitabweichungen zum Server keine Rolle spielen
+            const ende = Date.now() + {int(sekunden * 1000)};
+            const anzeige = document.getElementById("countdown");
+            const zweistellig = (n) => String(n).padStart(2, "0");
+            function tick() {{
+                const rest = Math.max(0, Math.round((ende - Date.now()) / 1000));
+                anzeige.textContent = zweistellig(Math.floor(rest / 3600)) + ":" + zweistellig(Math.floor(rest % 3600 / 60)) + ":" + zweistellig(rest % 60);
+                if (rest > 0) {{
+                    setTimeout(tick, 1000 - (Date.now() % 1000));
+                }} else {{
+                    anzeige.textContent += " ⏰";
+                }}
+            }}
+            if (laeuft) tick();
+        </script>
+    """, height=80)
+
 def render_klausur_training():
     if not st.session_state.current_fall:
         st.info("👈 Wähle in der Seitenleiste eine Schwierigkeit und klicke auf 'Neuen Fall generieren', um zu beginnen.")
         return
 
     fall = st.session_state.current_fall
-    if st.session_state.timer_is_active:
-        st_autorefresh(interval=1000, limit=None, key="timer_countdown")
-        st.session_state.remaining_seconds -= 1
-        if st.session_state.remaining_seconds < 0:
-            st.session_state.timer_is_active = False
-            st.session_state.remaining_seconds = 0
-            st.warning("Die Zeit ist abgelaufen!")
+    if st.session_state.timer_is_active and verbleibende_sekunden() <= 0:
+        st.session_state.timer_is_active = False
+        st.session_state.timer_deadline = None
+        st.session_state.remaining_seconds = 0
+        st.warning("Die Zeit ist abgelaufen!")
 
     st.header(f"Thema: {fall.get('thema', 'Unbekannt')}")
     
@@ -142,25 +212,31 @@ def render_klausur_training():
     col1.metric("Rechtsgebiet", fall.get('rechtsgebiet', 'N/A'))
     col2.metric("Schwierigkeit", f"{'⭐' * fall.get('schwierigkeit', 0)}", f"{fall.get('schwierigkeit', 0)}/5")
     col3.metric("Gesamtzeit", f"{fall.get('bearbeitungszeit', 0)} Min.")
-    secs = int(st.session_state.remaining_seconds)
-    timer_display = f"{secs // 3600:02d}:{(secs % 3600) // 60:02d}:{secs % 60:02d}"
-    col4.metric("Verbleibende Zeit", timer_display)
+    with col4:
+        render_countdown(verbleibende_sekunden(), st.session_state.timer_is_active)
     st.divider()
 
     timer_cols = st.columns(3)
     if timer_cols[0].button("Start", use_container_width=True, disabled=st.session_state.timer_is_active):
+        st.session_state.timer_deadline = time.time() + st.session_state.remaining_seconds
         st.session_state.timer_is_active = True
         st.rerun()
     if timer_cols[1].button("Pause", use_container_width=True, disabled=not st.session_state.timer_is_active):
+        st.session_state.remaining_seconds = verbleibende_sekunden()
         st.session_state.timer_is_active = False
+        st.session_state.timer_deadline = None
         st.rerun()
     if timer_cols[2].button("Reset", use_container_width=True):
         st.session_state.remaining_seconds = fall.get("bearbeitungszeit", 180) * 60
         st.session_state.timer_is_active = False
+        st.session_state.timer_deadline = None
         st.rerun()
     st.divider()
 
     col_fall, col_loesung = st.columns(2)
+    # Bereich unter den Spalten, in den das Feedback während der Bewertung gestreamt wird
+    feedback_bereich = st.container()
+    feedback_gestreamt = False
     with col_fall:
         with st.container():
             st.subheader("📋 Aktueller Sachverhalt")
@@ -178,61 +254,115 @@ def render_klausur_training():
                 if len(st.session_state.loesung_input) < 50:
                     st.warning("Bitte gib eine ausführlichere Lösung ein.")
                 else:
-                    with st.spinner("KI analysiert deine Lösung..."):
-                        feedback_daten = bewerte_loesung_gemini(fall['sachverhalt'], fall['lösungsskizze'], st.session_state.loesung_input)
-                        st.session_state.feedback = feedback_daten
+                    feedback_daten = {}
+                    with feedback_bereich:
+                        st.divider()
+                        st.subheader("📝 Dein Feedback")
+                        feedback_platzhalter = st.empty()
+                        with feedback_platzhalter.container():
+                            render_feedback(feedback_daten, laufend=True)
+                        try:
+                            for neue_felder in bewerte_loesung_gemini_stream(fall['sachverhalt'], fall['lösungsskizze'], st.session_state.loesung_input):
+                                feedback_daten.update(neue_felder)
+                                with feedback_platzhalter.container():
+                                    render_feedback(feedback_daten, laufend=True)
+                        except Exception as e:
+                            # Wie ohne Streaming: kein Teil-Feedback speichern, nur die Fehlermeldung zeigen
+                            print(f"Fehler bei der Bewertung: {e}")
+                            feedback_daten = {}
+                        feedback_gestreamt = True
                         if feedback_daten:
-                            neues_ergebnis = {"thema": fall.get('thema', 'Unbekannt'), "schwierigkeit": fall.get('schwierigkeit', 0), "bewertung": feedback_daten.get('übereinstimmung_lösungsskizze', 0), "datum": datetime.now()}
-                            st.session_state.lernhistorie.append(neues_ergebnis)
-                            st.toast("Dein Fortschritt wurde gespeichert!", icon="✅")
-                            new_achievements = check_achievements(st.session_state.lernhistorie, st.session_state.unlocked_achievements)
-                            if new_achievements:
-                                st.balloons()
-                                for ach in new_achievements:
-                                    st.session_state.unlocked_achievements.append(ach)
-                                    st.success(f"Erfolg freigeschaltet: {ach['icon']} {ach['name']}!")
+                            with feedback_platzhalter.container():
+                                render_feedback(feedback_daten)
                         else:
-                            st.error("Bewertung fehlgeschlagen.")
-    
-    if st.session_state.feedback:
-        st.divider()
-        st.subheader("📝 Dein Feedback")
-        render_feedback(st.session_state.feedback)
+                            feedback_platzhalter.empty()
+                    st.session_state.feedback = feedback_daten or None
+                    if ist_vollstaendige_bewertung(feedback_daten):
+                        neues_ergebnis = {"thema": fall.get('thema', 'Unbekannt'), "rechtsgebiet": fall.get('rechtsgebiet', 'Unbekannt'), "schwierigkeit": fall.get('schwierigkeit', 0), "bewertung": feedback_daten.get('übereinstimmung_lösungsskizze', 0), "datum": datetime.now()}
+                        st.session_state.lernhistorie.append(neues_ergebnis)
+                        st.session_state.lern_statistik.aktualisiere(neues_ergebnis)
+                        # Write-Behind: kehrt sofort zurück, geschrieben wird im Hintergrund
+                        lern_speicher.speichere_ergebnisse(st.session_state.user_id, [neues_ergebnis])
+                        st.toast("Dein Fortschritt wurde gespeichert!", icon="✅")
+                        new_achievements = verarbeite_ergebnis(st.session_state.lern_aggregate, neues_ergebnis, st.session_state.unlocked_achievements)
+                        if new_achievements:
+                            st.balloons()
+                            for ach in new_achievements:
+                                st.session_state.unlocked_achievements.append(ach)
+                                st.success(f"Erfolg freigeschaltet: {ach['icon']} {ach['name']}!")
+                            lern_speicher.speichere_erfolge(st.session_state.user_id, new_achievements)
+                    elif feedback_daten:
+                        # Teilbewertung (einzelne Aufrufe fehlgeschlagen): anzeigen, aber nicht in die Lernhistorie
+                        st.warning("Die Bewertung ist unvollständig und wurde nicht gespeichert. Versuche es bitte erneut.")
+                    else:
+                        st.error("Bewertung fehlgeschlagen.")
 
-def render_feedback(feedback_data):
-    st.success(f"**Gesamt-Fazit:** {feedback_data.get('fazit', 'N/A')}")
-    st.info(f"**Verbesserungsvorschlag:** {feedback_data.get('verbesserungsvorschlag', 'N/A')}")
+    if st.session_state.feedback and not feedback_gestreamt:
+        with feedback_bereich:
+            st.divider()
+            st.subheader("📝 Dein Feedback")
+            render_feedback(st.session_state.feedback)
+
+def render_feedback(feedback_data, laufend=False):
+    # Während des Streamings stehen noch nicht alle Felder fest
+    fehlt = "⏳ *wird bewertet...*" if laufend else 'N/A'
+    st.success(f"**Gesamt-Fazit:** {feedback_data.get('fazit', fehlt)}")
+    st.info(f"**Verbesserungsvorschlag:** {feedback_data.get('verbesserungsvorschlag', fehlt)}")
     st.divider()
     st.markdown('<div class="feedback-category">', unsafe_allow_html=True)
     st.markdown("<h5>Struktur & Schwerpunktsetzung</h5>", unsafe_allow_html=True)
-    st.metric("Übereinstimmung mit Lösungsskizze", f"{feedback_data.get('übereinstimmung_lösungsskizze', 0)}%")
-    st.markdown(feedback_data.get('feedback_struktur', 'N/A'))
+    uebereinstimmung = feedback_data.get('übereinstimmung_lösungsskizze')
+    lokal = feedback_data.get('übereinstimmung_lokal')
+    if uebereinstimmung is None and lokal is not None and laufend:
+        # Die lokale Gliederungsanalyse liegt vor der KI-Bewertung vor
+        st.metric("Übereinstimmung mit Lösungsskizze (vorläufig)", f"{lokal}%")
+    else:
+        st.metric("Übereinstimmung mit Lösungsskizze", f"{uebereinstimmung}%" if uebereinstimmung is not None else ("..." if laufend else "0%"))
+        if lokal is not None:
+            st.caption(f"Automatischer Gliederungsabgleich: {lokal}%")
+    st.markdown(feedback_data.get('feedback_struktur', fehlt))
     st.markdown('</div>', unsafe_allow_html=True)
     st.markdown('<div class="feedback-category">', unsafe_allow_html=True)
     st.markdown("<h5>Gutachtenstil</h5>", unsafe_allow_html=True)
-    st.markdown(feedback_data.get('feedback_gutachtenstil', 'N/A'))
+    st.markdown(feedback_data.get('feedback_gutachtenstil', fehlt))
     st.markdown('</div>', unsafe_allow_html=True)
     st.markdown('<div class="feedback-category">', unsafe_allow_html=True)
     st.markdown("<h5>Materielles Recht</h5>", unsafe_allow_html=True)
-    st.markdown(feedback_data.get('feedback_materielles_recht', 'N/A'))
+    st.markdown(feedback_data.get('feedback_materielles_recht', fehlt))
     st.markdown('</div>', unsafe_allow_html=True)
 
 def render_chatbot():
     st.header("💬 Jura-Chatbot für das BGB AT")
     st.info("Stelle eine Frage zu einem Problem aus dem BGB AT.")
+    # Erst hier werden Embedding-Modell und Index gebraucht (meist schon vorgewärmt)
+    with st.spinner("Wissensdatenbank wird geladen..."):
+        wissensdatenbank, embedding_dienst, fall_index = lade_retrieval_ressourcen(FALLDATENBANK)
     if wissensdatenbank is None: return st.error("Wissensdatenbank nicht gefunden.")
     
-    for message in st.session_state.messages:
+    gespraech = st.session_state.gespraech
+    # Ältere Nachrichten nur auf Wunsch und seitenweise, damit jeder Rerun gleich viel rendert
+    if gespraech.archiv:
+        if st.toggle(f"Ältere Nachrichten anzeigen ({len(gespraech.archiv)})", key="chat_archiv_anzeigen"):
+            seiten = max(1, -(-len(gespraech.archiv) // CHAT_SEITENGROESSE))
+            seite = st.number_input(f"Seite (1 = jüngste, {seiten} = älteste)", min_value=1, max_value=seiten,
+                                    value=1, step=1, key="chat_archiv_seite")
+            for message in gespraech.archiv_seite(seite, CHAT_SEITENGROESSE):
+                with st.chat_message(message["role"]): st.markdown(message["content"])
+            st.divider()
+        if gespraech.zusammenfassung:
+            st.caption(f"Bisher besprochen: {gespraech.zusammenfassung}")
+    for message in gespraech.fenster:
         with st.chat_message(message["role"]): st.markdown(message["content"])
     if prompt := st.chat_input("Was ist das Abstraktionsprinzip?"):
-        st.session_state.messages.append({"role": "user", "content": prompt})
         with st.chat_message("user"): st.markdown(prompt)
         with st.chat_message("assistant"):
             with st.spinner("Moment..."):
-                antwort, kontext = get_chatbot_response(prompt, wissensdatenbank, embedding_modell, fall_embeddings)
-                st.markdown(antwort)
-                if kontext: st.info(f"Kontext aus Fall: *{kontext}*")
-        st.session_state.messages.append({"role": "assistant", "content": antwort})
+                antwort_stream, kontext = get_chatbot_response_stream(prompt, wissensdatenbank, embedding_dienst, fall_index,
+                                                                      verlauf=gespraech)
+            antwort = st.write_stream(antwort_stream)
+            if kontext: st.info(f"Kontext aus Fall: *{kontext}*")
+        gespraech.fuege_hinzu("user", prompt)
+        gespraech.fuege_hinzu("assistant", antwort)
 
 def render_dashboard():
     st.header("📈 Dein Lernfortschritt")
@@ -240,16 +370,31 @@ def render_dashboard():
         st.info("Dein Fortschritt wird hier angezeigt, sobald du eine Bewertung abgeschlossen hast.")
         return
 
-    df = pd.DataFrame(st.session_state.lernhistorie)
+    import pandas as pd
+    # Alle Kennzahlen kommen aus den laufenden Aggregaten, nicht aus der ganzen Historie
+    statistik = st.session_state.lern_statistik
     st.subheader("Auf einen Blick")
     col1, col2, col3 = st.columns(3)
-    col1.metric("Anzahl gelöster Fälle", len(df))
-    col2.metric("Durchschnittliche Bewertung", f"{df['bewertung'].mean():.1f}%")
-    col3.metric("Beste Bewertung", f"{df['bewertung'].max()}%")
+    col1.metric("Anzahl gelöster Fälle", statistik.anzahl)
+    col2.metric("Durchschnittliche Bewertung", f"{statistik.durchschnitt:.1f}%")
+    col3.metric("Beste Bewertung", f"{statistik.max_bewertung}%")
     st.divider()
 
     st.subheader("Deine Entwicklung über die Zeit")
-    st.line_chart(df.set_index('datum')['bewertung'])
+    aufloesung = st.radio("Auflösung", ("Tag", "Woche"), horizontal=True, key="dashboard_aufloesung")
+    periode = "tag" if aufloesung == "Tag" else "woche"
+    buckets, durchschnitte = statistik.verlauf(periode)
+    st.line_chart(pd.DataFrame({"Durchschnitt (%)": durchschnitte}, index=pd.to_datetime(buckets)))
+
+    # Nur vorkommende Stufen, auch 0 (Übungsfall)
+    stufen = ["Alle", *sorted({stufe for _, stufe, _, _ in statistik.uebersicht()})]
+    stufe = st.selectbox("Schwierigkeit", stufen, key="dashboard_schwierigkeit")
+    nach_gebiet = statistik.verlauf_nach_rechtsgebiet(periode, None if stufe == "Alle" else stufe)
+    if nach_gebiet:
+        st.caption(f"Durchschnitt pro Rechtsgebiet und {aufloesung}")
+        df_gebiete = pd.DataFrame({rg: pd.Series(werte) for rg, werte in nach_gebiet.items()}).sort_index()
+        df_gebiete.index = pd.to_datetime(df_gebiete.index)
+        st.line_chart(df_gebiete)
     st.divider()
 
     st.subheader("🏆 Deine Erfolge")
@@ -269,15 +414,26 @@ def render_dashboard():
     st.divider()
 
     st.subheader("Letzte bearbeitete Fälle")
-    df_display = df.rename(columns={'datum': 'Datum', 'thema': 'Thema', 'schwierigkeit': 'Schwierigkeit', 'bewertung': 'Bewertung (%)'})
-    df_display['Datum'] = df_display['Datum'].dt.strftime('%d.%m.%Y, %H:%M Uhr')
-    st.dataframe(df_display.sort_values(by="Datum", ascending=False), use_container_width=True)
+    historie = st.session_state.lernhistorie
+    seiten = max(1, -(-len(historie) // DASHBOARD_SEITENGROESSE))
+    seite = st.number_input(f"Seite (von {seiten})", min_value=1, max_value=seiten, value=1, step=1, key="dashboard_seite")
+    # Nur die angezeigte Seite wird formatiert; sortiert wird nach dem Datum selbst, nicht nach dem Text
+    zeilen = historie.seite_neueste_zuerst((seite - 1) * DASHBOARD_SEITENGROESSE, DASHBOARD_SEITENGROESSE)
+    df_display = pd.DataFrame([{
+        'Datum': e['datum'].strftime('%d.%m.%Y, %H:%M Uhr'),
+        'Rechtsgebiet': e['rechtsgebiet'] or "Unbekannt",
+        'Thema': e['thema'],
+        'Schwierigkeit': e['schwierigkeit'],
+        'Bewertung (%)': e['bewertung'],
+    } for e in zeilen])
+    st.dataframe(df_display, use_container_width=True, hide_index=True)
 
 def show_main_app():
     apply_custom_styling()
     
     with st.sidebar:
         st.title("⚖️ JuraKI-Mentor")
+        st.caption("Dein Fortschritt hängt an diesem Link. Teile ihn nicht – wer ihn kennt, kann ihn sehen und ändern.")
         st.session_state.app_mode = st.radio(
             "Wähle einen Modus:",
             ("Klausur-Training", "Jura-Chatbot (BGB AT)", "Mein Fortschritt"),
@@ -289,15 +445,28 @@ def show_main_app():
             st.header("Steuerung")
             default_difficulty = st.session_state.user_profile.get("start_schwierigkeit", 3)
             gewaehlte_schwierigkeit = st.slider("Schwierigkeit auswählen", 0, 5, default_difficulty, help="0=Übungsfall, 1-2=Anfänger, 3-4=Fortgeschritten, 5=Examen")
+            user_tags = st.session_state.user_profile.get("tags", [])
+            fall_pool = lade_fall_pool()
+            # Vorproduktion nur für die Stufe aus dem Profil; andere Stufen füllt hole_fall beim Klick nach,
+            # damit das Ziehen am Slider keine bezahlten Generierungen für jede überstrichene Stufe startet
+            fall_pool.registriere(default_difficulty, user_tags)
+            st.caption(f"Vorrat: {fall_pool.fuellstand(gewaehlte_schwierigkeit, user_tags)} Fälle sofort verfügbar")
 
             if st.button("Neuen Fall generieren", type="primary", use_container_width=True):
                 with st.spinner("KI entwirft einen neuen Fall..."):
-                    user_tags = st.session_state.user_profile.get("tags", [])
-                    fall_daten = generiere_fall_gemini(schwierigkeit=gewaehlte_schwierigkeit, tags=user_tags)
+                    fall_daten = fall_pool.hole_fall(gewaehlte_schwierigkeit, user_tags)
+                    if fall_daten is None:
+                        # Vorrat leer: synchron generieren wie bisher
+                        try:
+                            fall_daten = generiere_fall_gemini(schwierigkeit=gewaehlte_schwierigkeit, tags=user_tags)
+                        except Exception as e:
+                            print(f"Fehler bei der Fallgenerierung: {e}")
+                            fall_daten = None
                     if fall_daten:
                         st.session_state.current_fall = fall_daten
                         st.session_state.remaining_seconds = fall_daten.get("bearbeitungszeit", 180) * 60
                         st.session_state.timer_is_active = False
+                        st.session_state.timer_deadline = None
                         st.session_state.feedback = None
                         st.rerun()
                     else:
@@ -315,8 +484,25 @@ def show_main_app():
         render_dashboard()
 
 # --- HAUPTROUTINE ---
-if st.session_state.user_profile is None:
-    apply_custom_styling()
-    show_onboarding_screen()
-else:
-    show_main_app()
+with start_profil.stufe("seitenaufbau"), span("skriptlauf", modus=st.session_state.app_mode):
+    if st.session_state.user_profile is None:
+        apply_custom_styling()
+        show_onboarding_screen()
+    else:
+        show_main_app()
+erfasse_dauer("skriptlauf_gesamt", time.perf_counter() - _lauf_start)
+
+# Nach dem ersten Seitenaufbau: Embeddings im Hintergrund laden
+if VORWAERMEN:
+    starte_vorwaermen(FALLDATENBANK)
+
+# Prometheus-Scrape unter http://<host>:<port>/metrics (einmal pro Prozess)
+if MESSUNG_METRIK_PORT:
+    starte_metrik_server(MESSUNG_METRIK_PORT)
+
+if STARTPROFIL:
+    start_profil.profil.erfasse("skriptlauf_gesamt", time.perf_counter() - _lauf_start)
+    with st.sidebar.expander("⏱️ Startprofil"):
+        st.code(start_profil.profil.bericht())
+    with st.sidebar.expander("📈 Messwerte"):
+        st.code(prometheus_text())
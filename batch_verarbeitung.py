@@ -0,0 +1,277 @@
+# batch_verarbeitung.py
+"""
+Stapelverarbeitung ohne Streamlit-Oberfläche: Lösungen eines ganzen Kurses bewerten oder
+viele Fälle vorab generieren.
+
+Aufruf:
+    python batch_verarbeitung.py bewerten abgaben.jsonl bewertungen.jsonl
+    python batch_verarbeitung.py faelle auftraege.jsonl faelle.jsonl --parallel 4 --rate 2
+    python batch_verarbeitung.py bewerten abgaben.jsonl bewertungen.jsonl --parquet bewertungen_parquet
+
+Eingabe (eine JSON-Zeile pro Auftrag, wird zeilenweise gelesen):
+    bewerten  {"id": "...", "sachverhalt": "...", "lösungsskizze": [...], "loesungstext": "..."}
+              (Sachverhalt und Skizze dürfen auch unter "fall" stehen, z.B. aus `faelle`)
+    faelle    {"id": "...", "schwierigkeit": 3, "tags": ["Anfechtung"]}
+Fehlt "id", gilt die Zeilennummer.
+
+- Aufträge laufen in einem Pool mit höchstens --parallel gleichzeitigen Aufträgen; es werden
+  nur so viele Zeilen gelesen, wie gerade bearbeitet werden können.
+- Alle Gemini-Aufrufe laufen über das LLM-Gateway; --rate und --max-parallel-aufrufe setzen
+  dessen Rate-Limit bzw. Parallelitätslimit (JURAKI_GATEWAY_RATE_PRO_S/_MAX_PARALLEL).
+- Jedes Ergebnis wird sofort an die Ausgabe-JSONL angehängt. Sie ist zugleich der Checkpoint:
+  ein erneuter Aufruf mit derselben Ausgabe überspringt alle dort stehenden IDs, bezahlte
+  Aufrufe werden also nicht wiederholt. Fehlgeschlagene Aufträge stehen in <ausgabe>.fehler.jsonl
+  und werden beim nächsten Lauf erneut versucht.
+- Mit --parquet entsteht zusätzlich ein Parquet-Datensatz (ein Verzeichnis mit einer Datei pro
+  --parquet-block Ergebnisse), lesbar mit pandas.read_parquet(verzeichnis). Benötigt pyarrow.
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+AUFGABEN = ("bewerten", "faelle")
+
+
+# --- EIN- UND AUSGABE ---
+
+def lese_auftraege(pfad):
+    """(ID, Auftrag) pro Zeile, ohne die Datei vollständig zu laden; leere Zeilen werden übersprungen."""
+    with open(pfad, encoding="utf-8") as f:
+        for nummer, zeile in enumerate(f, start=1):
+            if not zeile.strip():
+                continue
+            try:
+                auftrag = json.loads(zeile)
+            except json.JSONDecodeError as e:
+                yield str(nummer), e
+                continue
+            yield str(auftrag.get("id", nummer)), auftrag
+
+
+def erledigte_ids(pfad):
+    """
+    IDs aus einer früheren (evtl. abgebrochenen) Ausgabe. Eine unvollständige letzte Zeile
+    wird abgeschnitten, damit neue Ergebnisse wieder an einer Zeilengrenze beginnen.
+    """
+    if not os.path.exists(pfad):
+        return set()
+    ids = set()
+    gueltig_bis = 0
+    with open(pfad, "rb") as f:
+        for zeile in f:
+            try:
+                ids.add(str(json.loads(zeile)["id"]))
+            except (ValueError, KeyError):
+                break
+            gueltig_bis += len(zeile)
+    if gueltig_bis < os.path.getsize(pfad):
+        print(f"Unvollständige Zeile am Ende von {pfad} entfernt.")
+        with open(pfad, "r+b") as f:
+            f.truncate(gueltig_bis)
+    return ids
+
+
+class JsonlSchreiber:
+    """Hängt Zeilen an und bringt sie sofort auf die Platte (Checkpoint nach jedem Ergebnis)."""
+
+    def __init__(self, pfad):
+        self._datei = open(pfad, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def schreibe(self, datensatz):
+        zeile = json.dumps(datensatz, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._datei.write(zeile)
+            self._datei.flush()
+            os.fsync(self._datei.fileno())
+
+    def schliesse(self):
+        self._datei.close()
+
+
+class ParquetSchreiber:
+    """Schreibt Ergebnisse blockweise als eigene Dateien in ein Parquet-Verzeichnis."""
+
+    def __init__(self, verzeichnis, blockgroesse):
+        import pyarrow  # noqa: F401 – früh scheitern, nicht erst nach dem ersten Block
+        self.verzeichnis = verzeichnis
+        self.blockgroesse = blockgroesse
+        os.makedirs(verzeichnis, exist_ok=True)
+        self._puffer = []
+        self._lock = threading.Lock()
+        self._laufnummer = time.strftime("%Y%m%d-%H%M%S")
+        self._teil = 0
+
+    @staticmethod
+    def _flach(datensatz):
+        # Verschachtelte Felder (Lösungsskizze, Tags) als JSON-Text, damit alle Blöcke dasselbe Schema haben
+        return {k: v if isinstance(v, (str, int, float, bool)) or v is None else json.dumps(v, ensure_ascii=False)
+                for k, v in datensatz.items()}
+
+    def schreibe(self, datensatz):
+        with self._lock:
+            self._puffer.append(self._flach(datensatz))
+            if len(self._puffer) >= self.blockgroesse:
+                self._schreibe_block()
+
+    def _schreibe_block(self):
+        if not self._puffer:
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._teil += 1
+        pfad = os.path.join(self.verzeichnis, f"teil-{self._laufnummer}-{self._teil:05d}.parquet")
+        pq.write_table(pa.Table.from_pylist(self._puffer), pfad + ".tmp")
+        os.replace(pfad + ".tmp", pfad)
+        self._puffer = []
+
+    def schliesse(self):
+        with self._lock:
+            self._schreibe_block()
+
+
+# --- AUFTRÄGE ---
+
+def _feld(auftrag, *namen):
+    for quelle in (auftrag, auftrag.get("fall") or {}):
+        for name in namen:
+            if name in quelle:
+                return quelle[name]
+    raise ValueError(f"Feld fehlt: {namen[0]}")
+
+
+def bewerte(auftrag):
+    from klausur_logik import bewerte_loesung_gemini
+    bewertung = bewerte_loesung_gemini(
+        _feld(auftrag, "sachverhalt"),
+        _feld(auftrag, "lösungsskizze", "loesungsskizze"),
+        _feld(auftrag, "loesungstext", "lösungstext"),
+    )
+    if not bewertung:
+        raise ValueError("Keine gültige Bewertung erhalten")
+    return bewertung
+
+
+def generiere_fall(auftrag):
+    from klausur_logik import generiere_fall_gemini
+    from llm_gateway import PRIORITAET_HINTERGRUND
+    fall = generiere_fall_gemini(int(auftrag.get("schwierigkeit", 2)), auftrag.get("tags") or [],
+                                 prioritaet=PRIORITAET_HINTERGRUND)
+    if not fall:
+        raise ValueError("Kein gültiger Fall erhalten")
+    return fall
+
+
+# --- ABLAUF ---
+
+def verarbeite(auftraege, funktion, schreiber, fehler_schreiber, erledigt, parallel, stopp):
+    """Arbeitet die Aufträge mit höchstens `parallel` gleichzeitigen ab; gibt (ok, fehler, übersprungen) zurück."""
+    ok = fehler = uebersprungen = 0
+    start = time.perf_counter()
+    laufend = {}
+
+    def abschliessen(zukunft):
+        nonlocal ok, fehler
+        auftrag_id = laufend.pop(zukunft)
+        try:
+            ergebnis = zukunft.result()
+        except Exception as e:
+            fehler += 1
+            fehler_schreiber.schreibe({"id": auftrag_id, "fehler": f"{type(e).__name__}: {e}", "zeit": time.time()})
+            return
+        ok += 1
+        for ziel in schreiber:
+            ziel.schreibe({"id": auftrag_id, **ergebnis})
+        if ok % 10 == 0:
+            dauer = time.perf_counter() - start
+            print(f"{ok} fertig, {fehler} Fehler, {ok / dauer:.2f}/s")
+
+    with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="batch") as pool:
+        for auftrag_id, auftrag in auftraege:
+            if stopp.is_set():
+                break
+            if auftrag_id in erledigt:
+                uebersprungen += 1
+                continue
+            if isinstance(auftrag, Exception):
+                fehler += 1
+                fehler_schreiber.schreibe({"id": auftrag_id, "fehler": f"Ungültige Zeile: {auftrag}", "zeit": time.time()})
+                continue
+            # Nicht mehr Zeilen einlesen, als gerade bearbeitet werden können
+            while len(laufend) >= parallel:
+                fertig, _ = wait(laufend, return_when=FIRST_COMPLETED)
+                for zukunft in fertig:
+                    abschliessen(zukunft)
+            erledigt.add(auftrag_id)  # doppelte IDs in der Eingabe nur einmal
+            laufend[pool.submit(funktion, auftrag)] = auftrag_id
+        while laufend:
+            fertig, _ = wait(laufend, return_when=FIRST_COMPLETED)
+            for zukunft in fertig:
+                abschliessen(zukunft)
+    return ok, fehler, uebersprungen
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("aufgabe", choices=AUFGABEN)
+    parser.add_argument("eingabe", help="JSONL mit einem Auftrag pro Zeile")
+    parser.add_argument("ausgabe", help="JSONL für die Ergebnisse (zugleich Checkpoint)")
+    parser.add_argument("--parallel", type=int, default=4, help="gleichzeitige Aufträge (Standard 4)")
+    parser.add_argument("--rate", type=float, help="Gemini-Aufrufe pro Sekunde (Rate-Limit des Gateways)")
+    parser.add_argument("--max-parallel-aufrufe", type=int, help="gleichzeitige Gemini-Aufrufe im Gateway")
+    parser.add_argument("--parquet", help="Verzeichnis für einen zusätzlichen Parquet-Datensatz")
+    parser.add_argument("--parquet-block", type=int, default=500, help="Ergebnisse pro Parquet-Datei")
+    args = parser.parse_args()
+
+    # Das Gateway liest seine Grenzen beim Import der Einstellungen
+    if args.rate is not None:
+        os.environ["JURAKI_GATEWAY_RATE_PRO_S"] = str(args.rate)
+        os.environ["JURAKI_GATEWAY_BURST"] = str(max(1, int(args.rate)))
+    if args.max_parallel_aufrufe is not None:
+        os.environ["JURAKI_GATEWAY_MAX_PARALLEL"] = str(args.max_parallel_aufrufe)
+    # Ohne laufende App warnt Streamlit bei jedem Cache-Zugriff
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    erledigt = erledigte_ids(args.ausgabe)
+    if erledigt:
+        print(f"{len(erledigt)} Aufträge aus {args.ausgabe} bereits erledigt, werden übersprungen.")
+    schreiber = [JsonlSchreiber(args.ausgabe)]
+    if args.parquet:
+        schreiber.append(ParquetSchreiber(args.parquet, args.parquet_block))
+    fehler_schreiber = JsonlSchreiber(args.ausgabe + ".fehler.jsonl")
+
+    # Strg+C: keine neuen Aufträge mehr, laufende werden noch fertig geschrieben
+    stopp = threading.Event()
+
+    def unterbrechen(signum, frame):
+        if stopp.is_set():
+            raise KeyboardInterrupt
+        print("Abbruch angefordert – laufende Aufträge werden noch abgeschlossen (erneut Strg+C zum Sofort-Abbruch).")
+        stopp.set()
+
+    signal.signal(signal.SIGINT, unterbrechen)
+
+    funktion = bewerte if args.aufgabe == "bewerten" else generiere_fall
+    start = time.perf_counter()
+    try:
+        ok, fehler, uebersprungen = verarbeite(lese_auftraege(args.eingabe), funktion, schreiber,
+                                               fehler_schreiber, erledigt, args.parallel, stopp)
+    finally:
+        for ziel in schreiber:
+            ziel.schliesse()
+        fehler_schreiber.schliesse()
+    print(f"Fertig in {time.perf_counter() - start:.1f} s: {ok} erfolgreich, {fehler} Fehler, "
+          f"{uebersprungen} übersprungen.")
+    if fehler:
+        print(f"Fehler stehen in {args.ausgabe}.fehler.jsonl; ein erneuter Aufruf versucht sie noch einmal.")
+    return 1 if fehler else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+# benchmark_embedding_backend.py
+"""
+Vergleich der Embedding-Backends aus embedding_backend.py auf der Falldatenbank.
+
+Aufruf:
+    python benchmark_embedding_backend.py                         # alle Backends, 1 und 4 Threads
+    python benchmark_embedding_backend.py --backends torch onnx-int8 --threads 2
+
+1. Äquivalenz: Für jede Anfrage (Kernfragen und Titel aller Fälle plus typische
+   Studierendenfragen) muss finde_relevantesten_fall mit dem Backend denselben Fall liefern
+   wie das torch-Referenzmodell. Zusätzlich werden die Top-k-Listen und die maximale
+   Abweichung der Kosinus-Ähnlichkeit verglichen. Exit-Code 1 bei Abweichungen.
+2. Benchmark: Jedes Backend läuft in einem eigenen Prozess, damit der Speicherbedarf (RSS)
+   nicht von anderen Modellen verfälscht wird. Gemessen werden Ladezeit, RSS nach dem Laden
+   und nach dem Kodieren, Latenz einer Einzelanfrage (p50/p95) und Durchsatz im Batch.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from einstellungen import EMBEDDING_MODELL_NAME, EMBEDDING_ONNX_INT8_DATEI
+from embedding_backend import BACKENDS, lade_sentence_transformer
+from vektor_suche import baue_index
+
+FALLDATENBANK = "zivilrecht-faelle-json.json"
+
+STUDIERENDENFRAGEN = [
+    "Was ist das Abstraktionsprinzip?",
+    "Wann ist eine Willenserklärung zugegangen?",
+    "Kann ein Minderjähriger ohne Zustimmung der Eltern etwas kaufen?",
+    "Was passiert, wenn ich mich beim Preis verschrieben habe?",
+    "Ist Schweigen eine Annahme?",
+    "Wie funktioniert der gutgläubige Erwerb beweglicher Sachen?",
+    "Haftet der Vertreter ohne Vertretungsmacht?",
+    "Welche Frist gilt für die Anfechtung wegen Täuschung?",
+]
+
+
+def rss_mb():
+    """Aktueller Resident Set Size des Prozesses in MB (Linux), sonst Spitzenwert."""
+    try:
+        with open("/proc/self/status") as f:
+            for zeile in f:
+                if zeile.startswith("VmRSS:"):
+                    return int(zeile.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def lade_korpus():
+    with open(FALLDATENBANK, encoding="utf-8") as f:
+        faelle = json.load(f)
+    anfragen = [fall["kernfrage"] for fall in faelle] + [fall["fall_titel"] for fall in faelle] + STUDIERENDENFRAGEN
+    return faelle, anfragen
+
+
+def lade(backend, threads):
+    return lade_sentence_transformer(EMBEDDING_MODELL_NAME, backend, threads, onnx_datei=EMBEDDING_ONNX_INT8_DATEI)
+
+
+# --- ÄQUIVALENZ ---
+
+def top_k_listen(modell, faelle, anfragen, top_k):
+    from datenbank import finde_relevante_faelle, finde_relevantesten_fall
+    fall_vektoren = modell.encode([fall.get("zentrales_problem", "") for fall in faelle], convert_to_numpy=True)
+    # Direkt gebauter Index: erstelle_fall_index ist gecacht und ignoriert das Modell-Argument
+    index = baue_index(np.asarray(fall_vektoren, dtype=np.float32), backend="bruteforce")
+    ergebnisse = []
+    for anfrage in anfragen:
+        bester = finde_relevantesten_fall(anfrage, faelle, modell, index)
+        treffer = finde_relevante_faelle(anfrage, faelle, modell, index, top_k=top_k, min_score=-1.0)
+        ergebnisse.append((
+            bester["fall_titel"] if bester else None,
+            [fall["fall_titel"] for fall, _ in treffer],
+            np.array([score for _, score in treffer]),
+        ))
+    return ergebnisse
+
+
+def pruefe_aequivalenz(backends, threads, top_k):
+    faelle, anfragen = lade_korpus()
+    referenz = top_k_listen(lade("torch", threads), faelle, anfragen, top_k)
+    alles_gleich = True
+    print(f"Äquivalenz gegenüber torch ({len(anfragen)} Anfragen, {len(faelle)} Fälle):")
+    for backend in backends:
+        if backend == "torch":
+            continue
+        kandidat = top_k_listen(lade(backend, threads), faelle, anfragen, top_k)
+        bester_gleich = sum(r[0] == k[0] for r, k in zip(referenz, kandidat))
+        liste_gleich = sum(r[1] == k[1] for r, k in zip(referenz, kandidat))
+        max_abweichung = max(float(np.max(np.abs(r[2] - k[2]))) if r[1] == k[1] else float("nan")
+                             for r, k in zip(referenz, kandidat))
+        print(f"  {backend:>10}: relevantester Fall gleich {bester_gleich}/{len(anfragen)}, "
+              f"Top-{top_k} gleich {liste_gleich}/{len(anfragen)}, max. Score-Abweichung {max_abweichung:.4f}")
+        for anfrage, r, k in zip(anfragen, referenz, kandidat):
+            if r[0] != k[0]:
+                print(f"      abweichend: {anfrage!r}: {r[0]!r} -> {k[0]!r}")
+        alles_gleich &= bester_gleich == len(anfragen)
+    return alles_gleich
+
+
+# --- BENCHMARK ---
+
+def miss_einzeln(backend, threads, wiederholungen):
+    """Läuft im Kindprozess und gibt die Messwerte als JSON aus."""
+    _, anfragen = lade_korpus()
+    rss_start = rss_mb()
+    start = time.perf_counter()
+    modell = lade(backend, threads)
+    ladezeit = time.perf_counter() - start
+    rss_geladen = rss_mb()
+
+    modell.encode(anfragen[:4], convert_to_numpy=True)  # Aufwärmen
+    latenzen = []
+    for i in range(wiederholungen):
+        start = time.perf_counter()
+        modell.encode(anfragen[i % len(anfragen)], convert_to_numpy=True)
+        latenzen.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    modell.encode(anfragen, convert_to_numpy=True, batch_size=32)
+    batch_s = time.perf_counter() - start
+
+    print(json.dumps({
+        "backend": backend,
+        "threads": threads,
+        "ladezeit_s": ladezeit,
+        "rss_modell_mb": rss_geladen - rss_start,
+        "rss_gesamt_mb": rss_mb(),
+        "einzeln_p50_ms": float(np.percentile(latenzen, 50) * 1000),
+        "einzeln_p95_ms": float(np.percentile(latenzen, 95) * 1000),
+        "batch_texte_pro_s": len(anfragen) / batch_s,
+    }))
+
+
+def benchmark(backends, thread_werte, wiederholungen):
+    print(f"\n{'Backend':>10} {'Thr':>4} {'Laden s':>8} {'RSS MB':>8} {'Modell MB':>10} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'Texte/s':>9}")
+    for backend in backends:
+        for threads in thread_werte:
+            ausgabe = subprocess.run(
+                [sys.executable, __file__, "--einzeln", backend, "--threads", str(threads),
+                 "--wiederholungen", str(wiederholungen)],
+                capture_output=True, text=True,
+            )
+            if ausgabe.returncode != 0:
+                print(f"{backend:>10} {threads:>4}  fehlgeschlagen: {ausgabe.stderr.strip().splitlines()[-1:]}")
+                continue
+            m = json.loads(ausgabe.stdout.strip().splitlines()[-1])
+            print(f"{backend:>10} {threads:>4} {m['ladezeit_s']:8.2f} {m['rss_gesamt_mb']:8.0f} {m['rss_modell_mb']:10.0f} "
+                  f"{m['einzeln_p50_ms']:8.1f} {m['einzeln_p95_ms']:8.1f} {m['batch_texte_pro_s']:9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4], help="0 = Bibliotheksstandard")
+    parser.add_argument("--wiederholungen", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--nur-benchmark", action="store_true")
+    parser.add_argument("--einzeln", choices=BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.einzeln:
+        miss_einzeln(args.einzeln, args.threads[0], args.wiederholungen)
+        return
+
+    gleich = True
+    if not args.nur_benchmark:
+        gleich = pruefe_aequivalenz(args.backends, args.threads[0], args.top_k)
+    benchmark(args.backends, args.threads, args.wiederholungen)
+    sys.exit(0 if gleich else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# benchmark_json_extraktion.py
+"""
+Korpus, Fuzzing und Benchmark für die JSON-Extraktion aus Modell-Ausgaben.
+
+Aufruf:
+    python benchmark_json_extraktion.py                    # Korpus + 2000 Fuzz-Fälle
+    python benchmark_json_extraktion.py --fuzz 10000 --groesse-kb 512
+
+Verglichen werden der frühere Regex-Ansatz (re.search(r'\\{.*\\}') + json.loads) und
+json_extraktion.extrahiere_json: Erfolgsquote auf dem Korpus realer Fehlerbilder, auf
+zufällig beschädigten Ausgaben und die Laufzeit auf einer langen Ausgabe mit vielen
+verstreuten Klammern.
+"""
+import argparse
+import json
+import random
+import re
+import time
+
+from json_extraktion import extrahiere_json, FALL_SCHEMA, BEWERTUNGS_SCHEMA
+
+BEWERTUNG = {
+    "übereinstimmung_lösungsskizze": 70,
+    "feedback_struktur": "Die Prüfung des § 433 II BGB {Anspruch} ist gut gegliedert, die Anfechtung fehlt.",
+    "feedback_gutachtenstil": "Obersatz, Definition, Subsumtion und Ergebnis werden meist eingehalten.",
+    "feedback_materielles_recht": "Der Irrtum nach § 119 I BGB wurde erkannt, aber nicht sauber subsumiert.",
+    "fazit": "Solide Grundlage, an der Tiefe der Argumentation lässt sich arbeiten.",
+    "verbesserungsvorschlag": "Formuliere zu jedem Prüfungspunkt zuerst einen vollständigen Obersatz.",
+}
+
+FALL = {
+    "rechtsgebiet": "Schuldrecht BT",
+    "thema": "Sachmangel beim Gebrauchtwagenkauf",
+    "schwierigkeit": 2,
+    "bearbeitungszeit": 180,
+    "sachverhalt": "K kauft von V einen gebrauchten Pkw. V sagt: \"Unfallfrei!\" Zwei Wochen später ...",
+    "lösungsskizze": ["A. Anspruch K gegen V aus §§ 437 Nr. 2, 323, 326 V BGB", "  I. Kaufvertrag", "  II. Sachmangel"],
+}
+
+
+def _roh(objekt, **kwargs):
+    return json.dumps(objekt, ensure_ascii=False, indent=2, **kwargs)
+
+
+# Fehlerbilder, wie sie in echten Antworten vorkommen: (Name, Text, Schema, erwartetes Objekt)
+KORPUS = [
+    ("sauber", _roh(BEWERTUNG), BEWERTUNGS_SCHEMA, BEWERTUNG),
+    ("codeblock", "```json\n" + _roh(BEWERTUNG) + "\n```", BEWERTUNGS_SCHEMA, BEWERTUNG),
+    ("prosa_davor", "Gerne, hier die Bewertung:\n" + _roh(BEWERTUNG), BEWERTUNGS_SCHEMA, BEWERTUNG),
+    ("klammer_danach", _roh(BEWERTUNG) + "\nHinweis: Formeln wie {a} wurden nicht geprüft :-}", BEWERTUNGS_SCHEMA, BEWERTUNG),
+    ("zwei_objekte", _roh(BEWERTUNG) + "\n\nAlternative: {\"fazit\": \"kurz\"}", BEWERTUNGS_SCHEMA, BEWERTUNG),
+    ("haengendes_komma", _roh(BEWERTUNG)[:-2] + ",\n}", BEWERTUNGS_SCHEMA, BEWERTUNG),
+    ("komma_in_liste", _roh(FALL).replace("II. Sachmangel\"\n  ]", "II. Sachmangel\",\n  ]"), FALL_SCHEMA, FALL),
+    ("typografische_quotes", _roh(BEWERTUNG).replace('"', "“", 1).replace('":', "”:", 1), BEWERTUNGS_SCHEMA, BEWERTUNG),
+    ("zahl_als_text", _roh({**BEWERTUNG, "übereinstimmung_lösungsskizze": "70 %"}), BEWERTUNGS_SCHEMA, BEWERTUNG),
+    ("roher_zeilenumbruch", _roh(BEWERTUNG).replace("meist eingehalten.", "meist\neingehalten."), BEWERTUNGS_SCHEMA,
+     {**BEWERTUNG, "feedback_gutachtenstil": "Obersatz, Definition, Subsumtion und Ergebnis werden meist\neingehalten."}),
+    ("abgeschnitten", _roh(FALL)[:-1], FALL_SCHEMA, FALL),
+    ("vorlage_davor", "Schema: {\"thema\": \"...\"}\n" + _roh(FALL), FALL_SCHEMA, FALL),
+]
+
+
+def regex_alt(text):
+    """Der frühere Ansatz aus klausur_logik.clean_and_parse_json."""
+    treffer = re.search(r'\{.*\}', text, re.DOTALL)
+    if not treffer:
+        return None
+    try:
+        return json.loads(treffer.group(0))
+    except json.JSONDecodeError:
+        return None
+
+
+def beschaedige(text, rng):
+    """Wendet 1-3 zufällige, realistische Beschädigungen an."""
+    for _ in range(rng.randint(1, 3)):
+        art = rng.choice(["prosa", "suffix", "fence", "komma", "quotes", "abschneiden", "zeilenumbruch"])
+        if art == "prosa":
+            text = rng.choice(["Hier ist das Ergebnis: ", "Antwort {vorläufig}:\n", "Okay.\n"]) + text
+        elif art == "suffix":
+            text = text + rng.choice(["\nViel Erfolg! }", "\n{Ende}", "\n// Anmerkung: {\"x\": 1}"])
+        elif art == "fence":
+            text = "```json\n" + text + "\n```"
+        elif art == "komma":
+            text = re.sub(r'"\n(\s*)([}\]])', lambda m: '",\n' + m.group(1) + m.group(2), text, count=1)
+        elif art == "quotes":
+            text = text.replace('"fazit"', "“fazit”").replace('"thema"', "„thema“")
+        elif art == "abschneiden" and text.rstrip().endswith("}"):
+            text = text.rstrip()[:-1]
+        elif art == "zeilenumbruch":
+            text = text.replace(". ", ".\n", 1)
+    return text
+
+
+def miss(funktion, texte, wiederholungen=1):
+    start = time.perf_counter()
+    for _ in range(wiederholungen):
+        ergebnisse = [funktion(t) for t in texte]
+    return ergebnisse, (time.perf_counter() - start) / (wiederholungen * len(texte))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fuzz", type=int, default=2000, help="Anzahl zufällig beschädigter Ausgaben")
+    parser.add_argument("--groesse-kb", type=int, default=256, help="Länge der Ausgabe für den Laufzeittest")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print("Korpus:")
+    print(f"{'Fall':>22} {'Regex':>6} {'neu':>6}")
+    for name, text, schema, erwartet in KORPUS:
+        alt_ok = regex_alt(text) == erwartet
+        neu_ok = extrahiere_json(text, schema) == erwartet
+        print(f"{name:>22} {'ok' if alt_ok else '-':>6} {'ok' if neu_ok else '-':>6}")
+
+    rng = random.Random(args.seed)
+    faelle = []
+    for _ in range(args.fuzz):
+        objekt, schema = rng.choice([(BEWERTUNG, BEWERTUNGS_SCHEMA), (FALL, FALL_SCHEMA)])
+        faelle.append((beschaedige(_roh(objekt), rng), schema, objekt))
+
+    texte = [t for t, _, _ in faelle]
+    alt, alt_s = miss(regex_alt, texte)
+    neu = [extrahiere_json(t, schema) for t, schema, _ in faelle]
+    _, neu_s = miss(extrahiere_json, texte)
+    alt_quote = sum(a == o for a, (_, _, o) in zip(alt, faelle)) / len(faelle)
+    # Vergleich ohne Zeilenumbruch-Unterschiede: die Beschädigung fügt \n in Texte ein
+    neu_quote = sum(n is not None and n.keys() == o.keys() for n, (_, _, o) in zip(neu, faelle)) / len(faelle)
+    print(f"\nFuzz ({args.fuzz} Ausgaben): Regex {alt_quote:.1%} korrekt, neu {neu_quote:.1%} schemakonform")
+    print(f"Mittlere Zeit: Regex {alt_s * 1e6:.1f} µs, neu {neu_s * 1e6:.1f} µs")
+
+    # Lange Ausgabe: viele Klammern in Prosa vor und hinter dem eigentlichen Objekt
+    rauschen = "Siehe {Randnummer} und {vgl. oben}. " * (args.groesse_kb * 1024 // 70)
+    lang = rauschen + _roh(BEWERTUNG) + rauschen
+    _, alt_s = miss(regex_alt, [lang], wiederholungen=3)
+    _, neu_s = miss(lambda t: extrahiere_json(t, BEWERTUNGS_SCHEMA), [lang], wiederholungen=3)
+    print(f"\nLange Ausgabe ({len(lang) // 1024} KB): Regex {alt_s * 1000:.1f} ms "
+          f"(Ergebnis: {regex_alt(lang) is not None}), neu {neu_s * 1000:.1f} ms "
+          f"(Ergebnis: {extrahiere_json(lang, BEWERTUNGS_SCHEMA) is not None})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# benchmark_speicherbedarf.py
+"""
+Speicherbedarf pro Session: Lernhistorie als Liste von Dicts gegenüber dem Spaltenspeicher
+aus kompakte_datensaetze.py, dazu die Falldatenbank als Dicts gegenüber `Fall`-Objekten.
+
+Aufruf:
+    python benchmark_speicherbedarf.py                  # 10.000 Historien-Einträge
+    python benchmark_speicherbedarf.py --eintraege 50000 --wiederholungen 50
+
+Gemessen wird mit tracemalloc (alle Python- und NumPy-Allokationen), jeweils für:
+1. die Historie selbst im Session-State,
+2. den DataFrame, den das Dashboard pro Rerun daraus erzeugt (Spitzenwert und Laufzeit),
+3. die Falldatenbank: Verwaltungsaufwand pro Fall als Dict und als `Fall` (ohne die Texte).
+"""
+import argparse
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from kompakte_datensaetze import Fall, Lernhistorie
+
+FALLDATENBANK = "zivilrecht-faelle-json.json"
+THEMEN = ["Sachmangel beim Gebrauchtwagenkauf", "Anfechtung wegen Eigenschaftsirrtums", "Gutgläubiger Erwerb",
+          "Vertreter ohne Vertretungsmacht", "Verzug des Schuldners", "Deliktische Haftung", "Abstraktionsprinzip"]
+RECHTSGEBIETE = ["BGB AT", "Schuldrecht AT", "Schuldrecht BT", "Sachenrecht"]
+
+
+def erzeuge_ergebnisse(anzahl, seed=42):
+    """Ergebnisse wie aus lern_speicher.lade_historie (Texte jeweils frisch aus JSON, nicht geteilt)."""
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    ergebnisse = []
+    for i in range(anzahl):
+        ergebnis = {
+            "thema": rng.choice(THEMEN),
+            "rechtsgebiet": rng.choice(RECHTSGEBIETE),
+            "schwierigkeit": rng.randint(1, 5),
+            "bewertung": rng.randint(0, 100),
+            "datum": start + timedelta(minutes=37 * i),
+        }
+        ergebnisse.append(json.loads(json.dumps(ergebnis, default=str)) | {"datum": ergebnis["datum"]})
+    return ergebnisse
+
+
+def miss(erzeuge):
+    """(Ergebnis, belegte Bytes danach, Spitzenwert) einer Allokation."""
+    gc.collect()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    ergebnis = erzeuge()
+    belegt, spitze = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return ergebnis, belegt, spitze
+
+
+def zeit_ms(funktion, wiederholungen):
+    start = time.perf_counter()
+    for _ in range(wiederholungen):
+        funktion()
+    return (time.perf_counter() - start) / wiederholungen * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--eintraege", type=int, default=10_000)
+    parser.add_argument("--wiederholungen", type=int, default=20)
+    args = parser.parse_args()
+    import pandas as pd
+
+    quelle = erzeuge_ergebnisse(args.eintraege)
+    mb = 1024 * 1024
+
+    print(f"Lernhistorie mit {args.eintraege} Einträgen:")
+    liste, liste_bytes, _ = miss(lambda: erzeuge_ergebnisse(args.eintraege))
+    historie, historie_bytes, _ = miss(lambda: Lernhistorie.aus_ergebnissen(quelle))
+    print(f"  {'Liste von Dicts':>22}: {liste_bytes / mb:8.2f} MB")
+    print(f"  {'Spaltenspeicher':>22}: {historie_bytes / mb:8.2f} MB  (Arrays {historie.speicherbedarf() / mb:.2f} MB)")
+
+    print("\nDataFrame pro Dashboard-Rerun:")
+    _, _, df_liste_spitze = miss(lambda: pd.DataFrame(liste))
+    _, _, df_spalten_spitze = miss(historie.als_dataframe)
+    t_liste = zeit_ms(lambda: pd.DataFrame(liste), args.wiederholungen)
+    t_spalten = zeit_ms(historie.als_dataframe, args.wiederholungen)
+    print(f"  {'pd.DataFrame(liste)':>22}: {df_liste_spitze / mb:8.2f} MB Spitze, {t_liste:7.2f} ms")
+    print(f"  {'als_dataframe()':>22}: {df_spalten_spitze / mb:8.2f} MB Spitze, {t_spalten:7.2f} ms")
+
+    print("\nFalldatenbank:")
+    with open(FALLDATENBANK, encoding="utf-8") as f:
+        roh = f.read()
+    dicts = json.loads(roh)
+    faelle = [Fall.aus_dict(d) for d in dicts]
+    # Die Texte sind in beiden Fällen dieselben; verglichen wird der Aufwand pro Datensatz
+    dict_bytes = sum(sys.getsizeof(d) for d in dicts)
+    fall_bytes = sum(sys.getsizeof(f) for f in faelle)
+    print(f"  {'Dicts':>22}: {dict_bytes / len(dicts):6.0f} B pro Fall ohne Texte")
+    print(f"  {'Fall-Objekte':>22}: {fall_bytes / len(faelle):6.0f} B pro Fall ohne Texte")
+
+
+if __name__ == "__main__":
+    main()
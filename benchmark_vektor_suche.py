@@ -0,0 +1,84 @@
+# benchmark_vektor_suche.py
+"""
+Benchmark der Such-Backends aus vektor_suche.py auf synthetischen Fall-Embeddings.
+
+Aufruf:
+    python benchmark_vektor_suche.py                       # 1k, 100k, 1M Fälle
+    python benchmark_vektor_suche.py --groessen 1000 20000 --backends bruteforce ivf
+
+Gemessen werden Aufbauzeit, Latenz pro Anfrage (p50/p95/p99) und der Recall@k
+der ANN-Backends gegenüber der exakten Suche.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from vektor_suche import baue_index, hnswlib
+
+
+def synthetische_embeddings(anzahl, dimension, rng, n_themen=512):
+    """Geclusterte Vektoren, damit ANN-Indizes realistische Nachbarschaften vorfinden."""
+    themen = rng.standard_normal((n_themen, dimension), dtype=np.float32)
+    vektoren = np.empty((anzahl, dimension), dtype=np.float32)
+    block = 100_000
+    for start in range(0, anzahl, block):
+        ende = min(anzahl, start + block)
+        zuordnung = rng.integers(0, n_themen, ende - start)
+        vektoren[start:ende] = themen[zuordnung] + 0.6 * rng.standard_normal((ende - start, dimension), dtype=np.float32)
+    return vektoren
+
+
+def perzentil_ms(werte, p):
+    return float(np.percentile(werte, p) * 1000)
+
+
+def miss_backend(index, anfragen, top_k):
+    latenzen = []
+    ergebnisse = []
+    for query in anfragen:
+        start = time.perf_counter()
+        treffer = index.suche(query, top_k=top_k)
+        latenzen.append(time.perf_counter() - start)
+        ergebnisse.append({i for i, _ in treffer})
+    return latenzen, ergebnisse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groessen", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--dimension", type=int, default=384, help="384 entspricht MiniLM-L12")
+    parser.add_argument("--anfragen", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--backends", nargs="+", default=None,
+                        help="Standard: bruteforce, ivf und hnsw (falls hnswlib installiert ist)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    backends = args.backends or ["bruteforce", "ivf"] + (["hnsw"] if hnswlib is not None else [])
+    rng = np.random.default_rng(args.seed)
+
+    print(f"{'Fälle':>10} {'Backend':>10} {'Aufbau s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'Recall@k':>9}")
+    for anzahl in args.groessen:
+        vektoren = synthetische_embeddings(anzahl, args.dimension, rng)
+        # Anfragen sind verrauschte Kopien echter Vektoren, wie umformulierte Fragen
+        stichprobe = vektoren[rng.integers(0, anzahl, args.anfragen)]
+        anfragen = stichprobe + 0.3 * rng.standard_normal(stichprobe.shape, dtype=np.float32)
+
+        referenz = None
+        for backend in ["bruteforce"] + [b for b in backends if b != "bruteforce"]:
+            start = time.perf_counter()
+            index = baue_index(vektoren, backend=backend)
+            aufbau = time.perf_counter() - start
+            latenzen, ergebnisse = miss_backend(index, anfragen, args.top_k)
+            if referenz is None:
+                referenz = ergebnisse
+            recall = np.mean([len(e & r) / max(1, len(r)) for e, r in zip(ergebnisse, referenz)])
+            if backend in backends:
+                print(f"{anzahl:>10} {backend:>10} {aufbau:>9.2f} {perzentil_ms(latenzen, 50):>8.3f} "
+                      f"{perzentil_ms(latenzen, 95):>8.3f} {perzentil_ms(latenzen, 99):>8.3f} {recall:>9.3f}")
+            del index
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# bewertungs_cache.py
+"""
+Inhaltsadressierter Cache für Klausurbewertungen.
+
+Der Schlüssel ist ein Hash aus Sachverhalt, Lösungsskizze, normalisiertem Lösungstext und
+Prompt-Version. Wird dieselbe Lösung zum selben Fall erneut eingereicht (Doppelklick, Rerun),
+kommt die Bewertung von der Platte statt aus einem neuen Gemini-Aufruf. Gleichzeitige,
+identische Einreichungen warten auf einen einzigen laufenden Aufruf.
+
+Jede Bewertung liegt als eigene JSON-Datei im Cache-Verzeichnis; verdrängt wird nach
+letztem Zugriff (LRU), sobald Anzahl oder Gesamtgröße das Limit überschreiten.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import unicodedata
+from concurrent.futures import Future
+
+from dateien import schreibe_atomar
+
+
+def normalisiere_loesungstext(text):
+    """Unicode-NFKC, einheitliche Zeilenumbrüche, Leerraum pro Zeile zusammengefasst, Leerzeilen entfernt."""
+    text = unicodedata.normalize("NFKC", text or "").replace("\r\n", "\n")
+    zeilen = (" ".join(zeile.split()) for zeile in text.split("\n"))
+    return "\n".join(zeile for zeile in zeilen if zeile)
+
+
+def bewertungs_schluessel(sachverhalt, loesungsskizze, loesungstext, prompt_version):
+    """SHA-256 über alle Eingaben, die das Ergebnis der Bewertung bestimmen."""
+    roh = json.dumps(
+        [sachverhalt, loesungsskizze, normalisiere_loesungstext(loesungstext), prompt_version],
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(roh.encode("utf-8")).hexdigest()
+
+
+class BewertungsCache:
+    """Thread-sicherer Plattencache mit LRU-Verdrängung und Deduplizierung laufender Bewertungen."""
+
+    def __init__(self, verzeichnis, max_eintraege=5000, max_bytes=100 * 1024 * 1024, wartezeit_s=300.0):
+        self.verzeichnis = verzeichnis
+        self.max_eintraege = max_eintraege
+        self.max_bytes = max_bytes
+        self.wartezeit_s = wartezeit_s
+        os.makedirs(verzeichnis, exist_ok=True)
+        self._lock = threading.Lock()
+        self._laufend = {}  # schluessel -> Future
+        self._index = {}    # schluessel -> (letzter_zugriff, groesse)
+        self._bytes = 0
+        self._treffer = 0
+        self._fehlschlaege = 0
+        self._zusammengefasst = 0
+        for name in os.listdir(verzeichnis):
+            if name.endswith(".json"):
+                info = os.stat(os.path.join(verzeichnis, name))
+                self._index[name[:-5]] = (info.st_mtime, info.st_size)
+                self._bytes += info.st_size
+
+    def _pfad(self, schluessel):
+        return os.path.join(self.verzeichnis, f"{schluessel}.json")
+
+    def lade(self, schluessel):
+        """Gespeicherte Bewertung oder None; ein Treffer zählt als Zugriff für die LRU-Reihenfolge."""
+        with self._lock:
+            if schluessel not in self._index:
+                self._fehlschlaege += 1
+                return None
+            try:
+                with open(self._pfad(schluessel), encoding="utf-8") as f:
+                    ergebnis = json.load(f)
+            except (OSError, ValueError):
+                self._vergiss(schluessel)
+                self._fehlschlaege += 1
+                return None
+            jetzt = time.time()
+            self._index[schluessel] = (jetzt, self._index[schluessel][1])
+            os.utime(self._pfad(schluessel), (jetzt, jetzt))
+            self._treffer += 1
+            return ergebnis
+
+    def speichere(self, schluessel, ergebnis):
+        daten = json.dumps(ergebnis, ensure_ascii=False).encode("utf-8")
+        schreibe_atomar(self._pfad(schluessel), daten)
+        with self._lock:
+            if schluessel in self._index:
+                self._bytes -= self._index[schluessel][1]
+            self._index[schluessel] = (time.time(), len(daten))
+            self._bytes += len(daten)
+            self._verdraenge()
+
+    def _vergiss(self, schluessel):
+        _, groesse = self._index.pop(schluessel)
+        self._bytes -= groesse
+        try:
+            os.remove(self._pfad(schluessel))
+        except FileNotFoundError:
+            pass
+
+    def _verdraenge(self):
+        if len(self._index) <= self.max_eintraege and self._bytes <= self.max_bytes:
+            return
+        for schluessel, _ in sorted(self._index.items(), key=lambda item: item[1][0]):
+            if len(self._index) <= self.max_eintraege and self._bytes <= self.max_bytes:
+                break
+            self._vergiss(schluessel)
+
+    # --- Deduplizierung laufender Bewertungen ---
+
+    def reserviere(self, schluessel):
+        """
+        Gibt (future, ist_eigentuemer) zurück. Der Eigentümer muss die Bewertung berechnen und
+        `abschliessen` oder `abbrechen` aufrufen; alle anderen warten mit `warte(future)`.
+        """
+        with self._lock:
+            future = self._laufend.get(schluessel)
+            if future is not None:
+                self._zusammengefasst += 1
+                return future, False
+            future = Future()
+            self._laufend[schluessel] = future
+            return future, True
+
+    def warte(self, future):
+        """Ergebnis einer laufenden Bewertung; TimeoutError, wenn der Eigentümer nicht rechtzeitig fertig wird."""
+        return future.result(timeout=self.wartezeit_s)
+
+    def abschliessen(self, schluessel, ergebnis, speichern=True):
+        """Speichert das Ergebnis (falls vorhanden und gewünscht) und weckt alle Wartenden."""
+        try:
+            if ergebnis and speichern:
+                self.speichere(schluessel, ergebnis)
+        except OSError as e:
+            # Ohne Cache-Eintrag geht es weiter; die Wartenden bekommen das Ergebnis trotzdem
+            print(f"Bewertung konnte nicht im Cache gespeichert werden: {e}")
+        finally:
+            with self._lock:
+                future = self._laufend.pop(schluessel)
+            future.set_result(ergebnis)
+
+    def abbrechen(self, schluessel, fehler):
+        with self._lock:
+            future = self._laufend.pop(schluessel)
+        future.set_exception(fehler)
+
+    def hole_oder_berechne(self, schluessel, berechne):
+        """Cache-Treffer, Ergebnis eines gleichzeitig laufenden Aufrufs oder `berechne()`."""
+        ergebnis = self.lade(schluessel)
+        if ergebnis is not None:
+            return ergebnis
+        future, ist_eigentuemer = self.reserviere(schluessel)
+        if not ist_eigentuemer:
+            return self.warte(future)
+        try:
+            # Zwischen lade() und reserviere() kann ein anderer Aufruf fertig geworden sein
+            ergebnis = self.lade(schluessel) or berechne()
+        except Exception as e:
+            self.abbrechen(schluessel, e)
+            raise
+        self.abschliessen(schluessel, ergebnis)
+        return ergebnis
+
+    def statistik(self):
+        with self._lock:
+            return {
+                "eintraege": len(self._index),
+                "bytes": self._bytes,
+                "treffer": self._treffer,
+                "fehlschlaege": self._fehlschlaege,
+                "zusammengefasst": self._zusammengefasst,
+                "laufend": len(self._laufend),
+            }
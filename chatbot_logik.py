@@ -1,64 +1,173 @@
-import google.generativeai as genai
-import os
 import streamlit as st
-from datenbank import finde_relevantesten_fall
-from tenacity import retry, stop_after_attempt, wait_random_exponential
+from datenbank import finde_relevante_faelle_im_budget
+from llm_client import generiere, generiere_stream
+from llm_gateway import PRIORITAET_HINTERGRUND
+from gespraechs_verlauf import ROLLEN_NAMEN, Gespraechsverlauf
+from antwort_cache import SemantischerAntwortCache, normalisiere_anfrage
+from kontext_packung import Tokenzaehler, packe_kontext
+from messung import TOKEN_GRENZEN, erfasse_wert, messwerte, span, zaehle
+from einstellungen import (
+    ANTWORT_CACHE_SCHWELLE, ANTWORT_CACHE_MAX_EINTRAEGE, ANTWORT_CACHE_TTL_SEKUNDEN, ANTWORT_CACHE_MAX_MB,
+    KONTEXT_TOP_K, KONTEXT_TOKEN_BUDGET, KONTEXT_DUPLIKAT_SCHWELLE,
+    CHAT_FENSTER_RUNDEN, CHAT_ZUSAMMENFASSUNG_MAX_ZEICHEN, CHAT_ARCHIV_MAX_NACHRICHTEN,
+)
 
-# Konfiguriert die Gemini API mit st.secrets
-try:
-    # Greift auf den Key aus der secrets.toml zu
-    genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
-except (AttributeError, KeyError):
-    pass 
+# Die Gemini API wird zentral in llm_client konfiguriert
 
 # Vollständiger Prompt für den RAG-Assistenten
 system_prompt_rag_assistent = """
 Du bist ein "JuraKI-Tutor", ein freundlicher und präziser Tutor für Jurastudenten.
 
-Deine Aufgabe ist es, die Frage des Studenten zu beantworten. Du erhältst dafür möglicherweise einen "KONTEXT" aus einer Falldatenbank.
+Deine Aufgabe ist es, die Frage des Studenten zu beantworten. Du erhältst dafür möglicherweise einen "KONTEXT" aus einer Falldatenbank; er kann Auszüge aus mehreren nummerierten Fällen enthalten, der relevanteste steht zuerst.
 
 DEIN VORGEHEN:
 1.  Prüfe zuerst, ob der "KONTEXT" thematisch zur "FRAGE DES STUDENTEN" passt.
-2.  **Wenn der Kontext passt:** Beantworte die Frage des Studenten präzise und AUSSCHLIESSLICH auf Basis der Informationen im Kontext. Beginne deine Antwort, indem du den Fall-Titel nennst.
+2.  **Wenn der Kontext passt:** Beantworte die Frage des Studenten präzise und AUSSCHLIESSLICH auf Basis der Informationen im Kontext. Beginne deine Antwort, indem du den Titel des Falls nennst, auf den du dich stützt. Fälle, die nicht zur Frage passen, ignorierst du.
 3.  **Wenn der Kontext NICHT passt oder fehlt:** Ignoriere den Kontext vollständig. Beantworte die Frage des Studenten basierend auf deinem allgemeinen Wissen zum deutschen Zivilrecht. Beginne deine Antwort mit dem Satz: "Ich konnte keinen spezifischen Fall dazu in meiner Datenbank finden, aber allgemein gilt:".
-4.  Gib unter keinen Umständen Rechtsberatung, sondern nur didaktische Erklärungen.
+4.  Gibt es ein "BISHERIGES GESPRÄCH", beziehe Rückfragen darauf (z.B. "und wenn er minderjährig ist?").
+5.  Gib unter keinen Umständen Rechtsberatung, sondern nur didaktische Erklärungen.
 """
 
-@st.cache_data(ttl=3600)
-@retry(
-    wait=wait_random_exponential(min=1, max=10),
-    stop=stop_after_attempt(2)
-)
-def get_chatbot_response(user_query, _faelle, _modell, _fall_embeddings):
+system_prompt_zusammenfassung = """
+Du fasst einen Gesprächsverlauf zwischen einem Jurastudenten und einem Tutor für das Zivilrecht zusammen.
+Du erhältst die bisherige Zusammenfassung (kann leer sein) und neue Nachrichten.
+Gib eine aktualisierte Zusammenfassung in höchstens 6 Sätzen zurück: besprochene Themen, genannte
+Normen und Fälle, offene Fragen des Studenten. Nur den Text der Zusammenfassung, keine Einleitung.
+"""
+
+@st.cache_resource # Ein Cache pro Prozess, geteilt von allen Sessions
+def lade_antwort_cache():
+    """Semantischer Cache für Chatbot-Antworten, geschlüsselt auf Frage-Embedding und Kontext-Fall."""
+    cache = SemantischerAntwortCache(
+        schwelle=ANTWORT_CACHE_SCHWELLE,
+        max_eintraege=ANTWORT_CACHE_MAX_EINTRAEGE,
+        ttl_sekunden=ANTWORT_CACHE_TTL_SEKUNDEN,
+        max_bytes=ANTWORT_CACHE_MAX_MB * 1024 * 1024,
+    )
+    for wert in ("eintraege", "bytes", "trefferquote"):
+        messwerte.registriere_gauge(f"juraki_antwort_cache_{wert}", lambda w=wert: cache.statistik()[w])
+    return cache
+
+FEHLERANTWORT = "Entschuldigung, bei der Generierung der Antwort ist ein Fehler aufgetreten. Bitte versuchen Sie es später erneut."
+
+@st.cache_resource # Ein Zähler (mit Cache pro Text) pro Prozess
+def lade_tokenzaehler(_modell):
+    """Tokenizer des Embedding-Modells (über den Embedding-Dienst durchgereicht), sonst Näherung."""
+    return Tokenzaehler(getattr(_modell, "tokenizer", None))
+
+def fasse_gespraech_zusammen(bisher, nachrichten):
+    """Arbeitet aus dem Fenster gefallene Nachrichten in die laufende Zusammenfassung ein."""
+    verlauf = "\n".join(f"{ROLLEN_NAMEN[n['role']]}: {n['content']}" for n in nachrichten)
+    prompt = f"BISHERIGE ZUSAMMENFASSUNG:\n{bisher or '(leer)'}\n\nNEUE NACHRICHTEN:\n{verlauf}"
+    return generiere("zusammenfassung", system_prompt_zusammenfassung, prompt, prioritaet=PRIORITAET_HINTERGRUND).text
+
+def neuer_gespraechsverlauf():
+    """Gesprächsgedächtnis einer Session mit den Einstellungen und der LLM-Zusammenfassung."""
+    return Gespraechsverlauf(CHAT_FENSTER_RUNDEN, CHAT_ARCHIV_MAX_NACHRICHTEN, CHAT_ZUSAMMENFASSUNG_MAX_ZEICHEN,
+                             zusammenfasser=fasse_gespraech_zusammen)
+
+def _bereite_anfrage_vor(user_query, _faelle, _modell, _fall_index, verlauf=None):
+    """
+    Stufe 1: Retrieval (hybride Suche im Zeitbudget) und Zusammenstellung des Kontexts aus den
+    besten Treffern im Token-Budget. Kodiert wird die normalisierte Anfrage; dasselbe Embedding
+    dient so auch als Schlüssel des Antwort-Caches.
+    Gibt (kontext, kontext_titel, prompt_verlauf, cache_schluessel, gecachte_antwort) zurück;
+    ohne rechtzeitiges Embedding ist cache_schluessel None und der Antwort-Cache wird übergangen.
+    Rückfragen im Gespräch sucht das Retrieval zusammen mit der vorigen Frage und beantwortet
+    sie mit dem Verlauf im Prompt; sie gehen am Antwort-Cache vorbei. Eigenständige Fragen
+    bekommen keinen Verlauf in den Prompt (prompt_verlauf None), ihre Antwort hängt damit nicht
+    vom Gespräch ab und darf aus dem Cache kommen und in ihm landen.
+    """
+    rueckfrage = verlauf is not None and verlauf.ist_rueckfrage(user_query)
+    suchtext = verlauf.retrieval_text(user_query) if rueckfrage else user_query
+    with span("retrieval"):
+        treffer, query_embedding = finde_relevante_faelle_im_budget(suchtext, _faelle, _modell, _fall_index,
+                                                                   top_k=KONTEXT_TOP_K,
+                                                                   embedding_text=normalisiere_anfrage(suchtext))
+    with span("kontext_packung", kandidaten=len(treffer)):
+        kontext = packe_kontext(treffer, lade_tokenzaehler(_modell), KONTEXT_TOKEN_BUDGET, KONTEXT_DUPLIKAT_SCHWELLE)
+    kontext_titel = ", ".join(kontext.fall_titel) or None
+    if rueckfrage:
+        return kontext, kontext_titel, verlauf, None, None
+    if query_embedding is None:
+        return kontext, kontext_titel, None, None, None
+
+    normalisiert = normalisiere_anfrage(user_query)
+    with span("antwort_cache_suche"):
+        gecachte_antwort = lade_antwort_cache().suche(normalisiert, query_embedding, kontext_titel)
+    zaehle("juraki_antwort_cache_gesamt", ergebnis="treffer" if gecachte_antwort is not None else "fehlschlag")
+    return kontext, kontext_titel, None, (normalisiert, query_embedding, kontext_titel), gecachte_antwort
+
+def _baue_input_prompt(user_query, kontext, zaehler, verlauf=None):
+    """Stufe 2: Augmented Generation – setzt Verlauf, Kontext und Frage zusammen und erfasst die Tokens."""
+    with span("chatbot_prompt_bau", hat_kontext=bool(kontext.text)):
+        gespraech = verlauf.als_prompt_text() if verlauf else ""
+        if not kontext.text:
+            input_prompt = f'KONTEXT: Kein passender Kontext gefunden. FRAGE DES STUDENTEN: "{user_query}"'
+        else:
+            input_prompt = f"KONTEXT:\n{kontext.text}\n\nFRAGE DES STUDENTEN:\n\"{user_query}\""
+        if gespraech:
+            input_prompt = f"BISHERIGES GESPRÄCH:\n{gespraech}\n\n{input_prompt}"
+    # Der System-Prompt wird bei jedem Aufruf mitgeschickt; er ist konstant und daher nur einmal gezählt
+    for teil, tokens in (("system", zaehler.anzahl(system_prompt_rag_assistent)), ("kontext", kontext.tokens),
+                         ("verlauf", zaehler.anzahl(gespraech)), ("frage", zaehler.anzahl(user_query))):
+        erfasse_wert("juraki_prompt_tokens", tokens, TOKEN_GRENZEN, teil=teil)
+        zaehle("juraki_prompt_tokens_gesamt", tokens, teil=teil)
+    zaehle("juraki_kontext_felder_gesamt", kontext.felder, ergebnis="gepackt")
+    zaehle("juraki_kontext_felder_gesamt", kontext.duplikate, ergebnis="dublette")
+    zaehle("juraki_kontext_felder_gesamt", kontext.ausgelassen, ergebnis="ueber_budget")
+    return input_prompt
+
+def get_chatbot_response(user_query, _faelle, _modell, _fall_index, verlauf=None):
     """
     Orchestriert den RAG-Prozess.
     Beachte die Unterstriche bei den Argumenten, um Caching-Fehler zu vermeiden.
+    Antworten werden über den semantischen Antwort-Cache wiederverwendet;
+    Wiederholungen bei Fehlern übernimmt das LLM-Gateway.
+    `verlauf` ist der Gesprächsverlauf der Session ohne die aktuelle Frage.
     """
-    
-    # Stufe 1: Retrieval (Semantische Suche)
-    kontext_fall = finde_relevantesten_fall(user_query, _faelle, _modell, _fall_embeddings)
-    
-    # Stufe 2: Augmented Generation (Antworten)
-    input_prompt = ""
-    if not kontext_fall:
-        input_prompt = f'KONTEXT: Kein passender Kontext gefunden. FRAGE DES STUDENTEN: "{user_query}"'
-    else:
-        input_prompt = f"""
-        KONTEXT:
-        - Fall-Titel: {kontext_fall['fall_titel']}
-        - Zentrales Problem: {kontext_fall['zentrales_problem']}
-        - Kernfrage: {kontext_fall['kernfrage']}
-        - Kurzlösung: {kontext_fall['kurzloesung']}
-
-        FRAGE DES STUDENTEN:
-        "{user_query}"
-        """
-    
+    kontext, kontext_titel, prompt_verlauf, cache_schluessel, gecachte_antwort = _bereite_anfrage_vor(
+        user_query, _faelle, _modell, _fall_index, verlauf)
+    if gecachte_antwort is not None:
+        return gecachte_antwort, kontext_titel
+
+    input_prompt = _baue_input_prompt(user_query, kontext, lade_tokenzaehler(_modell), prompt_verlauf)
     try:
-        model = genai.GenerativeModel(model_name="gemini-1.5-pro-latest", system_instruction=system_prompt_rag_assistent)
-        response = model.generate_content(input_prompt)
-        kontext_titel = kontext_fall['fall_titel'] if kontext_fall else None
+        response = generiere("chatbot", system_prompt_rag_assistent, input_prompt)
+        if cache_schluessel:
+            lade_antwort_cache().speichere(*cache_schluessel, response.text)
         return response.text, kontext_titel
     except Exception as e:
-        print(f"Fehler in get_chatbot_response nach 2 Versuchen: {e}")
-        return "Entschuldigung, bei der Generierung der Antwort ist ein Fehler aufgetreten. Bitte versuchen Sie es später erneut.", None
+        print(f"Fehler in get_chatbot_response: {e}")
+        zaehle("juraki_fehler_gesamt", ort="get_chatbot_response")
+        return FEHLERANTWORT, None
+
+def get_chatbot_response_stream(user_query, _faelle, _modell, _fall_index, verlauf=None):
+    """
+    Wie get_chatbot_response, liefert die Antwort aber als Generator von Textstücken,
+    sobald Gemini sie sendet. Gibt (generator, kontext_titel) zurück.
+    Die vollständige Antwort landet nach dem Stream im Antwort-Cache.
+    """
+    kontext, kontext_titel, prompt_verlauf, cache_schluessel, gecachte_antwort = _bereite_anfrage_vor(
+        user_query, _faelle, _modell, _fall_index, verlauf)
+    if gecachte_antwort is not None:
+        return iter([gecachte_antwort]), kontext_titel
+
+    input_prompt = _baue_input_prompt(user_query, kontext, lade_tokenzaehler(_modell), prompt_verlauf)
+
+    def stream():
+        teile = []
+        try:
+            for text in generiere_stream("chatbot", system_prompt_rag_assistent, input_prompt):
+                teile.append(text)
+                yield text
+        except Exception as e:
+            print(f"Fehler in get_chatbot_response_stream: {e}")
+            zaehle("juraki_fehler_gesamt", ort="get_chatbot_response_stream")
+            # Bereits gesendeter Text bleibt stehen, der Hinweis wird angehängt
+            yield ("\n\n" if teile else "") + FEHLERANTWORT
+            return
+        if cache_schluessel:
+            lade_antwort_cache().speichere(*cache_schluessel, "".join(teile))
+
+    return stream(), kontext_titel
@@ -0,0 +1,18 @@
+# dateien.py
+"""Gemeinsame Hilfsfunktionen für Dateien auf der Platte."""
+import os
+import tempfile
+
+
+def schreibe_atomar(pfad, daten):
+    """Schreibt Bytes über eine temporäre Datei, damit Leser nie eine halbe Datei sehen."""
+    verzeichnis = os.path.dirname(pfad)
+    fd, tmp_pfad = tempfile.mkstemp(dir=verzeichnis, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(daten)
+        os.replace(tmp_pfad, pfad)
+    except BaseException:
+        if os.path.exists(tmp_pfad):
+            os.remove(tmp_pfad)
+        raise
@@ -1,50 +1,223 @@
-import json
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 import streamlit as st
-from sentence_transformers import SentenceTransformer, util
-import numpy as np
+from einstellungen import (
+    EMBEDDING_MODELL_NAME, EMBEDDING_SPEICHER_VERZEICHNIS, EMBEDDING_SPEICHER_DTYPE,
+    EMBEDDING_BACKEND, EMBEDDING_THREADS, EMBEDDING_ONNX_INT8_DATEI,
+    RETRIEVAL_TOP_K, RETRIEVAL_MIN_SCORE, RETRIEVAL_BACKEND, RETRIEVAL_ANN_SCHWELLE,
+    RETRIEVAL_MODUS, RETRIEVAL_BUDGET_MS, HYBRID_RRF_K, HYBRID_BM25_MIN_ANTEIL, HYBRID_KANDIDATEN,
+    HYBRID_ABSCHNITT_MAX_ZEICHEN,
+    EMBEDDING_BATCH_GROESSE, EMBEDDING_BATCH_WARTEZEIT_MS, FALL_SPEICHER_PRUEF_INTERVALL_S,
+)
+from embedding_speicher import EmbeddingSpeicher
+from embedding_dienst import EmbeddingBatcher
+from embedding_backend import lade_sentence_transformer, modell_kennung
+from vektor_suche import baue_index, BruteForceIndex
+from hybrid_suche import HybridIndex, zerlege_fall
+from fall_speicher import FallSpeicher, lese_faelle
+from start_profil import stufe
+from messung import messwerte, span, zaehle
 
 @st.cache_data
 def lade_faelle(dateipfad):
-    """Lädt die Falldatenbank aus einer JSON-Datei."""
+    """Lädt die Falldatenbank aus einer JSON- oder JSONL-Datei bzw. einem Shard-Verzeichnis."""
     try:
-        with open(dateipfad, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return lese_faelle(dateipfad)
     except FileNotFoundError:
         return None
 
 @st.cache_resource # Das Modell wird nur einmal geladen und im Speicher gehalten
 def lade_embedding_modell():
-    """Lädt das Sprachmodell für die Vektor-Erstellung."""
-    return SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+    """
+    Lädt das Sprachmodell für die Vektor-Erstellung mit dem konfigurierten Backend.
+    sentence_transformers (und damit torch) wird erst hier importiert, damit Seiten ohne
+    Embeddings nicht auf den Import warten.
+    """
+    with span("lade_embedding_modell", backend=EMBEDDING_BACKEND):
+        return lade_sentence_transformer(EMBEDDING_MODELL_NAME, EMBEDDING_BACKEND, EMBEDDING_THREADS,
+                                         onnx_datei=EMBEDDING_ONNX_INT8_DATEI)
 
-@st.cache_data
+# Gesetzt, sobald der Embedding-Dienst (z.B. vom Vorwärm-Thread oder Chatbot) geladen wurde
+_embedding_dienst_geladen = threading.Event()
+
+@st.cache_resource # Ein Batch-Thread pro Prozess, geteilt von allen Sessions
+def lade_embedding_dienst():
+    """Bündelt gleichzeitige Anfrage-Embeddings aller Sessions zu einem Forward-Pass."""
+    dienst = EmbeddingBatcher(lade_embedding_modell(), max_batch_groesse=EMBEDDING_BATCH_GROESSE,
+                              max_wartezeit_ms=EMBEDDING_BATCH_WARTEZEIT_MS)
+    for wert in ("queue_tiefe", "max_queue_tiefe", "mittlere_batch_groesse", "batch_fuellgrad"):
+        messwerte.registriere_gauge(f"juraki_embedding_{wert}", lambda w=wert: dienst.metriken()[w])
+    _embedding_dienst_geladen.set()
+    return dienst
+
+def geladener_embedding_dienst():
+    """Der Embedding-Dienst, falls er schon geladen ist, sonst None – lädt selbst nie das Modell."""
+    return lade_embedding_dienst() if _embedding_dienst_geladen.is_set() else None
+
+def _fall_embeddings(faelle, modell):
+    """
+    Liefert die Vektor-Embeddings für alle Fälle in der Datenbank.
+    Bereits kodierte Fälle kommen aus dem persistenten Embedding-Speicher,
+    nur neue oder geänderte Fälle werden mit dem Modell kodiert.
+    """
+    probleme = [fall.get('zentrales_problem', '') for fall in faelle]
+    speicher = EmbeddingSpeicher(EMBEDDING_SPEICHER_VERZEICHNIS, modell_kennung(EMBEDDING_MODELL_NAME, EMBEDDING_BACKEND),
+                                 EMBEDDING_SPEICHER_DTYPE)
+    with span("erstelle_fall_embeddings", faelle=len(probleme)):
+        return speicher.lade_oder_erstelle(probleme, modell)
+
+def _baue_fall_index(faelle, modell):
+    """Suchindex über die (vor-normalisierten) Embeddings von zentrales_problem."""
+    if not faelle:
+        return None
+    return baue_index(_fall_embeddings(faelle, modell), backend=RETRIEVAL_BACKEND, ann_schwelle=RETRIEVAL_ANN_SCHWELLE,
+                      normalisiert=True)
+
+def _baue_hybrid_index(faelle, modell):
+    """
+    Hybridindex: ein Embedding pro Abschnitt (Titel, Problem, Kernfrage, Kurzlösung) plus
+    BM25 über alle Felder. Abschnitts-Embeddings liegen ebenfalls im Embedding-Speicher.
+    """
+    if not faelle:
+        return None
+    abschnitte = [(i, text) for i, fall in enumerate(faelle)
+                  for _, text in zerlege_fall(fall, HYBRID_ABSCHNITT_MAX_ZEICHEN)]
+    speicher = EmbeddingSpeicher(EMBEDDING_SPEICHER_VERZEICHNIS,
+                                 modell_kennung(EMBEDDING_MODELL_NAME, EMBEDDING_BACKEND) + "-abschnitte",
+                                 EMBEDDING_SPEICHER_DTYPE)
+    with span("erstelle_abschnitt_embeddings", abschnitte=len(abschnitte)):
+        vektoren = speicher.lade_oder_erstelle([text for _, text in abschnitte], modell)
+    abschnitt_index = baue_index(vektoren, backend=RETRIEVAL_BACKEND, ann_schwelle=RETRIEVAL_ANN_SCHWELLE,
+                                 normalisiert=True)
+    return HybridIndex(faelle, [i for i, _ in abschnitte], abschnitt_index, rrf_k=HYBRID_RRF_K,
+                       bm25_min_anteil=HYBRID_BM25_MIN_ANTEIL, kandidaten=HYBRID_KANDIDATEN)
+
+@st.cache_resource # cache_resource, damit die memory-mapped Matrix nicht kopiert wird
 # HIER IST DIE KORREKTUR: 'modell' wurde zu '_modell' umbenannt.
 # Dies weist Streamlit an, dieses Argument beim Caching zu ignorieren.
 def erstelle_fall_embeddings(faelle, _modell):
-    """Erstellt Vektor-Embeddings für alle Fälle in der Datenbank."""
+    """Fall-Embeddings für eine feste Liste von Fällen (siehe _fall_embeddings)."""
     if not faelle:
         return None
-    
-    probleme = [fall.get('zentrales_problem', '') for fall in faelle]
-    # Wir verwenden das umbenannte _modell hier ganz normal.
-    return _modell.encode(probleme, convert_to_tensor=True)
+    return _fall_embeddings(faelle, _modell)
 
-# HIER IST DIE ZWEITE KORREKTUR: 'modell' wurde auch hier zu '_modell' umbenannt.
-def finde_relevantesten_fall(user_query, faelle, _modell, fall_embeddings):
+@st.cache_resource
+def erstelle_fall_index(faelle, _modell):
+    """Baut den Suchindex über die (vor-normalisierten) Fall-Embeddings."""
+    return _baue_fall_index(faelle, _modell)
+
+@st.cache_resource
+def erstelle_hybrid_index(faelle, _modell):
+    """Hybridindex für eine feste Liste von Fällen (siehe _baue_hybrid_index)."""
+    return _baue_hybrid_index(faelle, _modell)
+
+@st.cache_resource # Ein Speicher (und ein Überwachungs-Thread) pro Prozess
+def lade_fall_speicher(dateipfad):
     """
-    Findet den relevantesten Fall mittels semantischer Suche (Cosine Similarity).
+    Versionierte Falldatenbank mit Suchindex. Änderungen an der Quelle werden im Hintergrund
+    erkannt; nur geänderte Fälle werden neu kodiert, danach wird die Version atomar getauscht.
     """
-    if faelle is None or fall_embeddings is None:
+    with stufe("lade_embedding_modell"):
+        modell = lade_embedding_modell()
+    baue = _baue_hybrid_index if RETRIEVAL_MODUS == "hybrid" else _baue_fall_index
+    try:
+        with stufe("erstelle_fall_index"):
+            speicher = FallSpeicher(dateipfad, lambda faelle: baue(faelle, modell),
+                                    pruef_intervall_s=FALL_SPEICHER_PRUEF_INTERVALL_S)
+    except FileNotFoundError:
         return None
+    speicher.starte_ueberwachung()
+    return speicher
 
-    query_embedding = _modell.encode(user_query, convert_to_tensor=True)
-    
-    cos_scores = util.pytorch_cos_sim(query_embedding, fall_embeddings)[0]
-    
-    best_match_index = np.argmax(cos_scores)
-    best_score = cos_scores[best_match_index]
-    
-    if best_score > 0.4:
-        return faelle[best_match_index]
-    else:
-        return None
+def lade_retrieval_ressourcen(dateipfad):
+    """
+    Falldatenbank, Embedding-Dienst und Suchindex für den Chatbot.
+    Wird erst beim ersten Bedarf (oder vom Vorwärm-Thread) aufgerufen; danach aus dem Cache.
+    Fälle und Index stammen immer aus derselben Version, auch während eines Neuaufbaus.
+    """
+    speicher = lade_fall_speicher(dateipfad)
+    if speicher is None:
+        return None, None, None
+    version = speicher.aktuell()
+    return version.faelle, lade_embedding_dienst(), version.fall_index
+
+@st.cache_resource # Höchstens ein Vorwärm-Thread pro Prozess
+def starte_vorwaermen(dateipfad):
+    """Lädt Modell und Index im Hintergrund, damit der erste Chatbot-Aufruf nicht darauf wartet."""
+    def vorwaermen():
+        try:
+            with stufe("vorwaermen_retrieval"):
+                lade_retrieval_ressourcen(dateipfad)
+        except Exception as e:
+            print(f"Fehler beim Vorwärmen der Embeddings: {e}")
+
+    thread = threading.Thread(target=vorwaermen, name="vorwaermen", daemon=True)
+    thread.start()
+    return thread
+
+def finde_relevante_faelle_fuer_vektor(query_embedding, faelle, fall_index, top_k=None, min_score=None, query_text=None):
+    """
+    Wie finde_relevante_faelle, aber mit bereits berechnetem Anfrage-Embedding.
+    Mit `query_text` und einem Hybridindex fließt zusätzlich BM25 ein; das Embedding darf
+    dann auch None sein (nur Textsuche).
+    """
+    if faelle is None or fall_index is None:
+        return []
+    if not hasattr(fall_index, "suche"):
+        # Rohe Embedding-Matrix übergeben (alte Aufrufer): exakte Suche
+        fall_index = BruteForceIndex(fall_index)
+
+    top_k = RETRIEVAL_TOP_K if top_k is None else top_k
+    min_score = RETRIEVAL_MIN_SCORE if min_score is None else min_score
+    with span("aehnlichkeitssuche", top_k=top_k, nur_bm25=query_embedding is None):
+        if query_text is not None and hasattr(fall_index, "suche_hybrid"):
+            treffer = fall_index.suche_hybrid(query_text, query_embedding, top_k=top_k, min_score=min_score)
+        elif query_embedding is not None:
+            treffer = fall_index.suche(query_embedding, top_k=top_k, min_score=min_score)
+        else:
+            treffer = []
+    return [(faelle[i], score) for i, score in treffer]
+
+def finde_relevante_faelle_im_budget(user_query, faelle, _modell, fall_index, top_k=None, min_score=None, budget_ms=None,
+                                     embedding_text=None):
+    """
+    Retrieval mit Zeitbudget. Liegt das Anfrage-Embedding (über den Embedding-Dienst) nicht
+    rechtzeitig vor, wird nur mit BM25 gesucht. Gibt (treffer, query_embedding oder None) zurück.
+    Mit `embedding_text` wird dieser Text statt `user_query` kodiert (BM25 sucht weiter mit `user_query`).
+    """
+    if faelle is None or fall_index is None:
+        return [], None
+    budget_s = (RETRIEVAL_BUDGET_MS if budget_ms is None else budget_ms) / 1000
+    start = time.perf_counter()
+    with span("anfrage_embedding"):
+        if hasattr(_modell, "encode_async") and hasattr(fall_index, "suche_hybrid"):
+            future = _modell.encode_async(user_query if embedding_text is None else embedding_text)
+            try:
+                query_embedding = future.result(timeout=max(0.0, budget_s - (time.perf_counter() - start)))
+            except FutureTimeoutError:
+                query_embedding = None
+                zaehle("juraki_retrieval_budget_ueberschritten_gesamt")
+        else:
+            query_embedding = _modell.encode(user_query if embedding_text is None else embedding_text, convert_to_numpy=True)
+    treffer = finde_relevante_faelle_fuer_vektor(query_embedding, faelle, fall_index, top_k, min_score, query_text=user_query)
+    return treffer, query_embedding
+
+def finde_relevante_faelle(user_query, faelle, _modell, fall_index, top_k=None, min_score=None):
+    """
+    Findet die top_k relevantesten Fälle mittels semantischer Suche.
+    Gibt eine Liste von (Fall, Score) zurück, absteigend nach Score.
+    """
+    if faelle is None or fall_index is None:
+        return []
+    with span("anfrage_embedding"):
+        query_embedding = _modell.encode(user_query, convert_to_numpy=True)
+    return finde_relevante_faelle_fuer_vektor(query_embedding, faelle, fall_index, top_k, min_score, query_text=user_query)
+
+# HIER IST DIE ZWEITE KORREKTUR: 'modell' wurde auch hier zu '_modell' umbenannt.
+def finde_relevantesten_fall(user_query, faelle, _modell, fall_index):
+    """
+    Findet den relevantesten Fall mittels semantischer Suche (Kosinus-Ähnlichkeit als Skalarprodukt).
+    """
+    treffer = finde_relevante_faelle(user_query, faelle, _modell, fall_index, top_k=1)
+    return treffer[0][0] if treffer else None
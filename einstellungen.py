@@ -0,0 +1,164 @@
+# einstellungen.py
+"""
+Zentrale Konfiguration der App.
+Jeder Wert kann über eine Umgebungsvariable mit dem Präfix JURAKI_ überschrieben werden.
+"""
+import os
+
+
+def _env_str(name, standard):
+    return os.environ.get(name, standard)
+
+def _env_int(name, standard):
+    try:
+        return int(os.environ[name])
+    except (KeyError, ValueError):
+        return standard
+
+def _env_float(name, standard):
+    try:
+        return float(os.environ[name])
+    except (KeyError, ValueError):
+        return standard
+
+def _env_bool(name, standard):
+    wert = os.environ.get(name)
+    if wert is None:
+        return standard
+    return wert.strip().lower() in ("1", "true", "ja", "yes", "on")
+
+
+# --- EMBEDDINGS ---
+EMBEDDING_MODELL_NAME = _env_str("JURAKI_EMBEDDING_MODELL", "paraphrase-multilingual-MiniLM-L12-v2")
+# Verzeichnis für die persistente Embedding-Matrix (memory-mapped) samt Manifest
+EMBEDDING_SPEICHER_VERZEICHNIS = _env_str("JURAKI_EMBEDDING_SPEICHER", ".embedding_speicher")
+# "float32" oder "float16" (halbiert den Plattenbedarf, wird beim Laden hochkonvertiert)
+EMBEDDING_SPEICHER_DTYPE = _env_str("JURAKI_EMBEDDING_DTYPE", "float32")
+# Inferenz-Backend: "torch", "int8" (dynamisch quantisiert), "onnx" oder "onnx-int8"
+EMBEDDING_BACKEND = _env_str("JURAKI_EMBEDDING_BACKEND", "torch")
+# Intra-Op-Threads für die Inferenz; 0 = Standard der Bibliothek (alle Kerne)
+EMBEDDING_THREADS = _env_int("JURAKI_EMBEDDING_THREADS", 0)
+# Quantisierter ONNX-Graph im Modell-Repository, der für "onnx-int8" geladen wird
+EMBEDDING_ONNX_INT8_DATEI = _env_str("JURAKI_EMBEDDING_ONNX_INT8_DATEI", "onnx/model_quint8_avx2.onnx")
+
+# --- FALLDATENBANK ---
+# JSON-Datei, JSONL-Datei (ein Fall pro Zeile) oder Verzeichnis mit Shards (*.json / *.jsonl)
+FALLDATENBANK = _env_str("JURAKI_FALLDATENBANK", "zivilrecht-faelle-json.json")
+# So oft wird die Quelle auf Änderungen geprüft und der Index ggf. neu aufgebaut; 0 = nie
+FALL_SPEICHER_PRUEF_INTERVALL_S = _env_float("JURAKI_FALL_SPEICHER_PRUEF_INTERVALL_S", 5.0)
+
+# --- RETRIEVAL ---
+# Anzahl der Fälle, die pro Anfrage höchstens zurückgegeben werden
+RETRIEVAL_TOP_K = _env_int("JURAKI_RETRIEVAL_TOP_K", 3)
+# Minimale Kosinus-Ähnlichkeit, ab der ein Fall als relevant gilt
+RETRIEVAL_MIN_SCORE = _env_float("JURAKI_RETRIEVAL_MIN_SCORE", 0.4)
+# "auto", "bruteforce", "ivf" oder "hnsw"
+RETRIEVAL_BACKEND = _env_str("JURAKI_RETRIEVAL_BACKEND", "auto")
+# Ab dieser Fallzahl wählt "auto" einen ANN-Index statt der exakten Suche
+RETRIEVAL_ANN_SCHWELLE = _env_int("JURAKI_RETRIEVAL_ANN_SCHWELLE", 50_000)
+# "hybrid" (Abschnitts-Embeddings + BM25, RRF-Fusion) oder "vektor" (nur zentrales_problem)
+RETRIEVAL_MODUS = _env_str("JURAKI_RETRIEVAL_MODUS", "hybrid")
+# Zeitbudget für Anfrage-Embedding plus Suche; danach wird nur mit BM25 geantwortet
+RETRIEVAL_BUDGET_MS = _env_float("JURAKI_RETRIEVAL_BUDGET_MS", 250)
+HYBRID_RRF_K = _env_int("JURAKI_HYBRID_RRF_K", 60)
+# Mindestanteil des maximal möglichen BM25-Scores, ab dem ein reiner Texttreffer als relevant gilt
+HYBRID_BM25_MIN_ANTEIL = _env_float("JURAKI_HYBRID_BM25_MIN_ANTEIL", 0.35)
+# Kandidaten pro Verfahren, die in die Fusion eingehen
+HYBRID_KANDIDATEN = _env_int("JURAKI_HYBRID_KANDIDATEN", 20)
+# Längere Felder werden an Satzgrenzen in Abschnitte dieser Länge geteilt
+HYBRID_ABSCHNITT_MAX_ZEICHEN = _env_int("JURAKI_HYBRID_ABSCHNITT_MAX_ZEICHEN", 300)
+
+# --- KONTEXT (Zusammenstellung des RAG-Prompts) ---
+# So viele Treffer der Suche kommen als Kontext in Frage
+KONTEXT_TOP_K = _env_int("JURAKI_KONTEXT_TOP_K", 3)
+# Höchstzahl an Tokens für den Kontext-Teil des Prompts (gezählt mit dem Tokenizer des Embedding-Modells)
+KONTEXT_TOKEN_BUDGET = _env_int("JURAKI_KONTEXT_TOKEN_BUDGET", 600)
+# Ab diesem Überlappungsgrad der Wörter gilt ein Feld als Dublette eines bereits gewählten
+KONTEXT_DUPLIKAT_SCHWELLE = _env_float("JURAKI_KONTEXT_DUPLIKAT_SCHWELLE", 0.8)
+
+# --- GESPRÄCHSVERLAUF (Chatbot) ---
+# So viele Runden (Frage + Antwort) gehen wörtlich in Retrieval und Prompt ein
+CHAT_FENSTER_RUNDEN = _env_int("JURAKI_CHAT_FENSTER_RUNDEN", 4)
+# Ältere Runden werden zu einer Zusammenfassung dieser Höchstlänge verdichtet
+CHAT_ZUSAMMENFASSUNG_MAX_ZEICHEN = _env_int("JURAKI_CHAT_ZUSAMMENFASSUNG_MAX_ZEICHEN", 1200)
+# So viele ältere Nachrichten bleiben für die Anzeige erhalten
+CHAT_ARCHIV_MAX_NACHRICHTEN = _env_int("JURAKI_CHAT_ARCHIV_MAX_NACHRICHTEN", 200)
+# Ältere Nachrichten pro Seite in der Anzeige
+CHAT_SEITENGROESSE = _env_int("JURAKI_CHAT_SEITENGROESSE", 10)
+
+# --- EMBEDDING-DIENST (Micro-Batching der Anfrage-Embeddings) ---
+EMBEDDING_BATCH_GROESSE = _env_int("JURAKI_EMBEDDING_BATCH_GROESSE", 32)
+# Wie lange der Dienst nach der ersten Anfrage auf weitere wartet, bevor er kodiert
+EMBEDDING_BATCH_WARTEZEIT_MS = _env_float("JURAKI_EMBEDDING_BATCH_WARTEZEIT_MS", 10)
+
+# --- SEMANTISCHER ANTWORT-CACHE (Chatbot) ---
+# Ab dieser Kosinus-Ähnlichkeit gilt eine Frage als Duplikat einer bereits beantworteten
+ANTWORT_CACHE_SCHWELLE = _env_float("JURAKI_ANTWORT_CACHE_SCHWELLE", 0.95)
+ANTWORT_CACHE_MAX_EINTRAEGE = _env_int("JURAKI_ANTWORT_CACHE_MAX_EINTRAEGE", 2000)
+ANTWORT_CACHE_TTL_SEKUNDEN = _env_int("JURAKI_ANTWORT_CACHE_TTL_SEKUNDEN", 3600)
+ANTWORT_CACHE_MAX_MB = _env_int("JURAKI_ANTWORT_CACHE_MAX_MB", 64)
+
+# --- FALL-POOL (vorgenerierte Fälle) ---
+FALL_POOL_DATEI = _env_str("JURAKI_FALL_POOL_DATEI", ".fall_pool.json")
+# So viele fertige Fälle werden pro (Schwierigkeit, Tags)-Kombination vorgehalten
+FALL_POOL_ZIELGROESSE = _env_int("JURAKI_FALL_POOL_ZIELGROESSE", 2)
+# Maximal gleichzeitig laufende Hintergrund-Generierungen
+FALL_POOL_MAX_PARALLEL = _env_int("JURAKI_FALL_POOL_MAX_PARALLEL", 2)
+
+# --- BEWERTUNGS-CACHE (Klausurbewertungen auf der Platte) ---
+BEWERTUNGS_CACHE_VERZEICHNIS = _env_str("JURAKI_BEWERTUNGS_CACHE", ".bewertungs_cache")
+BEWERTUNGS_CACHE_MAX_EINTRAEGE = _env_int("JURAKI_BEWERTUNGS_CACHE_MAX_EINTRAEGE", 5000)
+BEWERTUNGS_CACHE_MAX_MB = _env_int("JURAKI_BEWERTUNGS_CACHE_MAX_MB", 100)
+# So lange wartet eine identische Einreichung höchstens auf die bereits laufende Bewertung
+BEWERTUNGS_CACHE_WARTEZEIT_S = _env_float("JURAKI_BEWERTUNGS_CACHE_WARTEZEIT_S", 300.0)
+
+# --- BEWERTUNG (Klausurlösungen) ---
+# Ein kleiner Gemini-Aufruf pro Bewertungsdimension, gleichzeitig, plus lokale Strukturbewertung;
+# 0 = ein einziger Aufruf für das ganze Feedback
+BEWERTUNG_PARALLEL = _env_bool("JURAKI_BEWERTUNG_PARALLEL", True)
+# Threads, die (über alle Sessions) auf Dimensions-Aufrufe warten; die Drosselung übernimmt das Gateway
+BEWERTUNG_THREADS = _env_int("JURAKI_BEWERTUNG_THREADS", 16)
+
+# --- LERN-SPEICHER (Lernhistorie, Erfolge, Profile) ---
+LERN_SPEICHER_BACKEND = _env_str("JURAKI_LERN_SPEICHER_BACKEND", "sqlite")
+# Für SQLite der Dateipfad der Datenbank
+LERN_SPEICHER_ZIEL = _env_str("JURAKI_LERN_SPEICHER_ZIEL", "lernfortschritt.db")
+
+# --- DASHBOARD ---
+# Zeilen pro Seite in der Tabelle "Letzte bearbeitete Fälle"
+DASHBOARD_SEITENGROESSE = _env_int("JURAKI_DASHBOARD_SEITENGROESSE", 20)
+
+# --- GEMINI ---
+GEMINI_MODELL = _env_str("JURAKI_GEMINI_MODELL", "gemini-1.5-pro-latest")
+
+# --- LLM-GATEWAY (gemeinsame Drosselung aller Gemini-Aufrufe) ---
+# Maximal gleichzeitig laufende Aufrufe im ganzen Prozess
+GATEWAY_MAX_PARALLEL = _env_int("JURAKI_GATEWAY_MAX_PARALLEL", 8)
+# Token-Bucket: dauerhafte Anfragerate pro Sekunde und erlaubter Burst
+GATEWAY_RATE_PRO_S = _env_float("JURAKI_GATEWAY_RATE_PRO_S", 5.0)
+GATEWAY_BURST = _env_int("JURAKI_GATEWAY_BURST", 10)
+# Versuche pro Aufruf; Wiederholungen insgesamt höchstens dieser Anteil der Anfragen
+GATEWAY_MAX_VERSUCHE = _env_int("JURAKI_GATEWAY_MAX_VERSUCHE", 3)
+GATEWAY_RETRY_BUDGET = _env_float("JURAKI_GATEWAY_RETRY_BUDGET", 0.2)
+GATEWAY_TIMEOUT_S = _env_float("JURAKI_GATEWAY_TIMEOUT_S", 120.0)
+# Circuit Breaker: nach so vielen Fehlern in Folge wird für die Pause sofort abgelehnt
+GATEWAY_BREAKER_SCHWELLE = _env_int("JURAKI_GATEWAY_BREAKER_SCHWELLE", 5)
+GATEWAY_BREAKER_PAUSE_S = _env_float("JURAKI_GATEWAY_BREAKER_PAUSE_S", 30.0)
+
+# --- MESSUNG (Spans, Metriken, Traces) ---
+# Dauer-Histogramme und Zähler im heißen Pfad; 0 schaltet alle Messpunkte ab
+MESSUNG_AKTIV = _env_bool("JURAKI_MESSUNG", True)
+# Anteil der Anfragen, für die vollständige Traces (Span-IDs, Attribute) erfasst werden
+MESSUNG_TRACE_RATE = _env_float("JURAKI_MESSUNG_TRACE_RATE", 0.01)
+# Gesampelte Spans an den OpenTelemetry-Tracer übergeben (benötigt opentelemetry-api/-sdk)
+MESSUNG_OTEL = _env_bool("JURAKI_MESSUNG_OTEL", False)
+# So viele gesampelte Spans hält der Ringpuffer ohne OpenTelemetry
+MESSUNG_SPAN_PUFFER = _env_int("JURAKI_MESSUNG_SPAN_PUFFER", 2000)
+# Port für /metrics im Prometheus-Textformat; 0 = kein HTTP-Server
+MESSUNG_METRIK_PORT = _env_int("JURAKI_MESSUNG_METRIK_PORT", 0)
+
+# --- START (Kaltstart der App) ---
+# Embedding-Modell und Suchindex nach dem ersten Seitenaufbau im Hintergrund laden
+VORWAERMEN = _env_bool("JURAKI_VORWAERMEN", True)
+# Import- und Stufenzeiten messen und in der Seitenleiste anzeigen
+STARTPROFIL = _env_bool("JURAKI_STARTPROFIL", False)
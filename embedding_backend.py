@@ -0,0 +1,57 @@
+# embedding_backend.py
+"""
+Austauschbare Inferenz-Backends für das Embedding-Modell (nur CPU).
+
+- "torch":      SentenceTransformer in voller Genauigkeit (bisheriges Verhalten)
+- "int8":       dieselben Gewichte, Linear-Schichten per dynamischer int8-Quantisierung
+- "onnx":       ONNX Runtime über das ONNX-Backend von sentence-transformers
+- "onnx-int8":  ONNX Runtime mit einem vorquantisierten int8-Graphen aus dem Modell-Repository
+
+Alle Backends liefern ein Objekt mit der gewohnten `encode`-API. Da sich die Vektoren
+minimal unterscheiden, bekommt jedes Backend außer "torch" eine eigene Kennung im
+Embedding-Speicher.
+"""
+BACKENDS = ("torch", "int8", "onnx", "onnx-int8")
+
+
+def modell_kennung(modell_name, backend):
+    """Name, unter dem die Fall-Embeddings eines Backends gespeichert werden."""
+    return modell_name if backend == "torch" else f"{modell_name}@{backend}"
+
+
+def _setze_torch_threads(threads):
+    if threads > 0:
+        import torch
+        torch.set_num_threads(threads)
+
+
+def lade_sentence_transformer(modell_name, backend="torch", threads=0, onnx_datei=None):
+    """
+    Lädt das Modell mit dem gewünschten Backend.
+    `threads` > 0 begrenzt die Intra-Op-Threads (torch bzw. ONNX Runtime), 0 = Bibliotheksstandard.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unbekanntes Embedding-Backend: {backend} (erlaubt: {', '.join(BACKENDS)})")
+    from sentence_transformers import SentenceTransformer
+
+    if backend in ("torch", "int8"):
+        _setze_torch_threads(threads)
+        modell = SentenceTransformer(modell_name, device="cpu")
+        if backend == "int8":
+            import torch
+            from torch.ao.quantization import quantize_dynamic
+            quantize_dynamic(modell, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        return modell
+
+    model_kwargs = {"provider": "CPUExecutionProvider"}
+    if threads > 0:
+        import onnxruntime
+        optionen = onnxruntime.SessionOptions()
+        optionen.intra_op_num_threads = threads
+        optionen.inter_op_num_threads = 1
+        model_kwargs["session_options"] = optionen
+    if backend == "onnx-int8":
+        model_kwargs["file_name"] = onnx_datei
+    # Die Tokenisierung läuft weiterhin über torch/transformers; auch dort die Threads begrenzen
+    _setze_torch_threads(threads)
+    return SentenceTransformer(modell_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
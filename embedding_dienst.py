@@ -0,0 +1,124 @@
+# embedding_dienst.py
+"""
+Gemeinsamer Embedding-Dienst mit Micro-Batching.
+
+Streamlit bedient jede Session in einem eigenen Thread. Statt dass jede Chat-Nachricht
+das Modell einzeln aufruft, sammelt ein Hintergrund-Thread gleichzeitige Anfragen für ein
+kurzes Zeitfenster (oder bis die Batch-Größe erreicht ist) und kodiert sie in einem
+einzigen Forward-Pass. Die Aufrufer warten jeweils auf ihr eigenes Future.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class EmbeddingBatcher:
+    """
+    Verhält sich nach außen wie das SentenceTransformer-Modell (`encode`).
+    Einzelne Strings laufen über den Batch-Thread, Listen gehen direkt an das Modell.
+    """
+
+    def __init__(self, modell, max_batch_groesse=32, max_wartezeit_ms=10):
+        self.modell = modell
+        self.max_batch_groesse = max(1, max_batch_groesse)
+        self.max_wartezeit = max(0.0, max_wartezeit_ms / 1000)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        # Metriken
+        self._anzahl_anfragen = 0
+        self._anzahl_batches = 0
+        self._summe_batch_groesse = 0
+        self._max_queue_tiefe = 0
+        self._letzte_batch_groesse = 0
+
+    def __getattr__(self, name):
+        # Alles außer encode (z.B. tokenizer, get_sentence_embedding_dimension) reicht direkt durch
+        if name == "modell":
+            raise AttributeError(name)
+        return getattr(self.modell, name)
+
+    def _starte_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._arbeite, name="embedding-batcher", daemon=True)
+                self._thread.start()
+
+    # --- Öffentliche API ---
+
+    def encode(self, texte, **kwargs):
+        """Kodiert einen String (gebündelt mit parallelen Anfragen) oder eine Liste von Strings."""
+        if not isinstance(texte, str):
+            return self.modell.encode(texte, **kwargs)
+        vektor = self.encode_einzeln(texte)
+        if kwargs.get("convert_to_tensor"):
+            import torch
+            return torch.from_numpy(vektor)
+        return vektor
+
+    def encode_async(self, text):
+        """Stellt einen Text in die Warteschlange und gibt sofort ein Future auf seinen Vektor zurück."""
+        self._starte_thread()
+        future = Future()
+        self._queue.put((text, future))
+        tiefe = self._queue.qsize()
+        with self._lock:
+            self._anzahl_anfragen += 1
+            self._max_queue_tiefe = max(self._max_queue_tiefe, tiefe)
+        return future
+
+    def encode_einzeln(self, text):
+        """Stellt einen Text in die Warteschlange und blockiert, bis sein Vektor vorliegt."""
+        return self.encode_async(text).result()
+
+    def metriken(self):
+        """Momentaufnahme von Warteschlangentiefe und Batch-Füllgrad."""
+        with self._lock:
+            batches = self._anzahl_batches
+            mittlere_groesse = self._summe_batch_groesse / batches if batches else 0.0
+            return {
+                "queue_tiefe": self._queue.qsize(),
+                "max_queue_tiefe": self._max_queue_tiefe,
+                "anfragen": self._anzahl_anfragen,
+                "batches": batches,
+                "letzte_batch_groesse": self._letzte_batch_groesse,
+                "mittlere_batch_groesse": mittlere_groesse,
+                "batch_fuellgrad": mittlere_groesse / self.max_batch_groesse,
+            }
+
+    # --- Hintergrund-Thread ---
+
+    def _sammle_batch(self):
+        batch = [self._queue.get()]
+        frist = time.monotonic() + self.max_wartezeit
+        while len(batch) < self.max_batch_groesse:
+            rest = frist - time.monotonic()
+            try:
+                # Bereits wartende Anfragen immer mitnehmen, danach höchstens bis zur Frist warten
+                batch.append(self._queue.get(timeout=rest) if rest > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _arbeite(self):
+        while True:
+            batch = self._sammle_batch()
+            futures = [f for _, f in batch]
+            try:
+                vektoren = np.asarray(
+                    self.modell.encode([t for t, _ in batch], convert_to_numpy=True, show_progress_bar=False),
+                    dtype=np.float32,
+                )
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            with self._lock:
+                self._anzahl_batches += 1
+                self._summe_batch_groesse += len(batch)
+                self._letzte_batch_groesse = len(batch)
+            for future, vektor in zip(futures, vektoren):
+                future.set_result(vektor)
@@ -0,0 +1,142 @@
+# embedding_speicher.py
+"""
+Persistenter Speicher für Fall-Embeddings.
+
+Die Vektoren liegen als .npy-Matrix auf der Platte und werden per Memory-Mapping geladen.
+Ein Manifest ordnet jeder Zeile den SHA-256-Hash ihres Textes zu. Beim Start werden nur
+neue oder geänderte Texte kodiert, alles andere kommt direkt aus der Matrix. Die Zeilen werden
+schon beim Schreiben L2-normalisiert, damit der Suchindex die gemappte Matrix direkt nutzen kann.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+import numpy as np
+
+from dateien import schreibe_atomar
+from vektor_suche import normalisiere
+
+MANIFEST_VERSION = 2  # 2: Zeilen normalisiert gespeichert
+ERLAUBTE_DTYPES = ("float32", "float16")
+
+
+def text_hash(text):
+    """Stabiler Inhalts-Hash eines Textes."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingSpeicher:
+    """Memory-mapped Embedding-Matrix mit Manifest, getrennt nach Modellname."""
+
+    def __init__(self, verzeichnis, modell_name, dtype="float32"):
+        if dtype not in ERLAUBTE_DTYPES:
+            raise ValueError(f"Nicht unterstützter dtype für den Embedding-Speicher: {dtype}")
+        self.modell_name = modell_name
+        self.dtype = dtype
+        # Ein Unterverzeichnis pro Modell: ein Modellwechsel invalidiert nie fremde Vektoren
+        sicherer_name = re.sub(r"[^A-Za-z0-9_.-]", "_", modell_name)
+        self.verzeichnis = os.path.join(verzeichnis, sicherer_name)
+        self.manifest_pfad = os.path.join(self.verzeichnis, "manifest.json")
+
+    # --- Manifest ---
+
+    def _lade_manifest(self):
+        try:
+            with open(self.manifest_pfad, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if (manifest.get("version") != MANIFEST_VERSION
+                or manifest.get("modell") != self.modell_name
+                or manifest.get("dtype") != self.dtype):
+            return None
+        if not os.path.exists(os.path.join(self.verzeichnis, manifest.get("matrix_datei", ""))):
+            return None
+        return manifest
+
+    def _oeffne_matrix(self, manifest):
+        matrix = np.load(os.path.join(self.verzeichnis, manifest["matrix_datei"]), mmap_mode="r")
+        if self.dtype == "float16":
+            # Rechnen immer in float32; die Platte bleibt halb so groß
+            return np.asarray(matrix, dtype=np.float32)
+        return matrix
+
+    # --- Öffentliche API ---
+
+    def lade_oder_erstelle(self, texte, modell):
+        """
+        Gibt die Embedding-Matrix (float32, eine Zeile der Länge 1 pro Text) zurück.
+        Texte, deren Hash schon im Manifest steht, werden nicht erneut kodiert.
+        """
+        hashes = [text_hash(t) for t in texte]
+        manifest = self._lade_manifest()
+
+        if manifest is not None and manifest["hashes"] == hashes:
+            return self._oeffne_matrix(manifest)
+
+        bekannte_zeilen = {}
+        alte_matrix = None
+        if manifest is not None:
+            bekannte_zeilen = {h: i for i, h in enumerate(manifest["hashes"])}
+            alte_matrix = self._oeffne_matrix(manifest)
+
+        neue_indizes = [i for i, h in enumerate(hashes) if h not in bekannte_zeilen]
+        neue_vektoren = None
+        if neue_indizes:
+            neue_vektoren = normalisiere(
+                modell.encode([texte[i] for i in neue_indizes], convert_to_numpy=True, show_progress_bar=False))
+
+        if neue_vektoren is not None:
+            dimension = neue_vektoren.shape[1]
+        elif alte_matrix is not None:
+            dimension = alte_matrix.shape[1]
+        else:
+            dimension = 0
+
+        matrix = np.empty((len(texte), dimension), dtype=np.float32)
+        alte_paare = [(i, bekannte_zeilen[h]) for i, h in enumerate(hashes) if h in bekannte_zeilen]
+        if alte_paare:
+            ziel, quelle = zip(*alte_paare)
+            matrix[list(ziel)] = alte_matrix[list(quelle)]
+        if neue_indizes:
+            matrix[neue_indizes] = neue_vektoren
+
+        self._speichere(matrix, hashes, manifest)
+        return matrix
+
+    def _speichere(self, matrix, hashes, altes_manifest):
+        os.makedirs(self.verzeichnis, exist_ok=True)
+        # Versionierter Dateiname: Prozesse, die noch die alte Matrix gemappt haben, lesen ungestört weiter
+        version = hashlib.sha256("".join(hashes).encode("ascii")).hexdigest()[:16]
+        matrix_datei = f"vektoren-{version}.npy"
+        matrix_pfad = os.path.join(self.verzeichnis, matrix_datei)
+
+        fd, tmp_pfad = tempfile.mkstemp(dir=self.verzeichnis, suffix=".npy.tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, matrix.astype(self.dtype, copy=False))
+            os.replace(tmp_pfad, matrix_pfad)
+        except BaseException:
+            if os.path.exists(tmp_pfad):
+                os.remove(tmp_pfad)
+            raise
+
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "modell": self.modell_name,
+            "dtype": self.dtype,
+            "dimension": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+            "anzahl": len(hashes),
+            "matrix_datei": matrix_datei,
+            "hashes": hashes,
+        }
+        schreibe_atomar(self.manifest_pfad, json.dumps(manifest).encode("utf-8"))
+
+        if altes_manifest is not None and altes_manifest["matrix_datei"] != matrix_datei:
+            try:
+                os.remove(os.path.join(self.verzeichnis, altes_manifest["matrix_datei"]))
+            except OSError:
+                # Unter Windows kann eine noch gemappte Datei nicht gelöscht werden; beim nächsten Lauf erneut
+                pass
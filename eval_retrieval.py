@@ -0,0 +1,129 @@
+# eval_retrieval.py
+"""
+Offline-Evaluation der Fallsuche auf einem kleinen, von Hand annotierten Anfrageset
+(retrieval_eval_anfragen.json: Anfrage -> relevante fall_titel).
+
+Aufruf:
+    python eval_retrieval.py                       # echtes Embedding-Modell, alle Modi
+    python eval_retrieval.py --hash-modell         # ohne Modell-Download (nur BM25 aussagekräftig)
+    python eval_retrieval.py --modi vektor hybrid --min-score 0.4
+
+Modi:
+    vektor      bisheriges Verfahren: ein Embedding pro Fall (zentrales_problem)
+    abschnitte  Abschnitts-Embeddings aller Felder, bester Abschnitt zählt
+    bm25        nur BM25 mit Paragraphen-Tokens
+    hybrid      Abschnitte + BM25, RRF-Fusion (Standard der App)
+
+Gemessen werden Recall@1 und Recall@3 (mindestens ein relevanter Fall unter den ersten k),
+MRR, der Anteil der Anfragen mit überhaupt einem Kontextfall über der Relevanzschwelle
+("grounded") sowie p50/p95 der Suchlatenz inklusive Anfrage-Embedding.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from einstellungen import (
+    EMBEDDING_MODELL_NAME, EMBEDDING_BACKEND, EMBEDDING_THREADS, EMBEDDING_ONNX_INT8_DATEI,
+    RETRIEVAL_MIN_SCORE, HYBRID_RRF_K, HYBRID_BM25_MIN_ANTEIL, HYBRID_KANDIDATEN, HYBRID_ABSCHNITT_MAX_ZEICHEN,
+)
+from hybrid_suche import HybridIndex, zerlege_fall
+from vektor_suche import baue_index
+
+FALLDATENBANK = "zivilrecht-faelle-json.json"
+ANFRAGEN = "retrieval_eval_anfragen.json"
+MODI = ("vektor", "abschnitte", "bm25", "hybrid")
+
+
+def lade_modell(hash_modell):
+    if hash_modell:
+        from lasttest import HashEmbeddingModell
+        return HashEmbeddingModell(latenz_ms=0)
+    from embedding_backend import lade_sentence_transformer
+    return lade_sentence_transformer(EMBEDDING_MODELL_NAME, EMBEDDING_BACKEND, EMBEDDING_THREADS,
+                                     onnx_datei=EMBEDDING_ONNX_INT8_DATEI)
+
+
+def baue_suchen(faelle, modell, min_score):
+    """Suchfunktion pro Modus: Anfrage -> Liste von Fallindizes (absteigend relevant)."""
+    fall_index = baue_index(modell.encode([f.get("zentrales_problem", "") for f in faelle], convert_to_numpy=True),
+                            backend="bruteforce")
+    abschnitte = [(i, text) for i, fall in enumerate(faelle) for _, text in zerlege_fall(fall, HYBRID_ABSCHNITT_MAX_ZEICHEN)]
+    abschnitt_index = baue_index(modell.encode([text for _, text in abschnitte], convert_to_numpy=True),
+                                 backend="bruteforce")
+    hybrid = HybridIndex(faelle, [i for i, _ in abschnitte], abschnitt_index, rrf_k=HYBRID_RRF_K,
+                         bm25_min_anteil=HYBRID_BM25_MIN_ANTEIL, kandidaten=HYBRID_KANDIDATEN)
+
+    def vektor(anfrage, k):
+        return [f for f, _ in fall_index.suche(modell.encode(anfrage, convert_to_numpy=True), top_k=k, min_score=min_score)]
+
+    def abschnitte_suche(anfrage, k):
+        return [f for f, _ in hybrid.suche(modell.encode(anfrage, convert_to_numpy=True), top_k=k, min_score=min_score)]
+
+    def bm25(anfrage, k):
+        return [f for f, _ in hybrid.suche_hybrid(anfrage, None, top_k=k, min_score=min_score)]
+
+    def hybrid_suche(anfrage, k):
+        return [f for f, _ in hybrid.suche_hybrid(anfrage, modell.encode(anfrage, convert_to_numpy=True),
+                                                  top_k=k, min_score=min_score)]
+
+    return {"vektor": vektor, "abschnitte": abschnitte_suche, "bm25": bm25, "hybrid": hybrid_suche}
+
+
+def bewerte(suche, anfragen, titel, top_k):
+    treffer_1 = treffer_3 = grounded = 0
+    reziproke_raenge, latenzen, fehler = [], [], []
+    for eintrag in anfragen:
+        relevant = set(eintrag["relevant"])
+        start = time.perf_counter()
+        ergebnis = [titel[f] for f in suche(eintrag["anfrage"], top_k)]
+        latenzen.append(time.perf_counter() - start)
+
+        grounded += bool(ergebnis)
+        treffer_1 += bool(relevant & set(ergebnis[:1]))
+        treffer_3 += bool(relevant & set(ergebnis[:3]))
+        rang = next((r for r, t in enumerate(ergebnis, start=1) if t in relevant), None)
+        reziproke_raenge.append(1 / rang if rang else 0.0)
+        if not rang or rang > 1:
+            fehler.append((eintrag["anfrage"], ergebnis[:1]))
+    n = len(anfragen)
+    return {
+        "recall@1": treffer_1 / n,
+        "recall@3": treffer_3 / n,
+        "mrr": float(np.mean(reziproke_raenge)),
+        "grounded": grounded / n,
+        "p50_ms": float(np.percentile(latenzen, 50) * 1000),
+        "p95_ms": float(np.percentile(latenzen, 95) * 1000),
+    }, fehler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modi", nargs="+", default=list(MODI), choices=MODI)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--min-score", type=float, default=RETRIEVAL_MIN_SCORE)
+    parser.add_argument("--hash-modell", action="store_true", help="Hash-Embedding statt MiniLM (lasttest.py)")
+    parser.add_argument("--fehler", action="store_true", help="Anfragen ohne Treffer auf Rang 1 ausgeben")
+    args = parser.parse_args()
+
+    with open(FALLDATENBANK, encoding="utf-8") as f:
+        faelle = json.load(f)
+    with open(ANFRAGEN, encoding="utf-8") as f:
+        anfragen = json.load(f)
+    titel = [fall["fall_titel"] for fall in faelle]
+    suchen = baue_suchen(faelle, lade_modell(args.hash_modell), args.min_score)
+
+    print(f"{len(anfragen)} Anfragen, {len(faelle)} Fälle, Relevanzschwelle {args.min_score}")
+    print(f"{'Modus':>11} {'R@1':>6} {'R@3':>6} {'MRR':>6} {'grounded':>9} {'p50 ms':>7} {'p95 ms':>7}")
+    for modus in args.modi:
+        m, fehler = bewerte(suchen[modus], anfragen, titel, args.top_k)
+        print(f"{modus:>11} {m['recall@1']:6.2f} {m['recall@3']:6.2f} {m['mrr']:6.2f} {m['grounded']:9.2f} "
+              f"{m['p50_ms']:7.2f} {m['p95_ms']:7.2f}")
+        if args.fehler:
+            for anfrage, oben in fehler:
+                print(f"      {anfrage!r} -> {oben[0] if oben else '—'!r}")
+
+
+if __name__ == "__main__":
+    main()
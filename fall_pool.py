@@ -0,0 +1,139 @@
+# fall_pool.py
+"""
+Vorrat an fertig generierten Fällen pro (Schwierigkeit, Tags)-Kombination.
+
+Ein neuer Fall wird aus dem Vorrat entnommen (O(1)), während ein Thread-Pool mit begrenzter
+Parallelität den Vorrat im Hintergrund wieder auffüllt. Der Vorrat wird nach jeder Änderung
+atomar auf die Platte geschrieben und beim Start wieder geladen.
+"""
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from json_extraktion import FALL_SCHEMA, ist_gueltig
+
+
+def ist_gueltiger_fall(fall, schwierigkeit=None):
+    """Prüft, ob ein generierter Fall dem Fall-Schema entspricht (und ggf. die Schwierigkeit passt)."""
+    if not ist_gueltig(fall, FALL_SCHEMA):
+        return False
+    return schwierigkeit is None or fall["schwierigkeit"] == schwierigkeit
+
+
+def bucket_schluessel(schwierigkeit, tags):
+    return (int(schwierigkeit), tuple(sorted(tags or [])))
+
+
+class FallPool:
+    """Thread-sicherer Vorrat mit Hintergrund-Nachfüllung."""
+
+    def __init__(self, generator, pfad, zielgroesse=2, max_parallel=2, max_buckets=64):
+        self.generator = generator
+        self.pfad = pfad
+        self.zielgroesse = zielgroesse
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()  # schluessel -> deque, zuletzt genutzte zuletzt
+        self._in_arbeit = {}  # schluessel -> Anzahl laufender Generierungen
+        self._lock = threading.Lock()
+        # Serialisiert Snapshot und Schreiben, damit kein älterer Stand einen neueren überschreibt
+        self._speicher_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="fall-pool")
+        self._lade()
+
+    # --- Öffentliche API ---
+
+    def hole_fall(self, schwierigkeit, tags):
+        """Entnimmt einen fertigen Fall oder gibt None zurück, wenn der Vorrat leer ist."""
+        schluessel = bucket_schluessel(schwierigkeit, tags)
+        with self._lock:
+            bucket = self._bucket(schluessel)
+            fall = bucket.popleft() if bucket else None
+        if fall is not None:
+            self._persistiere()
+        self._fuelle_nach(schluessel)
+        return fall
+
+    def registriere(self, schwierigkeit, tags):
+        """Sorgt dafür, dass für diese Kombination Fälle vorproduziert werden."""
+        self._fuelle_nach(bucket_schluessel(schwierigkeit, tags))
+
+    def fuellstand(self, schwierigkeit, tags):
+        schluessel = bucket_schluessel(schwierigkeit, tags)
+        with self._lock:
+            return len(self._buckets.get(schluessel, ()))
+
+    # --- Intern ---
+
+    def _bucket(self, schluessel):
+        """Muss unter self._lock aufgerufen werden."""
+        if schluessel not in self._buckets:
+            self._buckets[schluessel] = deque()
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(schluessel)
+        return self._buckets[schluessel]
+
+    def _fuelle_nach(self, schluessel):
+        with self._lock:
+            fehlend = self.zielgroesse - len(self._bucket(schluessel)) - self._in_arbeit.get(schluessel, 0)
+            if fehlend <= 0:
+                return
+            self._in_arbeit[schluessel] = self._in_arbeit.get(schluessel, 0) + fehlend
+        for _ in range(fehlend):
+            self._executor.submit(self._generiere, schluessel)
+
+    def _generiere(self, schluessel):
+        schwierigkeit, tags = schluessel
+        try:
+            fall = self.generator(schwierigkeit=schwierigkeit, tags=list(tags))
+        except Exception as e:
+            print(f"Fehler beim Auffüllen des Fall-Pools {schluessel}: {e}")
+            fall = None
+        with self._lock:
+            self._in_arbeit[schluessel] -= 1
+            if ist_gueltiger_fall(fall, schwierigkeit):
+                self._bucket(schluessel).append(fall)
+                gespeichert = True
+            else:
+                gespeichert = False
+        if gespeichert:
+            self._persistiere()
+
+    def _persistiere(self):
+        verzeichnis = os.path.dirname(os.path.abspath(self.pfad))
+        with self._speicher_lock:
+            with self._lock:
+                daten = [
+                    {"schwierigkeit": s, "tags": list(t), "faelle": list(bucket)}
+                    for (s, t), bucket in self._buckets.items() if bucket
+                ]
+            tmp_pfad = None
+            try:
+                fd, tmp_pfad = tempfile.mkstemp(dir=verzeichnis, suffix=".tmp")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(daten, f, ensure_ascii=False)
+                os.replace(tmp_pfad, self.pfad)
+                tmp_pfad = None
+            except OSError as e:
+                print(f"Fall-Pool konnte nicht gespeichert werden: {e}")
+            finally:
+                # Nach einem Fehler beim Schreiben keine .tmp-Dateien liegen lassen
+                if tmp_pfad is not None:
+                    try:
+                        os.unlink(tmp_pfad)
+                    except OSError:
+                        pass
+
+    def _lade(self):
+        try:
+            with open(self.pfad, "r", encoding="utf-8") as f:
+                daten = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        for eintrag in daten:
+            schluessel = bucket_schluessel(eintrag["schwierigkeit"], eintrag["tags"])
+            bucket = self._bucket(schluessel)
+            bucket.extend(f for f in eintrag["faelle"] if ist_gueltiger_fall(f, schluessel[0]))
@@ -0,0 +1,230 @@
+# fall_speicher.py
+"""
+Versionierte, zur Laufzeit nachladbare Falldatenbank.
+
+Quelle ist eine JSON-Datei (Liste von Fällen), eine JSONL-Datei (ein Fall pro Zeile) oder
+ein Verzeichnis mit Shard-Dateien (*.json / *.jsonl, alphabetisch zusammengefügt).
+
+Ein Hintergrund-Thread prüft in festen Abständen Änderungszeit und Größe der Quelldateien.
+Bei einer Änderung wird die Quelle neu gelesen, jeder Datensatz bekommt einen Inhalts-Hash,
+und unveränderte Datensätze werden aus der alten Version übernommen. JSONL-Zeilen werden
+dabei gestreamt und nur geparst, wenn ihr Hash neu ist. Der Suchindex wird neben der
+laufenden Version gebaut (die Embedding-Speicher kodieren nur geänderte Texte) und danach
+mit einer einzigen Zuweisung ausgetauscht. Anfragen, die noch die alte Version halten,
+laufen ungestört mit ihr zu Ende.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+
+from kompakte_datensaetze import Fall
+
+SHARD_ENDUNGEN = (".json", ".jsonl")
+
+
+def fall_hash(fall):
+    """Inhalts-Hash eines Falls, unabhängig von der Reihenfolge der Schlüssel."""
+    kanonisch = json.dumps(fall, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(kanonisch.encode("utf-8")).hexdigest()
+
+
+def quelldateien(quelle):
+    """Die Dateien einer Quelle in Lesereihenfolge."""
+    if os.path.isdir(quelle):
+        return sorted(
+            os.path.join(quelle, name) for name in os.listdir(quelle)
+            if name.endswith(SHARD_ENDUNGEN) and not name.startswith(".")
+        )
+    return [quelle]
+
+
+def quell_signatur(quelle):
+    """Änderungszeit und Größe aller Quelldateien; ändert sich bei jedem Schreibvorgang."""
+    signatur = []
+    for pfad in quelldateien(quelle):
+        stat = os.stat(pfad)
+        signatur.append((pfad, stat.st_mtime_ns, stat.st_size))
+    return tuple(signatur)
+
+
+def lese_datensaetze(quelle, bekannte=None):
+    """
+    Erzeugt (Hash, Fall) für alle Datensätze der Quelle; Fälle sind kompakte `Fall`-Objekte.
+    Fälle, deren Hash in `bekannte` steht, werden von dort übernommen statt neu angelegt;
+    bei JSONL entfällt für sie sogar das Parsen der Zeile.
+    """
+    bekannte = bekannte or {}
+    for pfad in quelldateien(quelle):
+        if pfad.endswith(".jsonl"):
+            with open(pfad, "rb") as f:
+                for nummer, zeile in enumerate(f, start=1):
+                    zeile = zeile.strip()
+                    if not zeile:
+                        continue
+                    h = hashlib.sha256(zeile).hexdigest()
+                    if h in bekannte:
+                        yield h, bekannte[h]
+                        continue
+                    try:
+                        fall = json.loads(zeile)
+                    except json.JSONDecodeError as e:
+                        raise ValueError(f"{pfad}, Zeile {nummer}: {e}") from e
+                    yield h, Fall.aus_dict(fall)
+        else:
+            with open(pfad, "r", encoding="utf-8") as f:
+                daten = json.load(f)
+            for fall in daten if isinstance(daten, list) else [daten]:
+                h = fall_hash(fall)
+                yield h, bekannte[h] if h in bekannte else Fall.aus_dict(fall)
+
+
+def lese_faelle(quelle):
+    """Alle Fälle einer Quelle als Liste (ohne Versionierung)."""
+    return [fall for _, fall in lese_datensaetze(quelle)]
+
+
+@dataclass(frozen=True)
+class FallVersion:
+    """Unveränderlicher Stand der Datenbank: Fälle und passender Index gehören zusammen."""
+    nummer: int
+    faelle: list
+    hashes: tuple
+    fall_index: object
+    signatur: tuple
+    geladen_um: float = field(default_factory=time.time)
+
+    @property
+    def kennung(self):
+        """Kurzer Inhalts-Hash der Version (gleiche Fälle -> gleiche Kennung)."""
+        return hashlib.sha256("".join(self.hashes).encode("ascii")).hexdigest()[:12]
+
+
+class FallSpeicher:
+    """
+    Hält die aktuelle FallVersion und tauscht sie bei Änderungen der Quelle aus.
+    `baue_index(faelle)` erstellt den Suchindex einer neuen Version.
+    """
+
+    def __init__(self, quelle, baue_index, pruef_intervall_s=5.0):
+        self.quelle = quelle
+        self._baue_index = baue_index
+        self.pruef_intervall_s = pruef_intervall_s
+        self._lock = threading.Lock()  # nur ein Neuaufbau zur Zeit
+        self._stop = threading.Event()
+        self._thread = None
+        self._version = None
+        self.letzter_fehler = None
+        self._fehlgeschlagene_signatur = None  # Quelle, deren Indexaufbau scheiterte
+        self.anzahl_neuaufbauten = 0
+        self.letzte_aufbauzeit_s = 0.0
+        self.letzte_geaenderte = 0
+        self.pruefe()
+        if self._version is None:
+            raise FileNotFoundError(self.letzter_fehler or quelle)
+
+    # --- Öffentliche API ---
+
+    def aktuell(self):
+        """Die aktuelle Version; Aufrufer behalten sie für die Dauer ihrer Anfrage."""
+        return self._version
+
+    def pruefe(self):
+        """Lädt die Quelle neu, falls sie sich geändert hat. Gibt True zurück, wenn getauscht wurde."""
+        with self._lock:
+            alt = self._version
+            try:
+                signatur = quell_signatur(self.quelle)
+                if alt is not None and signatur in (alt.signatur, self._fehlgeschlagene_signatur):
+                    return False
+                neu = self._baue_version(alt, signatur)
+            except (OSError, ValueError) as e:
+                # Halb geschriebene oder fehlende Quelle: alte Version bleibt aktiv, nächster Versuch folgt
+                self._merke_fehler("Fehler beim Laden der Falldatenbank", e)
+                return False
+            except Exception as e:
+                if alt is None:
+                    raise
+                # Fehler im Indexaufbau: dieselbe Quelle erst nach ihrer nächsten Änderung erneut versuchen
+                self._fehlgeschlagene_signatur = signatur
+                self._merke_fehler("Fehler beim Neuaufbau des Fallindex", e)
+                return False
+            self.letzter_fehler = None
+            self._fehlgeschlagene_signatur = None
+            self._version = neu
+            return alt is None or neu.nummer != alt.nummer
+
+    def starte_ueberwachung(self):
+        """Startet den Prüf-Thread (idempotent). Ein Intervall <= 0 schaltet ihn ab."""
+        if self.pruef_intervall_s <= 0:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._ueberwache, name="fall-speicher", daemon=True)
+                self._thread.start()
+
+    def stoppe_ueberwachung(self):
+        self._stop.set()
+
+    def statistik(self):
+        version = self._version
+        return {
+            "version": version.nummer,
+            "kennung": version.kennung,
+            "faelle": len(version.faelle),
+            "geladen_um": version.geladen_um,
+            "neuaufbauten": self.anzahl_neuaufbauten,
+            "letzte_aufbauzeit_s": self.letzte_aufbauzeit_s,
+            "letzte_geaenderte": self.letzte_geaenderte,
+            "letzter_fehler": self.letzter_fehler,
+        }
+
+    # --- Intern ---
+
+    def _merke_fehler(self, titel, e):
+        """Merkt sich den Fehler und meldet ihn nur, wenn er sich vom letzten unterscheidet."""
+        fehler = f"{type(e).__name__}: {e}"
+        if fehler != self.letzter_fehler:
+            print(f"{titel}: {fehler}")
+        self.letzter_fehler = fehler
+
+    def _baue_version(self, alt, signatur):
+        start = time.perf_counter()
+        bekannte = dict(zip(alt.hashes, alt.faelle)) if alt is not None else {}
+        hashes, faelle = [], []
+        for h, fall in lese_datensaetze(self.quelle, bekannte):
+            hashes.append(h)
+            faelle.append(fall)
+        hashes = tuple(hashes)
+        if alt is not None and hashes == alt.hashes:
+            # Nur die Dateizeit hat sich geändert: Signatur merken, Index behalten
+            return FallVersion(alt.nummer, alt.faelle, hashes, alt.fall_index, signatur, alt.geladen_um)
+
+        fall_index = self._baue_index(faelle)
+        self.anzahl_neuaufbauten += 1
+        self.letzte_aufbauzeit_s = time.perf_counter() - start
+        self.letzte_geaenderte = sum(h not in bekannte for h in hashes)
+        nummer = alt.nummer + 1 if alt is not None else 1
+        return FallVersion(nummer, faelle, hashes, fall_index, signatur)
+
+    def _ueberwache(self):
+        zuletzt_gesehen = None
+        while not self._stop.wait(self.pruef_intervall_s):
+            try:
+                # Erst neu laden, wenn die Quelle ein Intervall lang unverändert war (Schreibvorgang fertig)
+                signatur = quell_signatur(self.quelle)
+                if signatur in (self._version.signatur, self._fehlgeschlagene_signatur) or signatur != zuletzt_gesehen:
+                    zuletzt_gesehen = signatur
+                    continue
+                if self.pruefe():
+                    v = self._version
+                    print(f"Falldatenbank neu geladen: Version {v.nummer} ({len(v.faelle)} Fälle, "
+                          f"{self.letzte_geaenderte} geändert, {self.letzte_aufbauzeit_s:.2f} s)")
+            except OSError:
+                continue
+            except Exception as e:
+                # Unerwartete Fehler dürfen den Thread nicht beenden
+                self._merke_fehler("Fehler bei der Überwachung der Falldatenbank", e)
@@ -1,4 +1,8 @@
 # gamification_logik.py
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from messung import span
 
 # Definition aller möglichen Erfolge
 # Jeder Erfolg hat eine ID, einen Namen, eine Beschreibung und eine Bedingung.
@@ -30,41 +34,77 @@ ACHIEVEMENTS = {
     }
 }
 
-def check_achievements(lernhistorie, unlocked_achievements):
-    """
-    Überprüft die Lernhistorie auf neue, freigeschaltete Erfolge.
-    Gibt eine Liste der neu freigeschalteten Erfolge zurück.
-    """
-    newly_unlocked = []
-    
-    # Bereits freigeschaltete Erfolge als Set für eine schnelle Überprüfung
-    unlocked_ids = {a['id'] for a in unlocked_achievements}
+# Deklarative Regeln: Erfolg -> (Kennzahl aus LernAggregate, Mindestwert)
+# Ein neuer Erfolg braucht nur eine neue Zeile hier, keinen weiteren Durchlauf über die Historie.
+ACHIEVEMENT_REGELN = {
+    "first_case": ("anzahl", 1),
+    "bgb_beginner": ("anzahl", 5),
+    "high_score": ("max_bewertung", 90),
+    "streak_3": ("anzahl_tage", 3),
+    "exam_ready": ("max_schwierigkeit", 5),
+}
+
+@dataclass
+class LernAggregate:
+    """Laufende Kennzahlen eines Nutzers, die pro neuem Ergebnis in O(1) aktualisiert werden."""
+    anzahl: int = 0
+    max_bewertung: int = 0
+    max_schwierigkeit: int = 0
+    tage: set = field(default_factory=set)
+    aktuelle_serie: int = 0
+    laengste_serie: int = 0
+    letzter_tag: date = None
 
-    # --- Bedingungen für die Erfolge prüfen ---
+    @property
+    def anzahl_tage(self):
+        return len(self.tage)
 
-    # Erfolg: Erster Fall
-    if "first_case" not in unlocked_ids and len(lernhistorie) >= 1:
-        newly_unlocked.append({"id": "first_case", **ACHIEVEMENTS["first_case"]})
+    def aktualisiere(self, ergebnis):
+        self.anzahl += 1
+        self.max_bewertung = max(self.max_bewertung, ergebnis.get('bewertung', 0) or 0)
+        self.max_schwierigkeit = max(self.max_schwierigkeit, ergebnis.get('schwierigkeit', 0) or 0)
+        tag = ergebnis['datum'].date()
+        self.tage.add(tag)
+        # Serie aufeinanderfolgender Tage; nachgetragene ältere Ergebnisse ändern sie nicht
+        if self.letzter_tag is None or tag > self.letzter_tag + timedelta(days=1):
+            self.aktuelle_serie = 1
+        elif tag == self.letzter_tag + timedelta(days=1):
+            self.aktuelle_serie += 1
+        if self.letzter_tag is None or tag > self.letzter_tag:
+            self.letzter_tag = tag
+        self.laengste_serie = max(self.laengste_serie, self.aktuelle_serie)
 
-    # Erfolg: 5 BGB-Fälle
-    if "bgb_beginner" not in unlocked_ids and len(lernhistorie) >= 5:
-        newly_unlocked.append({"id": "bgb_beginner", **ACHIEVEMENTS["bgb_beginner"]})
+    @classmethod
+    def aus_historie(cls, lernhistorie):
+        """Baut die Kennzahlen einmalig aus einer bestehenden Historie auf (z.B. beim Session-Start)."""
+        aggregate = cls()
+        for ergebnis in sorted(lernhistorie, key=lambda e: e['datum']):
+            aggregate.aktualisiere(ergebnis)
+        return aggregate
 
-    # Erfolg: Hohe Punktzahl
-    if "high_score" not in unlocked_ids:
-        if any(e.get('bewertung', 0) >= 90 for e in lernhistorie):
-            newly_unlocked.append({"id": "high_score", **ACHIEVEMENTS["high_score"]})
-    
-    # Erfolg: Schwierigkeit 5
-    if "exam_ready" not in unlocked_ids:
-        if any(e.get('schwierigkeit', 0) == 5 for e in lernhistorie):
-            newly_unlocked.append({"id": "exam_ready", **ACHIEVEMENTS["exam_ready"]})
+def pruefe_regeln(aggregate, unlocked_achievements):
+    """Wertet nur die noch nicht freigeschalteten Regeln gegen die Kennzahlen aus."""
+    unlocked_ids = {a['id'] for a in unlocked_achievements}
+    return [
+        {"id": ach_id, **ACHIEVEMENTS[ach_id]}
+        for ach_id, (kennzahl, mindestwert) in ACHIEVEMENT_REGELN.items()
+        if ach_id not in unlocked_ids and getattr(aggregate, kennzahl) >= mindestwert
+    ]
 
-    # Erfolg: 3-Tage-Serie
-    if "streak_3" not in unlocked_ids and len(lernhistorie) > 0:
-        # Extrahiere die Tage (ohne Uhrzeit) aus der Lernhistorie
-        unique_days = {e['datum'].date() for e in lernhistorie}
-        if len(unique_days) >= 3:
-            newly_unlocked.append({"id": "streak_3", **ACHIEVEMENTS["streak_3"]})
-            
-    return newly_unlocked
+def verarbeite_ergebnis(aggregate, ergebnis, unlocked_achievements):
+    """
+    Ereignisgesteuerte Auswertung: aktualisiert die Kennzahlen um ein neues Ergebnis
+    und gibt die dadurch neu freigeschalteten Erfolge zurück.
+    """
+    with span("check_achievements"):
+        aggregate.aktualisiere(ergebnis)
+        return pruefe_regeln(aggregate, unlocked_achievements)
+
+def check_achievements(lernhistorie, unlocked_achievements):
+    """
+    Überprüft die Lernhistorie auf neue, freigeschaltete Erfolge.
+    Gibt eine Liste der neu freigeschalteten Erfolge zurück.
+    Für wiederholte Aufrufe besser LernAggregate + verarbeite_ergebnis verwenden.
+    """
+    with span("check_achievements", vollstaendig=True):
+        return pruefe_regeln(LernAggregate.aus_historie(lernhistorie), unlocked_achievements)
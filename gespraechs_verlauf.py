@@ -0,0 +1,146 @@
+# gespraechs_verlauf.py
+"""
+Begrenztes Gesprächsgedächtnis für den Chatbot.
+
+- Die letzten N Runden (Frage + Antwort) bleiben wörtlich im Fenster und gehen so in
+  Retrieval und Prompt ein.
+- Nachrichten, die aus dem Fenster fallen, werden im Hintergrund (über den übergebenen
+  `zusammenfasser`, typischerweise ein LLM-Aufruf niedriger Priorität) in eine laufende
+  Zusammenfassung eingearbeitet. Bis diese fertig ist, stehen sie gekürzt im Prompt.
+- Für die Anzeige bleiben ältere Nachrichten in einem Archiv fester Größe, das seitenweise
+  gelesen wird; der Aufwand pro Rerun hängt so nicht von der Länge der Sitzung ab.
+"""
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from messung import mit_kontext, zaehle
+
+# Ein kleiner Pool für alle Sessions; die Aufrufe selbst drosselt das LLM-Gateway
+_zusammenfasser_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="zusammenfassung")
+
+ROLLEN_NAMEN = {"user": "Student", "assistant": "Tutor"}
+
+# Bezüge auf das bisherige Gespräch ("dazu", "dieser Fall", "kann er ...", "wie oben")
+_RUECKBEZUG = re.compile(r"\b(?:dar?(?:zu|von|bei|mit|auf|an|über|für|gegen|aus|in)|hier(?:zu|bei|für)|dies\w*|jene\w*|"
+                         r"er|ihm|ihn|ihnen|oben|vorhin|eben|erwähnt\w*|genannt\w*|vorig\w*)\b", re.IGNORECASE)
+# Anschlussfragen ("Und wenn ...?", "Warum?")
+_ANSCHLUSS = re.compile(r"^\W*(?:und|aber|also|oder|warum|wieso|weshalb)\b", re.IGNORECASE)
+# Kürzere Fragen ("Beispiel?", "Und § 119?") gelten immer als Rückfrage
+MIN_WOERTER_EIGENSTAENDIG = 4
+
+
+def kuerze(text, max_zeichen):
+    """Kürzt an einer Wortgrenze und markiert die Auslassung."""
+    if len(text) <= max_zeichen:
+        return text
+    return text[:max_zeichen].rsplit(" ", 1)[0] + " …"
+
+
+class Gespraechsverlauf:
+    """Fenster der letzten Runden, laufende Zusammenfassung und Archiv für die Anzeige."""
+
+    def __init__(self, fenster_runden=4, archiv_max=200, zusammenfassung_max_zeichen=1200, zusammenfasser=None):
+        self.fenster_runden = fenster_runden
+        self.zusammenfassung_max_zeichen = zusammenfassung_max_zeichen
+        self.zusammenfasser = zusammenfasser
+        self.fenster = []
+        self.archiv = deque(maxlen=archiv_max)
+        self.zusammenfassung = ""
+        self._ausstehend = []       # aus dem Fenster gefallen, noch nicht zusammengefasst
+        self._in_arbeit = 0         # so viele der ausstehenden Nachrichten fasst `_zukunft` zusammen
+        self._zukunft = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.archiv) + len(self.fenster)
+
+    def fuege_hinzu(self, rolle, inhalt):
+        """Neue Nachricht; ältere Runden rücken aus dem Fenster in Zusammenfassung und Archiv."""
+        self.fenster.append({"role": rolle, "content": inhalt})
+        ueberzaehlig = len(self.fenster) - 2 * self.fenster_runden
+        if ueberzaehlig > 0:
+            alt, self.fenster = self.fenster[:ueberzaehlig], self.fenster[ueberzaehlig:]
+            self.archiv.extend(alt)
+            with self._lock:
+                self._ausstehend.extend(alt)
+            self._starte_zusammenfassung()
+
+    # --- Zusammenfassung ---
+
+    def _starte_zusammenfassung(self):
+        with self._lock:
+            if self._zukunft is not None or not self._ausstehend:
+                return
+            if self.zusammenfasser is None:
+                self._uebernehme(self._notfall_zusammenfassung(self._ausstehend), len(self._ausstehend))
+                return
+            bisher, nachrichten = self.zusammenfassung, list(self._ausstehend)
+            self._in_arbeit = len(nachrichten)
+            zukunft = self._zukunft = _zusammenfasser_pool.submit(
+                mit_kontext(lambda: self.zusammenfasser(bisher, nachrichten)))
+        # Außerhalb des Locks: ist die Zukunft schon fertig, läuft der Callback sofort in diesem Thread
+        zukunft.add_done_callback(self._zusammenfassung_fertig)
+
+    def _zusammenfassung_fertig(self, zukunft):
+        try:
+            text = zukunft.result()
+            zaehle("juraki_zusammenfassungen_gesamt", ergebnis="ok")
+        except Exception as e:
+            print(f"Fehler bei der Zusammenfassung des Gesprächs: {e}")
+            zaehle("juraki_zusammenfassungen_gesamt", ergebnis="fehler")
+            text = None
+        with self._lock:
+            nachrichten = self._ausstehend[:self._in_arbeit]
+            self._uebernehme(text or self._notfall_zusammenfassung(nachrichten), self._in_arbeit)
+            self._zukunft = None
+        # Während der Zusammenfassung weitergerückte Nachrichten
+        self._starte_zusammenfassung()
+
+    def _uebernehme(self, text, anzahl):
+        self.zusammenfassung = kuerze(text.strip(), self.zusammenfassung_max_zeichen)
+        del self._ausstehend[:anzahl]
+
+    def _notfall_zusammenfassung(self, nachrichten):
+        """Ohne (funktionierendes) LLM: die Fragen des Studenten gekürzt anhängen, Ende behalten."""
+        fragen = [kuerze(n["content"], 160) for n in nachrichten if n["role"] == "user"]
+        text = " ".join(filter(None, [self.zusammenfassung, *(f"Frage: {f}" for f in fragen)]))
+        return text[-self.zusammenfassung_max_zeichen:]
+
+    # --- Für Retrieval und Prompt ---
+
+    def _vorherige_frage(self):
+        return next((n["content"] for n in reversed(self.fenster) if n["role"] == "user"), None)
+
+    def ist_rueckfrage(self, frage):
+        """Bezieht sich `frage` erkennbar auf das Gespräch? Eigenständige Fragen brauchen den Verlauf nicht."""
+        if self._vorherige_frage() is None:
+            return False
+        return (len(frage.split()) < MIN_WOERTER_EIGENSTAENDIG
+                or bool(_ANSCHLUSS.match(frage) or _RUECKBEZUG.search(frage)))
+
+    def retrieval_text(self, frage, max_zeichen=300):
+        """Bei Rückfragen die Frage plus die vorige Frage aus dem Fenster, damit sie ihr Thema behalten."""
+        if not self.ist_rueckfrage(frage):
+            return frage
+        return f"{kuerze(self._vorherige_frage(), max_zeichen)}\n{frage}"
+
+    def als_prompt_text(self, max_zeichen_pro_nachricht=1500):
+        """Zusammenfassung, noch nicht eingearbeitete Nachrichten (gekürzt) und das Fenster."""
+        with self._lock:
+            zusammenfassung, ausstehend = self.zusammenfassung, list(self._ausstehend)
+        zeilen = []
+        if zusammenfassung:
+            zeilen.append(f"Zusammenfassung des früheren Gesprächs: {zusammenfassung}")
+        zeilen.extend(f"{ROLLEN_NAMEN[n['role']]}: {kuerze(n['content'], 200)}" for n in ausstehend)
+        zeilen.extend(f"{ROLLEN_NAMEN[n['role']]}: {kuerze(n['content'], max_zeichen_pro_nachricht)}"
+                      for n in self.fenster)
+        return "\n".join(zeilen)
+
+    # --- Für die Anzeige ---
+
+    def archiv_seite(self, seite, groesse):
+        """Seite 1 sind die jüngsten archivierten Nachrichten; innerhalb der Seite chronologisch."""
+        ende = len(self.archiv) - (seite - 1) * groesse
+        return [self.archiv[i] for i in range(max(ende - groesse, 0), max(ende, 0))]
@@ -0,0 +1,187 @@
+# hybrid_suche.py
+"""
+Hybride Fallsuche: Vektorsuche über mehrere Felder pro Fall plus BM25 über einen invertierten
+Index, zusammengeführt per Reciprocal Rank Fusion (RRF).
+
+- Jeder Fall wird in Abschnitte zerlegt (Titel, zentrales Problem, Kernfrage, Kurzlösung;
+  lange Felder satzweise in Stücke). Jeder Abschnitt bekommt ein eigenes Embedding, der
+  Fall erhält den besten Abschnitts-Score.
+- Der Tokenizer macht aus Paragraphenzitaten eigene Tokens ("§§ 146, 150 BGB" -> §146, §150),
+  damit Anfragen wie "§ 130 BGB" exakt treffen.
+- Ein Fall gilt als relevant, wenn seine Kosinus-Ähnlichkeit die Schwelle erreicht, BM25
+  einen ausreichenden Anteil der Anfrage abdeckt oder alle zitierten Paragraphen vorkommen.
+"""
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+import numpy as np
+
+FELDER = ("fall_titel", "zentrales_problem", "kernfrage", "kurzloesung")
+# Gewichtung der Felder im BM25-Dokument (Wiederholung der Tokens)
+FELD_GEWICHTE = {"fall_titel": 2, "zentrales_problem": 2, "kernfrage": 1, "kurzloesung": 1}
+
+STOPPWOERTER = frozenset("""
+aber alle als also am an auch auf aus bei bin bis da damit dann das dass dem den der des die
+dies diese dieser doch du durch ein eine einem einen einer eines er es für hat hatte ich ihr im
+in ist ja kann man mit nach nicht noch nur ob oder sich sie sind so über um und uns von vor
+war was wann warum welche welcher welches wenn werden wie wird wir wo zu zum zur gilt gibt
+""".split())
+
+# Paragraphennummer mit optionalem Buchstaben ("312g"), aber nicht "145ff"
+_NUMMER = re.compile(r"\d+(?:[a-z](?![a-z]))?")
+_PARAGRAPHEN = re.compile(rf"(§§?|art\.?)\s*({_NUMMER.pattern}(?:\s*(?:,|und|u\.|/|bis)\s*{_NUMMER.pattern})*)")
+_PARAGRAPH_TOKEN = re.compile(r"(?:§|art)\d")
+_WORT = re.compile(r"\w+")
+_SATZENDE = re.compile(r"(?<=[.!?])\s+")
+
+
+def _paragraph_tokens(text):
+    for treffer in _PARAGRAPHEN.finditer(text):
+        praefix = "§" if treffer.group(1).startswith("§") else "art"
+        yield from (praefix + n for n in _NUMMER.findall(treffer.group(2)))
+
+
+def tokenisiere(text):
+    """Kleingeschriebene Wort-Tokens ohne Stoppwörter plus ein Token pro zitiertem Paragraphen."""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    tokens = list(_paragraph_tokens(text))
+    tokens.extend(w for w in _WORT.findall(text) if len(w) > 1 and w not in STOPPWOERTER)
+    return tokens
+
+
+def zitierte_normen(text):
+    """Menge der zitierten Paragraphen und Artikel als Tokens wie '§433' oder 'art3'."""
+    return set(_paragraph_tokens(unicodedata.normalize("NFKC", text or "").lower()))
+
+
+def zerlege_fall(fall, max_zeichen=300):
+    """Abschnitte (Feld, Text) eines Falls; lange Felder werden an Satzgrenzen geteilt."""
+    abschnitte = []
+    for feld in FELDER:
+        text = (fall.get(feld) or "").strip()
+        if not text:
+            continue
+        stueck = ""
+        for satz in _SATZENDE.split(text):
+            if stueck and len(stueck) + len(satz) > max_zeichen:
+                abschnitte.append((feld, stueck))
+                stueck = satz
+            else:
+                stueck = f"{stueck} {satz}".strip()
+        if stueck:
+            abschnitte.append((feld, stueck))
+    return abschnitte
+
+
+class BM25Index:
+    """Okapi-BM25 über einen invertierten Index (Token -> Dokumente und Häufigkeiten)."""
+
+    def __init__(self, dokumente, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.anzahl = len(dokumente)
+        self.laengen = np.array([len(d) for d in dokumente], dtype=np.float32)
+        # Ohne ein einziges Token (leerer Index, nur leere Dokumente) 1.0, damit suche() nie durch 0 teilt
+        self.mittlere_laenge = float(self.laengen.mean()) if self.laengen.any() else 1.0
+        postings = defaultdict(list)
+        for doc, tokens in enumerate(dokumente):
+            for token, tf in Counter(tokens).items():
+                postings[token].append((doc, tf))
+        self.postings = {
+            token: (np.array([d for d, _ in p], dtype=np.int64), np.array([tf for _, tf in p], dtype=np.float32))
+            for token, p in postings.items()
+        }
+        self.idf = {
+            token: float(np.log(1 + (self.anzahl - len(docs) + 0.5) / (len(docs) + 0.5)))
+            for token, (docs, _) in self.postings.items()
+        }
+
+    def suche(self, query_tokens, top_k=10):
+        """
+        Liste von (Dokument, Score, Anteil), absteigend nach Score. Der Anteil setzt den Score
+        ins Verhältnis zum Maximum, das die bekannten Anfrage-Tokens erreichen könnten (0..1).
+        """
+        tokens = [t for t in dict.fromkeys(query_tokens) if t in self.postings]
+        if not tokens:
+            return []
+        scores = np.zeros(self.anzahl, dtype=np.float32)
+        normierung = self.k1 * (1 - self.b + self.b * self.laengen / self.mittlere_laenge)
+        for token in tokens:
+            docs, tf = self.postings[token]
+            scores[docs] += self.idf[token] * tf * (self.k1 + 1) / (tf + normierung[docs])
+        maximum = sum(self.idf[t] * (self.k1 + 1) for t in tokens)
+        kandidaten = np.flatnonzero(scores)
+        reihenfolge = kandidaten[np.argsort(-scores[kandidaten])][:top_k]
+        return [(int(d), float(scores[d]), float(scores[d] / maximum)) for d in reihenfolge]
+
+    def enthaelt_alle(self, doc, tokens):
+        return all(t in self.postings and doc in self.postings[t][0] for t in tokens)
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Summe von 1 / (k + Rang) über alle Rankings (Rang ab 1); dict Dokument -> Score."""
+    fusion = defaultdict(float)
+    for ranking in rankings:
+        for rang, doc in enumerate(ranking, start=1):
+            fusion[doc] += 1.0 / (k + rang)
+    return fusion
+
+
+class HybridIndex:
+    """
+    Vektorindex über Abschnitte plus BM25 über Fälle.
+    `suche` ist die reine Vektorsuche (gleiche API wie die Indizes aus vektor_suche),
+    `suche_hybrid` nutzt zusätzlich den Anfragetext und kommt auch ohne Vektor aus.
+    """
+    name = "hybrid"
+
+    def __init__(self, faelle, abschnitt_fall, abschnitt_index, rrf_k=60, bm25_min_anteil=0.35, kandidaten=20):
+        self.abschnitt_fall = np.asarray(abschnitt_fall, dtype=np.int64)
+        self.abschnitt_index = abschnitt_index
+        self.anzahl_faelle = len(faelle)
+        self.rrf_k = rrf_k
+        self.bm25_min_anteil = bm25_min_anteil
+        self.kandidaten = kandidaten
+        dokumente = []
+        for fall in faelle:
+            tokens = []
+            for feld in FELDER:
+                tokens.extend(tokenisiere(fall.get(feld, "")) * FELD_GEWICHTE[feld])
+            dokumente.append(tokens)
+        self.bm25 = BM25Index(dokumente)
+
+    def __len__(self):
+        return self.anzahl_faelle
+
+    def _vektor_treffer(self, query_vektor, anzahl):
+        """Fälle nach bestem Abschnitts-Score, absteigend."""
+        abschnitte = self.abschnitt_index.suche(query_vektor, top_k=anzahl * 4, min_score=-1.0)
+        beste = {}
+        for abschnitt, score in abschnitte:
+            fall = int(self.abschnitt_fall[abschnitt])
+            if fall not in beste:
+                beste[fall] = score
+        return list(beste.items())[:anzahl]
+
+    def suche(self, query_vektor, top_k=5, min_score=0.0):
+        return [(f, s) for f, s in self._vektor_treffer(query_vektor, top_k) if s >= min_score]
+
+    def suche_hybrid(self, query_text, query_vektor=None, top_k=5, min_score=0.0):
+        """
+        Liste von (Fall, RRF-Score), absteigend. Ohne `query_vektor` (z.B. Zeitbudget für das
+        Embedding überschritten) zählt nur BM25.
+        """
+        tokens = tokenisiere(query_text)
+        paragraphen = [t for t in tokens if _PARAGRAPH_TOKEN.match(t)]
+        bm25_treffer = self.bm25.suche(tokens, self.kandidaten)
+        vektor_treffer = self._vektor_treffer(query_vektor, self.kandidaten) if query_vektor is not None else []
+
+        relevant = {f for f, s in vektor_treffer if s >= min_score}
+        relevant.update(d for d, _, anteil in bm25_treffer if anteil >= self.bm25_min_anteil)
+        if paragraphen:
+            relevant.update(d for d, _, _ in bm25_treffer if self.bm25.enthaelt_alle(d, paragraphen))
+
+        fusion = reciprocal_rank_fusion([[f for f, _ in vektor_treffer], [d for d, _, _ in bm25_treffer]], k=self.rrf_k)
+        ergebnis = sorted(((f, s) for f, s in fusion.items() if f in relevant), key=lambda x: -x[1])
+        return ergebnis[:top_k]
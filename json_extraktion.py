@@ -0,0 +1,288 @@
+# json_extraktion.py
+"""
+Hilfsfunktionen zum Lesen von JSON aus Modell-Ausgaben.
+
+Der InkrementelleJsonParser verarbeitet eine gestreamte Antwort Stück für Stück und
+meldet jedes Feld des äußersten JSON-Objekts, sobald dessen Wert vollständig ist.
+
+`extrahiere_json` sucht in einer vollständigen Antwort in einem Durchlauf nach dem ersten
+ausgeglichenen JSON-Objekt (Klammern in Zeichenketten zählen nicht), repariert typische
+Fehler (Komma vor schließender Klammer, typografische Anführungszeichen, abgeschnittenes
+Ende) und prüft das Ergebnis optional gegen ein JSON-Schema.
+"""
+import json
+import re
+
+from jsonschema import Draft7Validator
+
+
+class InkrementellerJsonParser:
+    """
+    Zustandsautomat über den äußersten JSON-Block einer gestreamten Antwort.
+    Text vor der ersten "{" (z.B. ```json) wird ignoriert, Zeichenketten werden korrekt
+    übersprungen, damit Klammern und Kommas in Texten nicht mitgezählt werden.
+    Mit `schema` werden fertige Felder vor der Rückgabe per `gleiche_typen_an` angeglichen.
+    """
+
+    def __init__(self, schema=None):
+        self.schema = schema
+        self.text = ""
+        self.ergebnis = {}
+        self.fertig = False
+        self._pos = 0
+        self._tiefe = 0
+        self._in_string = False
+        self._escape = False
+        self._feld_start = None
+
+    def feed(self, chunk):
+        """Verarbeitet ein neues Textstück und gibt die dadurch fertig gewordenen Felder zurück."""
+        self.text += chunk
+        neue_felder = {}
+        text = self.text
+        while self._pos < len(text) and not self.fertig:
+            zeichen = text[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif zeichen == "\\":
+                    self._escape = True
+                elif zeichen == '"':
+                    self._in_string = False
+            elif zeichen == '"':
+                if self._tiefe > 0:
+                    self._in_string = True
+            elif zeichen == "{" or (zeichen == "[" and self._tiefe > 0):
+                self._tiefe += 1
+                if self._tiefe == 1:
+                    self._feld_start = self._pos + 1
+            elif zeichen in "}]" and self._tiefe > 0:
+                if self._tiefe == 1:
+                    neue_felder.update(self._schliesse_feld(self._pos))
+                    self.fertig = True
+                self._tiefe -= 1
+            elif zeichen == "," and self._tiefe == 1:
+                neue_felder.update(self._schliesse_feld(self._pos))
+                self._feld_start = self._pos + 1
+            self._pos += 1
+        if neue_felder and self.schema is not None:
+            neue_felder = gleiche_typen_an(neue_felder, self.schema)
+        self.ergebnis.update(neue_felder)
+        return neue_felder
+
+    def _schliesse_feld(self, ende):
+        fragment = self.text[self._feld_start:ende].strip()
+        if not fragment:
+            return {}
+        try:
+            return json.loads("{" + fragment + "}")
+        except json.JSONDecodeError:
+            return {}
+
+
+# --- EXTRAKTION AUS VOLLSTÄNDIGEN ANTWORTEN ---
+
+TYPOGRAFISCHE_OEFFNER = "“”„‟"
+TYPOGRAFISCHE_SCHLIESSER = "“”‟\""
+
+
+_STRUKTURZEICHEN = re.compile(r'[{}\[\]"\\]')
+# Ein Objekt beginnt mit einem Schlüssel (auch typografisch zitiert) oder ist leer
+_OBJEKT_ANFANG = re.compile(r'\{\s*["“„}]')
+
+
+def finde_json_kandidaten(text):
+    """
+    Liefert in einem Durchlauf jedes ausgeglichene {...} auf oberster Ebene, am Ende
+    gegebenenfalls den nicht geschlossenen Rest (abgeschnittene Antwort).
+    Zeichenketten werden nur innerhalb eines Objekts beachtet; Prosa davor und danach
+    darf beliebige Klammern und Anführungszeichen enthalten. Besucht werden nur
+    Strukturzeichen, der Text dazwischen wird vom Regex-Automaten übersprungen.
+    """
+    tiefe = 0
+    start = None
+    in_string = False
+    escape_bis = -1
+    for treffer in _STRUKTURZEICHEN.finditer(text):
+        pos = treffer.start()
+        if pos <= escape_bis:
+            continue
+        zeichen = text[pos]
+        if in_string:
+            if zeichen == "\\":
+                escape_bis = pos + 1
+            elif zeichen == '"':
+                in_string = False
+        elif tiefe == 0:
+            if zeichen == "{":
+                tiefe = 1
+                start = pos
+        elif zeichen == '"':
+            in_string = True
+        elif zeichen in "{[":
+            tiefe += 1
+        elif zeichen in "}]":
+            tiefe -= 1
+            if tiefe == 0:
+                yield text[start:pos + 1]
+    if tiefe > 0:
+        yield text[start:]
+
+
+def repariere_json(fragment):
+    """
+    Behebt in einem Durchlauf häufige Fehler in Modell-JSON:
+    - typografische Anführungszeichen als Begrenzer von Schlüsseln und Werten,
+    - Kommas direkt vor } oder ],
+    - rohe Zeilenumbrüche in Zeichenketten,
+    - abgeschnittenes Ende (offene Zeichenkette und Klammern werden geschlossen).
+    """
+    aus = []
+    offen = []
+    in_string = False
+    schliesser = '"'
+    escape = False
+    for zeichen in fragment:
+        if in_string:
+            if escape:
+                escape = False
+                aus.append(zeichen)
+            elif zeichen == "\\":
+                escape = True
+                aus.append(zeichen)
+            elif zeichen in schliesser:
+                in_string = False
+                aus.append('"')
+            elif zeichen == '"':
+                # ASCII-Anführungszeichen in einer typografisch begrenzten Zeichenkette
+                aus.append('\\"')
+            elif zeichen == "\n":
+                aus.append("\\n")
+            else:
+                aus.append(zeichen)
+        elif zeichen == '"' or zeichen in TYPOGRAFISCHE_OEFFNER:
+            in_string = True
+            schliesser = '"' if zeichen == '"' else TYPOGRAFISCHE_SCHLIESSER
+            aus.append('"')
+        elif zeichen in "{[":
+            offen.append("}" if zeichen == "{" else "]")
+            aus.append(zeichen)
+        elif zeichen in "}]":
+            _entferne_haengendes_komma(aus)
+            if offen:
+                offen.pop()
+            aus.append(zeichen)
+        else:
+            aus.append(zeichen)
+
+    if in_string:
+        if escape:
+            aus.pop()
+        aus.append('"')
+    _entferne_haengendes_komma(aus)
+    aus.extend(reversed(offen))
+    return "".join(aus)
+
+
+def _entferne_haengendes_komma(aus):
+    ende = len(aus)
+    while ende and aus[ende - 1].isspace():
+        ende -= 1
+    if ende and aus[ende - 1] in ",:":
+        del aus[ende - 1:]
+
+
+def _parse(fragment):
+    try:
+        return json.loads(fragment, strict=False)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(repariere_json(fragment), strict=False)
+    except json.JSONDecodeError:
+        return None
+
+
+def extrahiere_json(text, schema=None):
+    """
+    Erstes JSON-Objekt in `text`, das sich (notfalls nach Reparatur) parsen lässt und,
+    falls ein Schema angegeben ist, diesem nach Typ-Angleichung entspricht. Sonst None.
+    """
+    for kandidat in finde_json_kandidaten(text or ""):
+        if not _OBJEKT_ANFANG.match(kandidat):
+            continue
+        objekt = _parse(kandidat)
+        if not isinstance(objekt, dict):
+            continue
+        if schema is None:
+            return objekt
+        objekt = gleiche_typen_an(objekt, schema)
+        if ist_gueltig(objekt, schema):
+            return objekt
+    return None
+
+
+# --- SCHEMAS ---
+
+FALL_SCHEMA = {
+    "type": "object",
+    "required": ["rechtsgebiet", "thema", "schwierigkeit", "bearbeitungszeit", "sachverhalt", "lösungsskizze"],
+    "properties": {
+        "rechtsgebiet": {"type": "string"},
+        "thema": {"type": "string"},
+        "schwierigkeit": {"type": "integer", "minimum": 0, "maximum": 5},
+        "bearbeitungszeit": {"type": "integer", "minimum": 0},
+        "sachverhalt": {"type": "string", "pattern": r"\S"},
+        "lösungsskizze": {"type": "array", "items": {"type": "string"}, "minItems": 1},
+    },
+}
+
+BEWERTUNGS_SCHEMA = {
+    "type": "object",
+    "required": [
+        "übereinstimmung_lösungsskizze", "feedback_struktur", "feedback_gutachtenstil",
+        "feedback_materielles_recht", "fazit", "verbesserungsvorschlag",
+    ],
+    "properties": {
+        "übereinstimmung_lösungsskizze": {"type": "integer", "minimum": 0, "maximum": 100},
+        "feedback_struktur": {"type": "string"},
+        "feedback_gutachtenstil": {"type": "string"},
+        "feedback_materielles_recht": {"type": "string"},
+        "fazit": {"type": "string"},
+        "verbesserungsvorschlag": {"type": "string"},
+        # Lokale Vorab-Schätzung der Gliederung (struktur_bewertung), nur bei paralleler Bewertung
+        "übereinstimmung_lokal": {"type": "integer", "minimum": 0, "maximum": 100},
+    },
+}
+
+_validatoren = {}
+
+
+def _validator(schema):
+    # Schlüssel ist der Inhalt, nicht id(schema): gleiche Schemas teilen sich einen Validator,
+    # und die id eines freigegebenen Dicts kann nicht auf einen fremden Validator zeigen
+    schluessel = json.dumps(schema, sort_keys=True)
+    validator = _validatoren.get(schluessel)
+    if validator is None:
+        validator = _validatoren[schluessel] = Draft7Validator(schema)
+    return validator
+
+
+def ist_gueltig(objekt, schema):
+    return _validator(schema).is_valid(objekt)
+
+
+def gleiche_typen_an(objekt, schema):
+    """Wandelt ganzzahlige Felder um, die das Modell als "85", "85 %" oder 85.0 liefert."""
+    angeglichen = dict(objekt)
+    for feld, regel in schema.get("properties", {}).items():
+        if regel.get("type") != "integer" or feld not in angeglichen:
+            continue
+        wert = angeglichen[feld]
+        if isinstance(wert, float) and wert.is_integer():
+            angeglichen[feld] = int(wert)
+        elif isinstance(wert, str):
+            treffer = re.fullmatch(r"\s*(\d+)(?:[.,]0+)?\s*%?\s*", wert)
+            if treffer:
+                angeglichen[feld] = int(treffer.group(1))
+    return angeglichen
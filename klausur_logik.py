@@ -1,15 +1,22 @@
-import google.generativeai as genai
+import hashlib
 import json
-import os
 import streamlit as st
-import re
-from tenacity import retry, stop_after_attempt, wait_random_exponential
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from json_extraktion import InkrementellerJsonParser, extrahiere_json, gleiche_typen_an, ist_gueltig, FALL_SCHEMA, BEWERTUNGS_SCHEMA
+from llm_client import generiere, generiere_stream
+from llm_gateway import PRIORITAET_BEWERTUNG, PRIORITAET_HINTERGRUND
+from fall_pool import FallPool
+from bewertungs_cache import BewertungsCache, bewertungs_schluessel
+from struktur_bewertung import bewerte_struktur
+from messung import mit_kontext, span, zaehle
+from einstellungen import (
+    FALL_POOL_DATEI, FALL_POOL_ZIELGROESSE, FALL_POOL_MAX_PARALLEL, GEMINI_MODELL,
+    BEWERTUNGS_CACHE_VERZEICHNIS, BEWERTUNGS_CACHE_MAX_EINTRAEGE, BEWERTUNGS_CACHE_MAX_MB, BEWERTUNGS_CACHE_WARTEZEIT_S,
+    BEWERTUNG_PARALLEL, BEWERTUNG_THREADS,
+)
 
-# Konfiguriert die Gemini API
-try:
-    genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
-except (AttributeError, KeyError):
-    pass 
+# Die Gemini API wird zentral in llm_client konfiguriert
 
 # Vollständiger Prompt für die Fall-Generierung
 system_prompt_fall_architekt = """
@@ -133,29 +140,80 @@ WICHTIGE HINWEISE:
 ANTWORT NUR ALS JSON-OBJEKT!
 """
 
-def clean_and_parse_json(raw_text):
-    """Sucht nach einem JSON-Block im Text und parst ihn."""
-    match = re.search(r'\{.*\}', raw_text, re.DOTALL)
-    if match:
-        json_str = match.group(0)
-        try:
-            return json.loads(json_str)
-        except json.JSONDecodeError:
-            return None
-    return None
-
-@retry(
-    wait=wait_random_exponential(min=1, max=20),
-    stop=stop_after_attempt(3)
-)
-def generiere_fall_gemini(schwierigkeit: int, tags: list):
+# Gemeinsamer Rahmen der kleinen Prompts, je einer pro Bewertungsdimension
+system_prompt_bewerter_basis = """
+Du bist ein erfahrener Korrekturassistent für juristische Examensklausuren im deutschen Zivilrecht.
+Du bewertest NUR den unten genannten Aspekt einer Klausurlösung; andere Aspekte bewerten Kollegen.
+
+KRITISCHE ANWEISUNG: Deine Antwort MUSS IMMER UND AUSSCHLIESSLICH ein gültiges JSON-Objekt sein.
+
+BEWERTUNGSGRUNDSÄTZE:
+- Sei FAIR aber PRÄZISE, erkenne gute Ansätze an und gib LERNFÖRDERLICHE Hinweise
+- Feedback soll KONKRET und BEISPIELHAFT sein (mit Bezug auf Stellen und Normen im Lösungstext)
+
+DEIN ASPEKT:
+{aufgabe}
+
+JSON-OUTPUT (ZWINGEND EINZUHALTEN):
+{ausgabe}
+"""
+
+# Dimension -> (Aufgabe, JSON-Ausgabe, Eingaben im Prompt)
+BEWERTUNGS_DIMENSIONEN = {
+    "struktur": (
+        """STRUKTURELLER ABGLEICH: Vergleiche die Gliederung im LÖSUNGSTEXT mit der LÖSUNGSSKIZZE.
+Wurden alle Hauptprüfungspunkte erkannt? Stimmt die Prüfungsreihenfolge? Sitzen die Schwerpunkte richtig?
+Die Prozentzahl bezieht sich NUR auf die strukturelle Übereinstimmung.""",
+        """{
+  "übereinstimmung_lösungsskizze": [Ganzzahl 0-100],
+  "feedback_struktur": "[Max. 3 Sätze: Wie gut wurde die erwartete Gliederung getroffen? Welche wichtigen Punkte fehlen/wurden falsch eingeordnet?]"
+}""",
+        ("loesungsskizze", "loesungstext"),
+    ),
+    "gutachtenstil": (
+        """GUTACHTENSTIL: Konsequente Anwendung (Obersatz → Definition → Subsumtion → Ergebnis),
+angemessener Urteilsstil bei unproblematischen Punkten, sprachliche Präzision.""",
+        """{
+  "feedback_gutachtenstil": "[Max. 3 Sätze: Konkrete Stärken/Schwächen beim Gutachtenstil mit Beispielen]"
+}""",
+        ("loesungstext",),
+    ),
+    "materielles_recht": (
+        """MATERIELLES RECHT: Korrekte Anwendung der Normen, Vollständigkeit der Tatbestandsmerkmale,
+Erkennen und Lösen der Rechtsprobleme, Meinungsstreite (falls relevant), Qualität der Argumentation.""",
+        """{
+  "feedback_materielles_recht": "[Max. 3 Sätze: Inhaltliche Richtigkeit, erkannte/verpasste Probleme, Subsumtionsfehler]"
+}""",
+        ("sachverhalt", "loesungsskizze", "loesungstext"),
+    ),
+    "gesamt": (
+        """GESAMTEINSCHÄTZUNG: Konstruktives Fazit mit positiver Grundhaltung und EIN konkreter, sofort
+umsetzbarer Tipp für die nächste Klausur (z.B. "Beginne jeden Prüfungspunkt mit einem klaren Obersatz im Konjunktiv").""",
+        """{
+  "fazit": "[Max. 2 Sätze: Konstruktive Gesamteinschätzung mit positiver Grundhaltung]",
+  "verbesserungsvorschlag": "[1 Satz: EIN konkreter, sofort umsetzbarer Tipp für die nächste Klausur]"
+}""",
+        ("sachverhalt", "loesungstext"),
+    ),
+}
+
+def clean_and_parse_json(raw_text, schema=None):
     """
-    Ruft die Gemini API auf, um einen neuen Fall mit einer BESTIMMTEN Schwierigkeit
-    und personalisierten Tags zu generieren.
+    Sucht nach einem JSON-Block im Text und parst ihn (linear, mit Reparatur typischer Fehler).
+    Mit `schema` wird nur ein Objekt zurückgegeben, das dem Schema entspricht.
+    """
+    with span("json_parsing", zeichen=len(raw_text or "")):
+        return extrahiere_json(raw_text, schema)
+
+@lru_cache(maxsize=256)
+def render_fall_architekt_prompt(schwierigkeit, tags):
+    """
+    Rendert den System-Prompt für eine (Schwierigkeit, Tags)-Kombination genau einmal.
+    Derselbe String-Wert sorgt dafür, dass llm_client auch das Modell wiederverwendet.
     """
     tags_string = ", ".join(tags) if tags else "keine besonderen"
     
-    system_prompt_fall_architekt_dyn = f"""
+    return f"""
     Du bist ein "Fall-Architekt", ein Experte für die Erstellung von juristischen Examensklausuren im deutschen Zivilrecht.
 
     KRITISCHE ANWEISUNG: Deine Antwort MUSS IMMER UND AUSSCHLIESSLICH ein gültiges JSON-Objekt sein.
@@ -186,25 +244,225 @@ def generiere_fall_gemini(schwierigkeit: int, tags: list):
     - 3-4 (Fortgeschrittenenklausur): 🧠 Mehrere Probleme, Meinungsstreite.
     - 5 (Examensklausur): ⚖️ Staatsexamensniveau, 300 Min (5h).
     """
+
+# Häufige Kombinationen beim Start vorrendern
+for _schwierigkeit in range(6):
+    render_fall_architekt_prompt(_schwierigkeit, ())
+
+def generiere_fall_gemini(schwierigkeit: int, tags: list, prioritaet=PRIORITAET_BEWERTUNG):
+    """
+    Ruft die Gemini API auf, um einen neuen Fall mit einer BESTIMMTEN Schwierigkeit
+    und personalisierten Tags zu generieren.
+    Wiederholungen übernimmt das LLM-Gateway; identische Anfragen werden hier bewusst
+    nicht zusammengefasst, da jeder Aufruf einen neuen Fall liefern soll.
+    """
+    system_prompt_fall_architekt_dyn = render_fall_architekt_prompt(schwierigkeit, tuple(tags or ()))
     try:
-        model = genai.GenerativeModel(model_name="gemini-1.5-pro-latest", system_instruction=system_prompt_fall_architekt_dyn)
-        response = model.generate_content("Erstelle einen neuen Klausursachverhalt, der exakt den Anforderungen entspricht.", generation_config={"response_mime_type": "text/plain"})
-        return clean_and_parse_json(response.text)
+        response = generiere("fall", system_prompt_fall_architekt_dyn, "Erstelle einen neuen Klausursachverhalt, der exakt den Anforderungen entspricht.",
+                             prioritaet=prioritaet, zusammenfassen=False, generation_config={"response_mime_type": "text/plain"})
+        return clean_and_parse_json(response.text, FALL_SCHEMA)
     except Exception as e:
-        print(f"Fehler in generiere_fall_gemini nach 3 Versuchen: {e}")
+        print(f"Fehler in generiere_fall_gemini: {e}")
+        zaehle("juraki_fehler_gesamt", ort="generiere_fall_gemini")
         raise e
 
-@retry(
-    wait=wait_random_exponential(min=1, max=20),
-    stop=stop_after_attempt(3)
-)
+def _generiere_fall_im_hintergrund(schwierigkeit, tags):
+    return generiere_fall_gemini(schwierigkeit, tags, prioritaet=PRIORITAET_HINTERGRUND)
+
+@st.cache_resource # Ein Vorrat pro Prozess, geteilt von allen Sessions
+def lade_fall_pool():
+    """Vorrat an fertigen Fällen, der im Hintergrund über generiere_fall_gemini aufgefüllt wird."""
+    return FallPool(_generiere_fall_im_hintergrund, FALL_POOL_DATEI, zielgroesse=FALL_POOL_ZIELGROESSE,
+                    max_parallel=FALL_POOL_MAX_PARALLEL)
+
+def _dimensions_prompt(aufgabe, ausgabe):
+    return system_prompt_bewerter_basis.format(aufgabe=aufgabe, ausgabe=ausgabe)
+
+def _dimensions_schema(ausgabe):
+    """Teilschema des BEWERTUNGS_SCHEMA mit den Feldern, die eine Dimension liefert."""
+    felder = [f for f in BEWERTUNGS_SCHEMA["properties"] if f'"{f}"' in ausgabe]
+    return {"type": "object", "required": felder, "properties": {f: BEWERTUNGS_SCHEMA["properties"][f] for f in felder}}
+
+DIMENSIONS_PROMPTS = {name: _dimensions_prompt(aufgabe, ausgabe) for name, (aufgabe, ausgabe, _) in BEWERTUNGS_DIMENSIONEN.items()}
+DIMENSIONS_SCHEMAS = {name: _dimensions_schema(ausgabe) for name, (_, ausgabe, _) in BEWERTUNGS_DIMENSIONEN.items()}
+
+# Ändert sich der Bewertungs-Prompt oder das Modell, werden alte Cache-Einträge nicht mehr getroffen
+_bewertungs_prompts = sorted(DIMENSIONS_PROMPTS.items()) if BEWERTUNG_PARALLEL else system_prompt_ki_bewerter
+BEWERTUNGS_PROMPT_VERSION = hashlib.sha256(f"{GEMINI_MODELL}\n{_bewertungs_prompts}".encode("utf-8")).hexdigest()[:16]
+
+# Threads, die auf die Dimensions-Aufrufe warten (geteilt von allen Sessions)
+_bewertungs_pool = ThreadPoolExecutor(max_workers=BEWERTUNG_THREADS, thread_name_prefix="bewertung")
+
+@st.cache_resource # Ein Cache pro Prozess, geteilt von allen Sessions
+def lade_bewertungs_cache():
+    """Plattencache für Bewertungen, geschlüsselt auf Fall, Lösungstext und Prompt-Version."""
+    return BewertungsCache(BEWERTUNGS_CACHE_VERZEICHNIS, max_eintraege=BEWERTUNGS_CACHE_MAX_EINTRAEGE,
+                           max_bytes=BEWERTUNGS_CACHE_MAX_MB * 1024 * 1024, wartezeit_s=BEWERTUNGS_CACHE_WARTEZEIT_S)
+
+def _baue_bewertungs_prompt(sachverhalt, loesungsskizze, loesungstext):
+    with span("bewertung_prompt_bau"):
+        return f"SACHVERHALT:\n{sachverhalt}\n\nLÖSUNGSSKIZZE:\n{json.dumps(loesungsskizze, indent=2)}\n\nLÖSUNGSTEXT:\n{loesungstext}"
+
 def bewerte_loesung_gemini(sachverhalt, loesungsskizze, loesungstext):
-    """Ruft die Gemini API auf, um eine Lösung zu bewerten."""
+    """
+    Ruft die Gemini API auf, um eine Lösung zu bewerten.
+    Dieselbe Lösung zum selben Fall wird nur einmal bewertet (Bewertungs-Cache).
+    """
+    schluessel = bewertungs_schluessel(sachverhalt, loesungsskizze, loesungstext, BEWERTUNGS_PROMPT_VERSION)
+
+    def bewerte():
+        if BEWERTUNG_PARALLEL:
+            ergebnis = {}
+            for neue_felder in _bewerte_parallel(sachverhalt, loesungsskizze, loesungstext):
+                ergebnis.update(neue_felder)
+            if not ist_gueltig(ergebnis, BEWERTUNGS_SCHEMA):
+                raise ValueError(f"Unvollständige Bewertung: {sorted(ergebnis)}")
+            return ergebnis
+        try:
+            input_prompt = _baue_bewertungs_prompt(sachverhalt, loesungsskizze, loesungstext)
+            response = generiere("bewertung", system_prompt_ki_bewerter, input_prompt, prioritaet=PRIORITAET_BEWERTUNG,
+                                 generation_config={"response_mime_type": "text/plain"})
+            return clean_and_parse_json(response.text, BEWERTUNGS_SCHEMA)
+        except Exception as e:
+            print(f"Fehler in bewerte_loesung_gemini: {e}")
+            zaehle("juraki_fehler_gesamt", ort="bewerte_loesung_gemini")
+            raise e
+
+    return lade_bewertungs_cache().hole_oder_berechne(schluessel, bewerte)
+
+
+def _streame_bewertung(sachverhalt, loesungsskizze, loesungstext):
+    input_prompt = _baue_bewertungs_prompt(sachverhalt, loesungsskizze, loesungstext)
+    parser = InkrementellerJsonParser(BEWERTUNGS_SCHEMA)
     try:
-        input_prompt = f"SACHVERHALT:\\n{sachverhalt}\\n\\nLÖSUNGSSKIZZE:\\n{json.dumps(loesungsskizze, indent=2)}\\n\\nLÖSUNGSTEXT:\\n{loesungstext}"
-        model = genai.GenerativeModel(model_name="gemini-1.5-pro-latest", system_instruction=system_prompt_ki_bewerter)
-        response = model.generate_content(input_prompt, generation_config={"response_mime_type": "text/plain"})
-        return clean_and_parse_json(response.text)
+        for text in generiere_stream("bewertung", system_prompt_ki_bewerter, input_prompt, prioritaet=PRIORITAET_BEWERTUNG, generation_config={"response_mime_type": "text/plain"}):
+            neue_felder = parser.feed(text)
+            if neue_felder:
+                yield neue_felder
     except Exception as e:
-        print(f"Fehler in bewerte_loesung_gemini nach 3 Versuchen: {e}")
+        print(f"Fehler in bewerte_loesung_gemini_stream: {e}")
+        zaehle("juraki_fehler_gesamt", ort="bewerte_loesung_gemini_stream")
         raise e
+
+    if not parser.fertig:
+        # Unvollständiger Stream: noch einmal den ganzen Text parsen
+        vollstaendig = clean_and_parse_json(parser.text) or {}
+        rest = {k: v for k, v in vollstaendig.items() if k not in parser.ergebnis}
+        if rest:
+            yield gleiche_typen_an(rest, BEWERTUNGS_SCHEMA)
+
+
+def _baue_dimensions_eingabe(eingaben, sachverhalt, loesungsskizze, loesungstext):
+    teile = {
+        "sachverhalt": f"SACHVERHALT:\n{sachverhalt}",
+        "loesungsskizze": f"LÖSUNGSSKIZZE:\n{json.dumps(loesungsskizze, indent=2, ensure_ascii=False)}",
+        "loesungstext": f"LÖSUNGSTEXT:\n{loesungstext}",
+    }
+    return "\n\n".join(teile[e] for e in eingaben)
+
+def _bewerte_dimension(name, sachverhalt, loesungsskizze, loesungstext):
+    """Ein kleiner Gemini-Aufruf für eine Bewertungsdimension; Ergebnis nach ihrem Teilschema."""
+    input_prompt = _baue_dimensions_eingabe(BEWERTUNGS_DIMENSIONEN[name][2], sachverhalt, loesungsskizze, loesungstext)
+    response = generiere(f"bewertung_{name}", DIMENSIONS_PROMPTS[name], input_prompt, prioritaet=PRIORITAET_BEWERTUNG,
+                         generation_config={"response_mime_type": "text/plain"})
+    ergebnis = clean_and_parse_json(response.text, DIMENSIONS_SCHEMAS[name])
+    if ergebnis is None:
+        raise ValueError(f"Keine gültige Antwort für die Dimension {name}")
+    return ergebnis
+
+def _lokale_struktur(loesungsskizze, loesungstext):
+    """
+    Strukturbewertung mit dem Embedding-Modell; None, wenn es (noch) nicht geladen ist.
+    Das Modell wird hier nie selbst geladen, damit die Bewertung nicht auf MiniLM wartet.
+    """
+    from datenbank import geladener_embedding_dienst
+    dienst = geladener_embedding_dienst()
+    if dienst is None:
+        zaehle("juraki_struktur_vorab_gesamt", ergebnis="ohne_modell")
+        return None
+    try:
+        with span("struktur_vorab"):
+            return bewerte_struktur(loesungsskizze, loesungstext, dienst)
+    except Exception as e:
+        print(f"Fehler bei der lokalen Strukturbewertung: {e}")
+        zaehle("juraki_fehler_gesamt", ort="struktur_vorab")
+        return None
+
+def _bewerte_parallel(sachverhalt, loesungsskizze, loesungstext):
+    """
+    Zuerst die lokale Strukturbewertung (sofort), dann die Felder jeder Dimension, sobald ihr
+    Aufruf fertig ist. Alle Dimensionen laufen gleichzeitig; die Gesamtdauer entspricht etwa
+    der langsamsten. Fehlt die strukturelle LLM-Bewertung, gilt die lokale Schätzung.
+    """
+    zukuenfte = {
+        _bewertungs_pool.submit(mit_kontext(lambda n=name: _bewerte_dimension(n, sachverhalt, loesungsskizze, loesungstext))): name
+        for name in BEWERTUNGS_DIMENSIONEN
+    }
+    lokal = _lokale_struktur(loesungsskizze, loesungstext)
+    if lokal is not None:
+        yield {"übereinstimmung_lokal": lokal.score}
+
+    fehler = None
+    erhalten = set()
+    try:
+        for zukunft in as_completed(zukuenfte):
+            name = zukuenfte[zukunft]
+            try:
+                felder = zukunft.result()
+            except Exception as e:
+                print(f"Fehler in bewerte_loesung_gemini ({name}): {e}")
+                zaehle("juraki_fehler_gesamt", ort=f"bewertung_{name}")
+                fehler = e
+                continue
+            erhalten.add(name)
+            yield felder
+    finally:
+        # Abbruch durch die UI: noch nicht gestartete Aufrufe verwerfen
+        for zukunft in zukuenfte:
+            zukunft.cancel()
+
+    if "struktur" not in erhalten and lokal is not None:
+        yield {"übereinstimmung_lösungsskizze": lokal.score}
+    if not erhalten:
+        raise fehler
+
+
+def ist_vollstaendige_bewertung(feedback):
+    """Nur vollständige Bewertungen (BEWERTUNGS_SCHEMA) werden gespeichert und gehen in die Lernhistorie."""
+    return bool(feedback) and ist_gueltig(feedback, BEWERTUNGS_SCHEMA)
+
+
+def bewerte_loesung_gemini_stream(sachverhalt, loesungsskizze, loesungstext):
+    """
+    Streamende Variante von bewerte_loesung_gemini.
+    Liefert Dictionaries mit den Feedback-Feldern, die seit dem letzten Schritt vollständig
+    geworden sind (z.B. {"fazit": "..."}), sodass die UI jedes Feld sofort anzeigen kann.
+    Bei einem Cache-Treffer oder einer gleichzeitig laufenden identischen Bewertung kommt
+    das ganze Feedback in einem Schritt.
+    """
+    cache = lade_bewertungs_cache()
+    schluessel = bewertungs_schluessel(sachverhalt, loesungsskizze, loesungstext, BEWERTUNGS_PROMPT_VERSION)
+    gespeichert = cache.lade(schluessel)
+    if gespeichert is not None:
+        yield gespeichert
+        return
+
+    future, ist_eigentuemer = cache.reserviere(schluessel)
+    if not ist_eigentuemer:
+        ergebnis = cache.warte(future)
+        if ergebnis:
+            yield ergebnis
+        return
+
+    ergebnis = {}
+    bewertung = _bewerte_parallel if BEWERTUNG_PARALLEL else _streame_bewertung
+    try:
+        for neue_felder in bewertung(sachverhalt, loesungsskizze, loesungstext):
+            ergebnis.update(neue_felder)
+            yield neue_felder
+    except BaseException as e:
+        # Auch ein abgebrochener Stream (GeneratorExit) darf Wartende nicht hängen lassen
+        cache.abbrechen(schluessel, e if isinstance(e, Exception) else RuntimeError("Bewertung abgebrochen"))
+        raise
+    # Unvollständiges Feedback wird angezeigt und an Wartende gereicht, aber nicht gespeichert
+    cache.abschliessen(schluessel, ergebnis or None, speichern=ist_vollstaendige_bewertung(ergebnis))
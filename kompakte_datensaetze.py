@@ -0,0 +1,236 @@
+# kompakte_datensaetze.py
+"""
+Speichersparende Darstellung von Fällen und Lernhistorie.
+
+- `Fall` ersetzt das Dict pro Fall durch ein Objekt mit __slots__, verhält sich aber wie
+  ein nur lesbares Mapping (`fall['kernfrage']`, `fall.get(...)`, `dict(fall)`).
+- `Lernhistorie` hält die Ergebnisse spaltenweise in NumPy-Arrays (Datum als int64 in
+  Mikrosekunden, Bewertung int16, Schwierigkeit int8, Texte als int32-Codes). Wiederholte
+  Texte wie Thema und Rechtsgebiet stehen nur einmal pro Prozess im `Vokabular`.
+  `als_dataframe` gibt pandas für Datum und Zahlen Sichten auf diese Arrays statt Kopien.
+"""
+import sys
+import threading
+from collections.abc import Mapping
+from datetime import datetime, timedelta
+
+import numpy as np
+
+_EPOCHE = datetime(1970, 1, 1)
+
+
+def interniere(text):
+    """Gleiche Texte teilen sich ein Objekt (z.B. 'BGB AT' in tausenden Datensätzen)."""
+    return sys.intern(text) if isinstance(text, str) else text
+
+
+class Vokabular:
+    """Prozessweite, nur wachsende Zuordnung Text <-> Code; Codes bleiben stabil."""
+
+    def __init__(self):
+        self._texte = []
+        self._codes = {}
+        self._lock = threading.Lock()
+
+    def code(self, text):
+        text = "" if text is None else str(text)
+        code = self._codes.get(text)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(text)
+                if code is None:
+                    code = len(self._texte)
+                    self._texte.append(interniere(text))
+                    self._codes[text] = code
+        return code
+
+    def text(self, code):
+        return self._texte[code]
+
+    def texte(self, anzahl=None):
+        """Die ersten `anzahl` Texte in Code-Reihenfolge (Kategorien für pandas)."""
+        return self._texte[:len(self._texte) if anzahl is None else anzahl]
+
+    def __len__(self):
+        return len(self._texte)
+
+
+VOKABULAR = Vokabular()
+
+
+# --- FÄLLE ---
+
+class Fall(Mapping):
+    """Ein Fall der Datenbank; unbekannte Felder landen in einem kleinen Zusatz-Dict."""
+    FELDER = ("fall_titel", "rechtsgebiet", "zentrales_problem", "kernfrage", "kurzloesung")
+    INTERNIERT = ("rechtsgebiet",)
+    __slots__ = FELDER + ("_weitere",)
+
+    def __init__(self, **felder):
+        for feld in self.FELDER:
+            wert = felder.pop(feld, None)
+            setattr(self, feld, interniere(wert) if feld in self.INTERNIERT else wert)
+        self._weitere = felder or None
+
+    @classmethod
+    def aus_dict(cls, daten):
+        return daten if isinstance(daten, cls) else cls(**daten)
+
+    def __getitem__(self, schluessel):
+        if schluessel in self.FELDER:
+            wert = getattr(self, schluessel)
+            if wert is not None:
+                return wert
+        elif self._weitere and schluessel in self._weitere:
+            return self._weitere[schluessel]
+        raise KeyError(schluessel)
+
+    def __iter__(self):
+        for feld in self.FELDER:
+            if getattr(self, feld) is not None:
+                yield feld
+        if self._weitere:
+            yield from self._weitere
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"Fall({self.fall_titel!r})"
+
+    def __reduce__(self):
+        # Für pickle (st.cache_data) und das Hashing von Cache-Argumenten durch Streamlit
+        return (Fall, (), dict(self))
+
+    def __setstate__(self, zustand):
+        self.__init__(**zustand)
+
+
+# --- LERNHISTORIE ---
+
+class Lernhistorie:
+    """
+    Spaltenspeicher für Ergebnisse {'datum', 'thema', 'rechtsgebiet', 'schwierigkeit', 'bewertung'}.
+    Wächst wie eine Liste durch Verdoppeln der Kapazität; `append` nimmt weiterhin Dicts an,
+    Iteration liefert Dicts (z.B. für LernAggregate und den Lern-Speicher).
+    """
+    SPALTEN = ("_datum", "_schwierigkeit", "_bewertung", "_thema", "_rechtsgebiet")
+    __slots__ = ("_anzahl", "_datum", "_schwierigkeit", "_bewertung", "_thema", "_rechtsgebiet", "_vokabular",
+                 "_chronologisch")
+
+    def __init__(self, kapazitaet=16, vokabular=None):
+        self._anzahl = 0
+        self._chronologisch = True  # Einträge kamen in Datumsreihenfolge (der Normalfall)
+        self._vokabular = vokabular or VOKABULAR
+        self._datum = np.empty(kapazitaet, dtype=np.int64)
+        self._schwierigkeit = np.empty(kapazitaet, dtype=np.int8)
+        self._bewertung = np.empty(kapazitaet, dtype=np.int16)
+        self._thema = np.empty(kapazitaet, dtype=np.int32)
+        self._rechtsgebiet = np.empty(kapazitaet, dtype=np.int32)
+
+    @classmethod
+    def aus_ergebnissen(cls, ergebnisse):
+        historie = cls(kapazitaet=max(16, len(ergebnisse)) if hasattr(ergebnisse, "__len__") else 16)
+        for ergebnis in ergebnisse:
+            historie.append(ergebnis)
+        return historie
+
+    def _vergroessere(self):
+        # Neue Arrays statt resize: bereits herausgegebene DataFrame-Sichten bleiben gültig
+        for name in self.SPALTEN:
+            alt = getattr(self, name)
+            neu = np.empty(max(16, 2 * len(alt)), dtype=alt.dtype)
+            neu[:self._anzahl] = alt[:self._anzahl]
+            setattr(self, name, neu)
+
+    def append(self, ergebnis):
+        if self._anzahl == len(self._datum):
+            self._vergroessere()
+        i = self._anzahl
+        self._datum[i] = (ergebnis["datum"] - _EPOCHE) // timedelta(microseconds=1)
+        if i and self._datum[i] < self._datum[i - 1]:
+            self._chronologisch = False
+        self._schwierigkeit[i] = ergebnis.get("schwierigkeit") or 0
+        self._bewertung[i] = ergebnis.get("bewertung") or 0
+        self._thema[i] = self._vokabular.code(ergebnis.get("thema"))
+        self._rechtsgebiet[i] = self._vokabular.code(ergebnis.get("rechtsgebiet"))
+        self._anzahl += 1
+
+    def extend(self, ergebnisse):
+        for ergebnis in ergebnisse:
+            self.append(ergebnis)
+
+    def __len__(self):
+        return self._anzahl
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._anzahl))]
+        if i < 0:
+            i += self._anzahl
+        if not 0 <= i < self._anzahl:
+            raise IndexError(i)
+        return {
+            "thema": self._vokabular.text(self._thema[i]),
+            "rechtsgebiet": self._vokabular.text(self._rechtsgebiet[i]),
+            "schwierigkeit": int(self._schwierigkeit[i]),
+            "bewertung": int(self._bewertung[i]),
+            "datum": _EPOCHE + timedelta(microseconds=int(self._datum[i])),
+        }
+
+    def __iter__(self):
+        for i in range(self._anzahl):
+            yield self[i]
+
+    def seite_neueste_zuerst(self, start, anzahl):
+        """
+        Die Ergebnisse start .. start+anzahl, absteigend nach Datum. Bei chronologisch
+        angehängten Einträgen ohne Sortieren, der Aufwand hängt dann nur von `anzahl` ab.
+        """
+        if self._chronologisch:
+            ende = self._anzahl - start
+            indizes = range(ende - 1, max(ende - anzahl, 0) - 1, -1)
+        else:
+            indizes = np.argsort(-self._datum[:self._anzahl], kind="stable")[start:start + anzahl]
+        return [self[int(i)] for i in indizes]
+
+    # --- Spaltenzugriff ---
+
+    @property
+    def datum(self):
+        """Sicht (datetime64[us]) auf die belegten Zeilen, ohne Kopie."""
+        return self._datum[:self._anzahl].view("datetime64[us]")
+
+    @property
+    def bewertung(self):
+        return self._bewertung[:self._anzahl]
+
+    @property
+    def schwierigkeit(self):
+        return self._schwierigkeit[:self._anzahl]
+
+    def codes(self, spalte):
+        return getattr(self, f"_{spalte}")[:self._anzahl]
+
+    def text(self, code):
+        return self._vokabular.text(code)
+
+    def als_dataframe(self):
+        """
+        DataFrame, dessen Datums- und Zahlenspalten die Arrays der Historie teilen.
+        Texte werden zu Categoricals über das Vokabular (pandas verkleinert dabei nur die Codes).
+        """
+        import pandas as pd
+        kategorien = pd.Index(self._vokabular.texte(), dtype=object)
+        spalten = {
+            "datum": self.datum,
+            "thema": pd.Categorical.from_codes(self.codes("thema"), categories=kategorien, validate=False),
+            "rechtsgebiet": pd.Categorical.from_codes(self.codes("rechtsgebiet"), categories=kategorien, validate=False),
+            "schwierigkeit": self.schwierigkeit,
+            "bewertung": self.bewertung,
+        }
+        return pd.DataFrame(spalten, copy=False)
+
+    def speicherbedarf(self):
+        """Belegte Bytes der Spalten-Arrays (inkl. Reservekapazität)."""
+        return sum(getattr(self, name).nbytes for name in self.SPALTEN)
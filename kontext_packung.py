@@ -0,0 +1,120 @@
+# kontext_packung.py
+"""
+Zusammenstellung des Kontexts für den RAG-Prompt unter einem Token-Budget.
+
+Statt eines einzelnen Falls in einem festen Template kommen die Felder mehrerer Treffer in
+Frage. Jedes Feld bekommt eine Priorität aus Feldgewicht, relativem Such-Score und Rang des
+Falls; in dieser Reihenfolge wird gepackt, solange das Budget reicht. Felder, deren Wörter
+weitgehend schon in einem gewählten Feld stehen (z.B. dieselbe Kernfrage in zwei Fällen),
+werden übersprungen.
+
+Gezählt wird mit dem Tokenizer des Embedding-Modells (lokal, ohne API-Aufruf). Gemini
+tokenisiert anders; die Zahlen sind eine Schätzung in derselben Größenordnung, die für
+Budget und Messung reicht. Ohne Tokenizer zählt eine Näherung über Wortstücke.
+"""
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+from hybrid_suche import tokenisiere
+
+# Reihenfolge der Felder innerhalb eines Falls im Prompt
+FELDER = ("zentrales_problem", "kernfrage", "kurzloesung")
+FELD_NAMEN = {"zentrales_problem": "Zentrales Problem", "kernfrage": "Kernfrage", "kurzloesung": "Kurzlösung"}
+FELD_GEWICHTE = {"kernfrage": 1.0, "zentrales_problem": 0.9, "kurzloesung": 0.8}
+# Jeder weitere Rang dämpft die Priorität aller Felder eines Falls
+RANG_DAEMPFUNG = 0.75
+
+# Etwa ein Token pro vier Zeichen eines Worts, Satzzeichen einzeln
+_WORTSTUECKE = re.compile(r"\w{1,4}|[^\w\s]")
+
+
+class Tokenzaehler:
+    """Zählt Tokens mit einem HuggingFace-Tokenizer; Ergebnisse pro Text im LRU-Cache."""
+
+    def __init__(self, tokenizer=None, cache_groesse=4096):
+        self.tokenizer = tokenizer
+        self.anzahl = lru_cache(maxsize=cache_groesse)(self._zaehle)
+
+    def _zaehle(self, text):
+        if not text:
+            return 0
+        if self.tokenizer is None:
+            return len(_WORTSTUECKE.findall(text))
+        # Ohne Kürzung auf die Modell-Länge: gezählt wird der ganze Text
+        return len(self.tokenizer(text, add_special_tokens=False, verbose=False)["input_ids"])
+
+
+@dataclass(frozen=True)
+class KontextPaket:
+    """Ergebnis der Zusammenstellung: Kontext-Text, verwendete Fälle und Token-Zahlen."""
+    text: str
+    fall_titel: tuple
+    tokens: int
+    felder: int
+    duplikate: int
+    ausgelassen: int
+
+
+def _ueberlappung(woerter, gewaehlt):
+    """Größter Anteil der Wörter eines Felds, der schon in einem gewählten Feld vorkommt."""
+    if not woerter:
+        return 1.0
+    return max((len(woerter & andere) / min(len(woerter), len(andere)) for andere in gewaehlt if andere),
+               default=0.0)
+
+
+def _kopfzeile(nummer, fall):
+    return f"[{nummer}] Fall-Titel: {fall.get('fall_titel', '')}"
+
+
+def _feldzeile(feld, text):
+    return f"- {FELD_NAMEN[feld]}: {text}"
+
+
+def packe_kontext(treffer, zaehler, budget, duplikat_schwelle=0.8):
+    """
+    `treffer`: Liste von (Fall, Score) absteigend nach Score. Gibt ein KontextPaket zurück,
+    dessen Text höchstens `budget` Tokens hat (Kopfzeilen der Fälle eingerechnet).
+    """
+    if not treffer:
+        return KontextPaket("", (), 0, 0, 0, 0)
+    bester = max(score for _, score in treffer) or 1.0
+    kandidaten = []
+    for rang, (fall, score) in enumerate(treffer):
+        for feld in FELDER:
+            text = fall.get(feld)
+            if text:
+                prioritaet = FELD_GEWICHTE[feld] * (score / bester) * RANG_DAEMPFUNG ** rang
+                kandidaten.append((prioritaet, rang, feld, text))
+    kandidaten.sort(key=lambda k: (-k[0], k[1]))
+
+    rest = budget
+    gewaehlt = {}        # rang -> {feld: text}
+    gewaehlte_woerter = []
+    duplikate = ausgelassen = 0
+    for _, rang, feld, text in kandidaten:
+        woerter = set(tokenisiere(text))
+        if _ueberlappung(woerter, gewaehlte_woerter) >= duplikat_schwelle:
+            duplikate += 1
+            continue
+        kosten = zaehler.anzahl(_feldzeile(feld, text))
+        if rang not in gewaehlt:
+            # Die Nummer in der Kopfzeile steht erst beim Rendern fest; sie kostet höchstens ein Token
+            kosten += zaehler.anzahl(_kopfzeile(0, treffer[rang][0]))
+        if kosten > rest:
+            ausgelassen += 1
+            continue
+        rest -= kosten
+        gewaehlt.setdefault(rang, {})[feld] = text
+        gewaehlte_woerter.append(woerter)
+
+    zeilen, titel = [], []
+    for nummer, rang in enumerate(sorted(gewaehlt), start=1):
+        fall = treffer[rang][0]
+        titel.append(fall.get('fall_titel', ''))
+        zeilen.append(_kopfzeile(nummer, fall))
+        zeilen.extend(_feldzeile(feld, gewaehlt[rang][feld]) for feld in FELDER if feld in gewaehlt[rang])
+    text = "\n".join(zeilen)
+    return KontextPaket(text, tuple(titel), zaehler.anzahl(text), sum(map(len, gewaehlt.values())),
+                        duplikate, ausgelassen)
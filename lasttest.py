@@ -0,0 +1,304 @@
+# lasttest.py
+"""
+Last- und Latenztest der App-Logik ohne echte Gemini-Aufrufe.
+
+`genai.GenerativeModel` wird durch ein lokales Fake-Modell ersetzt, das realistische
+Latenzen (log-normal verteilte Time-to-first-Token plus Token-Rate) und zufällige
+Fehler simuliert. Die Szenarien rufen die echten Funktionen der App auf:
+
+    chatbot    -> chatbot_logik.get_chatbot_response
+    retrieval  -> datenbank.finde_relevantesten_fall
+    fall       -> klausur_logik.generiere_fall_gemini
+    bewertung  -> klausur_logik.bewerte_loesung_gemini
+
+Aufruf:
+    python lasttest.py --parallel 1 8 32 --anfragen 100
+    python lasttest.py --szenarien chatbot --fehlerquote 0.05 --vergleiche benchmark_ergebnisse/alt.json
+
+Die Ergebnisse (p50/p95/p99, Durchsatz, Speicher) landen als JSON in benchmark_ergebnisse/,
+zusammen mit dem Git-Commit, damit Läufe zwischen Commits verglichen werden können.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from unittest import mock
+
+import numpy as np
+
+import google.generativeai as genai
+
+
+# --- FAKE-GEMINI ---
+
+class FakeKonfiguration:
+    """Verteilungsparameter des Fake-Modells; wird von allen Instanzen geteilt."""
+    latenz_median_s = 1.5    # Median der Time-to-first-Token
+    latenz_sigma = 0.5       # Streuung der log-normalen Verteilung
+    tokens_pro_s = 60.0      # Ausgabegeschwindigkeit nach dem ersten Token
+    fehlerquote = 0.0        # Anteil der Aufrufe, die mit einer Ausnahme enden
+    zeitfaktor = 1.0         # < 1 beschleunigt alle Wartezeiten (z.B. für schnelle Rauchtests)
+
+
+class _FakeAntwort:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """Ersetzt genai.GenerativeModel mit gleicher Aufrufsignatur."""
+
+    def __init__(self, model_name=None, system_instruction=None, **kwargs):
+        self.model_name = model_name
+        self.system_instruction = system_instruction or ""
+
+    def _antwort_text(self, prompt):
+        if "Korrekturassistent" in self.system_instruction:
+            return "```json\n" + json.dumps({
+                "übereinstimmung_lösungsskizze": random.randint(30, 95),
+                "feedback_struktur": "Die Gliederung trifft die wesentlichen Prüfungspunkte. " * 2,
+                "feedback_gutachtenstil": "Der Gutachtenstil wird überwiegend eingehalten. " * 2,
+                "feedback_materielles_recht": "Die Anspruchsgrundlage wurde richtig erkannt. " * 2,
+                "fazit": "Solide Leistung mit Luft nach oben.",
+                "verbesserungsvorschlag": "Beginne jeden Prüfungspunkt mit einem klaren Obersatz.",
+            }, ensure_ascii=False) + "\n```"
+        if "Fall-Architekt" in self.system_instruction:
+            treffer = [int(z) for z in self.system_instruction.split("Schwierigkeitsgrad:")[-1][:4].split() if z.isdigit()]
+            return json.dumps({
+                "rechtsgebiet": "BGB AT",
+                "thema": "Anfechtung wegen Inhaltsirrtums",
+                "schwierigkeit": treffer[0] if treffer else 2,
+                "bearbeitungszeit": 180,
+                "sachverhalt": "A verkauft B ein Fahrrad, verschreibt sich aber beim Preis. " * 20,
+                "lösungsskizze": ["A. Anspruch aus § 433 II BGB", "  I. Vertragsschluss", "  II. Anfechtung, § 142 I BGB"],
+            }, ensure_ascii=False)
+        return "Das Abstraktionsprinzip trennt Verpflichtungs- und Verfügungsgeschäft. " * 8
+
+    def _warte_erstes_token(self):
+        k = FakeKonfiguration
+        time.sleep(random.lognormvariate(np.log(k.latenz_median_s), k.latenz_sigma) * k.zeitfaktor)
+        if random.random() < k.fehlerquote:
+            raise RuntimeError("503 Service Unavailable (simuliert)")
+
+    def _stream(self, text):
+        k = FakeKonfiguration
+        woerter = text.split(" ")
+        for i in range(0, len(woerter), 8):
+            time.sleep(8 / k.tokens_pro_s * k.zeitfaktor)
+            yield _FakeAntwort(" ".join(woerter[i:i + 8]) + " ")
+
+    def generate_content(self, prompt, generation_config=None, stream=False, **kwargs):
+        self._warte_erstes_token()
+        text = self._antwort_text(prompt)
+        if stream:
+            return self._stream(text)
+        time.sleep(len(text.split()) / FakeKonfiguration.tokens_pro_s * FakeKonfiguration.zeitfaktor)
+        return _FakeAntwort(text)
+
+
+class HashEmbeddingModell:
+    """
+    Deterministisches Ersatz-Embedding (Summe zufälliger Token-Vektoren), falls das echte
+    MiniLM-Modell nicht geladen werden soll. Simuliert eine feste Kodierzeit pro Aufruf.
+    """
+
+    def __init__(self, dimension=384, latenz_ms=15):
+        self.dimension = dimension
+        self.latenz = latenz_ms / 1000
+        self._lock = threading.Lock()  # wie ein echtes Modell: ein Forward-Pass zur Zeit
+
+    def _vektor(self, text):
+        vektor = np.zeros(self.dimension, dtype=np.float32)
+        for token in text.lower().split():
+            seed = int.from_bytes(hashlib.sha256(token.encode("utf-8")).digest()[:8], "little")
+            vektor += np.random.default_rng(seed).standard_normal(self.dimension, dtype=np.float32)
+        return vektor
+
+    def encode(self, texte, **kwargs):
+        with self._lock:
+            time.sleep(self.latenz)
+        if isinstance(texte, str):
+            return self._vektor(texte)
+        return np.stack([self._vektor(t) for t in texte]) if texte else np.zeros((0, self.dimension), dtype=np.float32)
+
+
+# --- SZENARIEN ---
+
+def _beispiel_anfragen(faelle):
+    vorlagen = ["Was versteht man unter {}?", "Erkläre mir {}", "{} – wie prüfe ich das?", "Frage zu {}"]
+    return [random.choice(vorlagen).format(f["zentrales_problem"]) for f in faelle]
+
+
+def baue_szenarien(faelle, modell, fall_index):
+    """
+    Szenarien als Funktion von (Lauf-Schlüssel, i). Der Schlüssel ist pro Lauf und
+    Parallelitätsstufe eindeutig, damit keine Stufe Antworten einer früheren aus dem
+    Antwort- oder Bewertungs-Cache bekommt.
+    """
+    from chatbot_logik import get_chatbot_response
+    from datenbank import finde_relevantesten_fall
+    from klausur_logik import generiere_fall_gemini, bewerte_loesung_gemini
+
+    anfragen = _beispiel_anfragen(faelle)
+    loesung = "A könnte gegen B einen Anspruch auf Zahlung aus § 433 II BGB haben. " * 15
+
+    return {
+        "chatbot": lambda lauf, i: get_chatbot_response(f"{anfragen[i % len(anfragen)]} (#{lauf}-{i})", faelle, modell, fall_index),
+        "retrieval": lambda lauf, i: finde_relevantesten_fall(anfragen[i % len(anfragen)], faelle, modell, fall_index),
+        "fall": lambda lauf, i: generiere_fall_gemini(schwierigkeit=i % 6, tags=["anfänger"]),
+        "bewertung": lambda lauf, i: bewerte_loesung_gemini("Sachverhalt", ["A. Anspruch aus § 433 II BGB"], f"{loesung} ({lauf}-{i})"),
+    }
+
+
+def fuehre_aus(funktion, anfragen, parallel, lauf):
+    latenzen = []
+    fehler = 0
+    lock = threading.Lock()
+
+    def einzeln(i):
+        nonlocal fehler
+        start = time.perf_counter()
+        try:
+            funktion(lauf, i)
+            ok = True
+        except Exception:
+            ok = False
+        dauer = time.perf_counter() - start
+        with lock:
+            latenzen.append(dauer)
+            fehler += 0 if ok else 1
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        list(executor.map(einzeln, range(anfragen)))
+    gesamt = time.perf_counter() - start
+    _, spitze = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "parallel": parallel,
+        "anfragen": anfragen,
+        "fehler": fehler,
+        "p50_ms": float(np.percentile(latenzen, 50) * 1000),
+        "p95_ms": float(np.percentile(latenzen, 95) * 1000),
+        "p99_ms": float(np.percentile(latenzen, 99) * 1000),
+        "durchsatz_pro_s": anfragen / gesamt,
+        "python_heap_spitze_mb": spitze / 2**20,
+        "rss_max_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unbekannt"
+
+
+def vergleiche(alt_pfad, neu):
+    with open(alt_pfad, "r", encoding="utf-8") as f:
+        alt = json.load(f)
+    alte_laeufe = {(l["szenario"], l["parallel"]): l for l in alt["laeufe"]}
+    print(f"\nVergleich mit {alt_pfad} (Commit {alt.get('commit')}):")
+    for lauf in neu["laeufe"]:
+        vorher = alte_laeufe.get((lauf["szenario"], lauf["parallel"]))
+        if not vorher:
+            continue
+        delta = (lauf["p95_ms"] - vorher["p95_ms"]) / vorher["p95_ms"] * 100 if vorher["p95_ms"] else 0.0
+        print(f"  {lauf['szenario']:>10} x{lauf['parallel']:<4} p95 {vorher['p95_ms']:9.1f} -> {lauf['p95_ms']:9.1f} ms ({delta:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--szenarien", nargs="+", default=["retrieval", "chatbot", "fall", "bewertung"])
+    parser.add_argument("--parallel", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--anfragen", type=int, default=100, help="Aufrufe pro Szenario und Parallelitätsstufe")
+    parser.add_argument("--latenz-median", type=float, default=FakeKonfiguration.latenz_median_s)
+    parser.add_argument("--latenz-sigma", type=float, default=FakeKonfiguration.latenz_sigma)
+    parser.add_argument("--tokens-pro-s", type=float, default=FakeKonfiguration.tokens_pro_s)
+    parser.add_argument("--fehlerquote", type=float, default=FakeKonfiguration.fehlerquote)
+    parser.add_argument("--zeitfaktor", type=float, default=FakeKonfiguration.zeitfaktor)
+    parser.add_argument("--echtes-embedding", action="store_true", help="MiniLM statt Hash-Embedding verwenden")
+    parser.add_argument("--ausgabe", default="benchmark_ergebnisse")
+    parser.add_argument("--vergleiche", help="Früheres Ergebnis-JSON zum Vergleich")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mit-caches", action="store_true",
+                        help="Antwort- und Bewertungs-Cache wie in der App verwenden (Standard: aus)")
+    args = parser.parse_args()
+
+    if not args.mit_caches:
+        # Gemessen wird der ungecachte Pfad: keine semantischen Treffer, leerer Bewertungs-Cache pro Lauf
+        os.environ["JURAKI_ANTWORT_CACHE_SCHWELLE"] = "1.01"
+        os.environ["JURAKI_BEWERTUNGS_CACHE"] = tempfile.mkdtemp(prefix="lasttest-bewertungen-")
+    lauf_nonce = os.urandom(4).hex()
+
+    random.seed(args.seed)
+    FakeKonfiguration.latenz_median_s = args.latenz_median
+    FakeKonfiguration.latenz_sigma = args.latenz_sigma
+    FakeKonfiguration.tokens_pro_s = args.tokens_pro_s
+    FakeKonfiguration.fehlerquote = args.fehlerquote
+    FakeKonfiguration.zeitfaktor = args.zeitfaktor
+
+    with mock.patch.object(genai, "GenerativeModel", FakeGenerativeModel):
+        import datenbank
+        from datenbank import lade_faelle, lade_embedding_modell, lade_embedding_dienst, erstelle_fall_index
+        from embedding_dienst import EmbeddingBatcher
+        from einstellungen import EMBEDDING_BATCH_GROESSE, EMBEDDING_BATCH_WARTEZEIT_MS
+        from vektor_suche import baue_index
+
+        faelle = lade_faelle("zivilrecht-faelle-json.json")
+        if args.echtes_embedding:
+            fall_index = erstelle_fall_index(faelle, lade_embedding_modell())
+            modell = lade_embedding_dienst()
+        else:
+            hash_modell = HashEmbeddingModell()
+            fall_index = baue_index(hash_modell.encode([f["zentrales_problem"] for f in faelle]))
+            # Wie in der App laufen Anfrage-Embeddings über den Micro-Batching-Dienst
+            modell = EmbeddingBatcher(hash_modell, EMBEDDING_BATCH_GROESSE, EMBEDDING_BATCH_WARTEZEIT_MS)
+            # Auch die lokale Strukturbewertung nutzt das Hash-Embedding statt MiniLM zu laden
+            datenbank.geladener_embedding_dienst = lambda: modell
+        szenarien = baue_szenarien(faelle, modell, fall_index)
+
+        ergebnis = {
+            "commit": git_commit(),
+            "zeitpunkt": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "konfiguration": {k: v for k, v in vars(args).items() if k not in ("ausgabe", "vergleiche")},
+            "laeufe": [],
+        }
+        print(f"{'Szenario':>10} {'par':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'Fehler':>6} {'Heap MB':>8}")
+        for name in args.szenarien:
+            for parallel in args.parallel:
+                lauf = {"szenario": name, **fuehre_aus(szenarien[name], args.anfragen, parallel, f"{lauf_nonce}-{parallel}")}
+                ergebnis["laeufe"].append(lauf)
+                print(f"{name:>10} {parallel:>4} {lauf['p50_ms']:>9.1f} {lauf['p95_ms']:>9.1f} {lauf['p99_ms']:>9.1f} "
+                      f"{lauf['durchsatz_pro_s']:>8.2f} {lauf['fehler']:>6} {lauf['python_heap_spitze_mb']:>8.1f}")
+
+    from llm_client import llm_statistik
+    from llm_gateway import hole_gateway
+    ergebnis["llm_statistik"] = llm_statistik.statistik()
+    ergebnis["gateway_statistik"] = hole_gateway().statistik()
+
+    os.makedirs(args.ausgabe, exist_ok=True)
+    pfad = os.path.join(args.ausgabe, f"{datetime.now():%Y%m%d-%H%M%S}-{ergebnis['commit']}.json")
+    with open(pfad, "w", encoding="utf-8") as f:
+        json.dump(ergebnis, f, ensure_ascii=False, indent=2)
+    print(f"\nErgebnis gespeichert: {pfad}")
+
+    if args.vergleiche:
+        vergleiche(args.vergleiche, ergebnis)
+
+
+if __name__ == "__main__":
+    main()
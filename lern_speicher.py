@@ -0,0 +1,271 @@
+# lern_speicher.py
+"""
+Dauerhafte Speicherung von Lernhistorie, Erfolgen und Nutzerprofil.
+
+`LernSpeicher` beschreibt die Repository-API; `SQLiteLernSpeicher` ist die Standard-
+Implementierung (WAL-Modus, Verbindungspool, Indizes auf Nutzer und Datum). Mit
+`WriteBehindSpeicher` lässt sich jeder Speicher so umhüllen, dass Schreibzugriffe in einer
+Warteschlange landen und gebündelt von einem Hintergrund-Thread geschrieben werden.
+"""
+import atexit
+import json
+import queue
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+
+import streamlit as st
+
+from einstellungen import LERN_SPEICHER_BACKEND, LERN_SPEICHER_ZIEL
+
+
+class LernSpeicher(ABC):
+    """Schnittstelle für austauschbare Speicher-Backends."""
+
+    @abstractmethod
+    def speichere_ergebnisse(self, user_id, ergebnisse):
+        """Hängt Einträge der Lernhistorie an (Liste von Dicts mit mindestens 'datum')."""
+
+    @abstractmethod
+    def lade_historie(self, user_id, von=None, bis=None, limit=None):
+        """Lernhistorie eines Nutzers, aufsteigend nach Datum, optional gefiltert."""
+
+    @abstractmethod
+    def speichere_erfolge(self, user_id, erfolge):
+        """Speichert freigeschaltete Erfolge (Liste von Dicts mit 'id')."""
+
+    @abstractmethod
+    def lade_erfolge(self, user_id):
+        """Freigeschaltete Erfolge in der Reihenfolge der Freischaltung."""
+
+    @abstractmethod
+    def speichere_profil(self, user_id, profil):
+        """Speichert oder ersetzt das Nutzerprofil."""
+
+    @abstractmethod
+    def lade_profil(self, user_id):
+        """Nutzerprofil oder None."""
+
+    def leere_puffer(self):
+        """Wartet, bis alle gepufferten Schreibzugriffe erledigt sind (Standard: nichts zu tun)."""
+
+    def schliessen(self):
+        """Gibt Ressourcen frei."""
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lernhistorie (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    datum TEXT NOT NULL,
+    thema TEXT,
+    schwierigkeit INTEGER,
+    bewertung INTEGER,
+    daten TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_lernhistorie_user_datum ON lernhistorie (user_id, datum);
+
+CREATE TABLE IF NOT EXISTS erfolge (
+    user_id TEXT NOT NULL,
+    erfolg_id TEXT NOT NULL,
+    freigeschaltet_am TEXT NOT NULL,
+    daten TEXT NOT NULL,
+    PRIMARY KEY (user_id, erfolg_id)
+);
+
+CREATE TABLE IF NOT EXISTS profile (
+    user_id TEXT PRIMARY KEY,
+    daten TEXT NOT NULL,
+    aktualisiert_am TEXT NOT NULL
+);
+"""
+
+
+def _ergebnis_zu_json(ergebnis):
+    return json.dumps({k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in ergebnis.items()},
+                      ensure_ascii=False)
+
+
+def _json_zu_ergebnis(daten):
+    ergebnis = json.loads(daten)
+    ergebnis["datum"] = datetime.fromisoformat(ergebnis["datum"])
+    return ergebnis
+
+
+class SQLiteLernSpeicher(LernSpeicher):
+    """SQLite im WAL-Modus: parallele Leser blockieren den Schreiber nicht."""
+
+    def __init__(self, pfad, pool_groesse=4):
+        self.pfad = pfad
+        self._pool = queue.Queue()
+        for _ in range(pool_groesse):
+            self._pool.put(self._neue_verbindung())
+        with self._verbindung() as verbindung:
+            verbindung.executescript(SCHEMA)
+
+    def _neue_verbindung(self):
+        verbindung = sqlite3.connect(self.pfad, check_same_thread=False, timeout=30)
+        verbindung.execute("PRAGMA journal_mode=WAL")
+        verbindung.execute("PRAGMA synchronous=NORMAL")
+        return verbindung
+
+    @contextmanager
+    def _verbindung(self):
+        """Leiht eine Verbindung aus dem Pool; Transaktion wird bei Erfolg committet."""
+        verbindung = self._pool.get()
+        try:
+            with verbindung:
+                yield verbindung
+        finally:
+            self._pool.put(verbindung)
+
+    def speichere_ergebnisse(self, user_id, ergebnisse):
+        zeilen = [
+            (user_id, e["datum"].isoformat(), e.get("thema"), e.get("schwierigkeit"), e.get("bewertung"), _ergebnis_zu_json(e))
+            for e in ergebnisse
+        ]
+        with self._verbindung() as verbindung:
+            verbindung.executemany(
+                "INSERT INTO lernhistorie (user_id, datum, thema, schwierigkeit, bewertung, daten) VALUES (?, ?, ?, ?, ?, ?)",
+                zeilen,
+            )
+
+    def lade_historie(self, user_id, von=None, bis=None, limit=None):
+        sql = "SELECT daten FROM lernhistorie WHERE user_id = ?"
+        parameter = [user_id]
+        if von is not None:
+            sql += " AND datum >= ?"
+            parameter.append(von.isoformat())
+        if bis is not None:
+            sql += " AND datum < ?"
+            parameter.append(bis.isoformat())
+        sql += " ORDER BY datum, id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameter.append(limit)
+        with self._verbindung() as verbindung:
+            return [_json_zu_ergebnis(zeile[0]) for zeile in verbindung.execute(sql, parameter)]
+
+    def speichere_erfolge(self, user_id, erfolge):
+        jetzt = datetime.now().isoformat()
+        with self._verbindung() as verbindung:
+            verbindung.executemany(
+                "INSERT OR IGNORE INTO erfolge (user_id, erfolg_id, freigeschaltet_am, daten) VALUES (?, ?, ?, ?)",
+                [(user_id, e["id"], jetzt, json.dumps(e, ensure_ascii=False)) for e in erfolge],
+            )
+
+    def lade_erfolge(self, user_id):
+        with self._verbindung() as verbindung:
+            zeilen = verbindung.execute(
+                "SELECT daten FROM erfolge WHERE user_id = ? ORDER BY freigeschaltet_am, rowid", (user_id,)
+            )
+            return [json.loads(zeile[0]) for zeile in zeilen]
+
+    def speichere_profil(self, user_id, profil):
+        with self._verbindung() as verbindung:
+            verbindung.execute(
+                "INSERT OR REPLACE INTO profile (user_id, daten, aktualisiert_am) VALUES (?, ?, ?)",
+                (user_id, json.dumps(profil, ensure_ascii=False), datetime.now().isoformat()),
+            )
+
+    def lade_profil(self, user_id):
+        with self._verbindung() as verbindung:
+            zeile = verbindung.execute("SELECT daten FROM profile WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(zeile[0]) if zeile else None
+
+    def schliessen(self):
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+
+class WriteBehindSpeicher(LernSpeicher):
+    """
+    Umhüllt einen Speicher: Schreibzugriffe kehren sofort zurück und werden von einem
+    Hintergrund-Thread gebündelt (bis `max_batch` Aufträge pro Durchgang) geschrieben.
+    Lesezugriffe gehen direkt an den Speicher und sehen noch ausstehende Aufträge nicht;
+    die UI hält frische Daten ohnehin in st.session_state. Beim Beenden des Prozesses
+    (Neustart, Redeploy) wird der Puffer noch geleert, bevor der Daemon-Thread endet.
+    """
+
+    def __init__(self, speicher, max_batch=100):
+        self.speicher = speicher
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._arbeite, name="lern-speicher", daemon=True)
+        self._thread.start()
+        atexit.register(self.leere_puffer)
+
+    def _arbeite(self):
+        while True:
+            auftraege = [self._queue.get()]
+            while len(auftraege) < self.max_batch:
+                try:
+                    auftraege.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._schreibe(auftraege)
+            for _ in auftraege:
+                self._queue.task_done()
+
+    def _schreibe(self, auftraege):
+        # Ergebnisse desselben Nutzers zu einem executemany zusammenfassen
+        ergebnisse = {}
+        for art, user_id, daten in auftraege:
+            try:
+                if art == "ergebnisse":
+                    ergebnisse.setdefault(user_id, []).extend(daten)
+                elif art == "erfolge":
+                    self.speicher.speichere_erfolge(user_id, daten)
+                elif art == "profil":
+                    self.speicher.speichere_profil(user_id, daten)
+            except Exception as e:
+                print(f"Fehler beim Schreiben in den Lern-Speicher ({art}): {e}")
+        for user_id, liste in ergebnisse.items():
+            try:
+                self.speicher.speichere_ergebnisse(user_id, liste)
+            except Exception as e:
+                print(f"Fehler beim Schreiben in den Lern-Speicher (ergebnisse): {e}")
+
+    def speichere_ergebnisse(self, user_id, ergebnisse):
+        self._queue.put(("ergebnisse", user_id, list(ergebnisse)))
+
+    def speichere_erfolge(self, user_id, erfolge):
+        self._queue.put(("erfolge", user_id, list(erfolge)))
+
+    def speichere_profil(self, user_id, profil):
+        self._queue.put(("profil", user_id, dict(profil)))
+
+    def lade_historie(self, user_id, von=None, bis=None, limit=None):
+        return self.speicher.lade_historie(user_id, von, bis, limit)
+
+    def lade_erfolge(self, user_id):
+        return self.speicher.lade_erfolge(user_id)
+
+    def lade_profil(self, user_id):
+        return self.speicher.lade_profil(user_id)
+
+    def leere_puffer(self):
+        self._queue.join()
+
+    def schliessen(self):
+        self.leere_puffer()
+        self.speicher.schliessen()
+
+
+BACKENDS = {"sqlite": SQLiteLernSpeicher}
+
+
+def erstelle_speicher(backend, ziel, write_behind=True):
+    """Erzeugt das konfigurierte Backend, standardmäßig mit Write-Behind-Puffer."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unbekanntes Speicher-Backend: {backend}")
+    speicher = BACKENDS[backend](ziel)
+    return WriteBehindSpeicher(speicher) if write_behind else speicher
+
+
+@st.cache_resource # Ein Speicher (samt Verbindungspool und Schreib-Thread) pro Prozess
+def lade_lern_speicher():
+    """Lädt das konfigurierte Speicher-Backend für Lernhistorie, Erfolge und Profile."""
+    return erstelle_speicher(LERN_SPEICHER_BACKEND, LERN_SPEICHER_ZIEL)
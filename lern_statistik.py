@@ -0,0 +1,121 @@
+# lern_statistik.py
+"""
+Laufende Kennzahlen für das Dashboard "Mein Fortschritt".
+
+`LernStatistik` wird einmal beim Session-Start aus der Lernhistorie aufgebaut und danach pro
+neuem Ergebnis in O(1) aktualisiert. Neben Anzahl, Summe und Bestwert hält sie Summen und
+Anzahlen in Zeit-Buckets (Tag und Woche), jeweils gesamt und pro (Rechtsgebiet, Schwierigkeit).
+Der Aufwand beim Rendern hängt damit nur von der Zahl der Tage bzw. Wochen ab, nicht von der
+Zahl der Ergebnisse.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+
+import numpy as np
+
+PERIODEN = ("tag", "woche")
+UNBEKANNT = "Unbekannt"
+
+
+def wochenbeginn(tag):
+    """Montag der Kalenderwoche eines Datums."""
+    return tag - timedelta(days=tag.weekday())
+
+
+def _periode(tag, periode):
+    return tag if periode == "tag" else wochenbeginn(tag)
+
+
+class LernStatistik:
+    """Summen und Anzahlen der Bewertungen, gesamt und pro Zeit-Bucket."""
+
+    def __init__(self):
+        self.anzahl = 0
+        self.summe = 0
+        self.max_bewertung = None
+        # periode -> {Bucket-Datum: [Summe, Anzahl]}
+        self.verlauf_buckets = {p: defaultdict(lambda: [0, 0]) for p in PERIODEN}
+        # periode -> {(Bucket-Datum, Rechtsgebiet, Schwierigkeit): [Summe, Anzahl]}
+        self.gruppen_buckets = {p: defaultdict(lambda: [0, 0]) for p in PERIODEN}
+
+    @property
+    def durchschnitt(self):
+        return self.summe / self.anzahl if self.anzahl else 0.0
+
+    def _addiere(self, tag, rechtsgebiet, schwierigkeit, summe, anzahl):
+        for periode in PERIODEN:
+            bucket = _periode(tag, periode)
+            eintrag = self.verlauf_buckets[periode][bucket]
+            eintrag[0] += summe
+            eintrag[1] += anzahl
+            eintrag = self.gruppen_buckets[periode][(bucket, rechtsgebiet or UNBEKANNT, schwierigkeit)]
+            eintrag[0] += summe
+            eintrag[1] += anzahl
+
+    def aktualisiere(self, ergebnis):
+        bewertung = ergebnis.get('bewertung', 0) or 0
+        self.anzahl += 1
+        self.summe += bewertung
+        self.max_bewertung = bewertung if self.max_bewertung is None else max(self.max_bewertung, bewertung)
+        self._addiere(ergebnis['datum'].date(), ergebnis.get('rechtsgebiet'), ergebnis.get('schwierigkeit', 0) or 0,
+                      bewertung, 1)
+
+    @classmethod
+    def aus_historie(cls, lernhistorie):
+        """
+        Einmaliger Aufbau. Bei einer kompakten Lernhistorie wird über die Spalten gruppiert
+        (np.unique + np.bincount), sonst Ergebnis für Ergebnis.
+        """
+        statistik = cls()
+        if not hasattr(lernhistorie, "codes"):
+            for ergebnis in lernhistorie:
+                statistik.aktualisiere(ergebnis)
+            return statistik
+        if not len(lernhistorie):
+            return statistik
+
+        bewertung = lernhistorie.bewertung.astype(np.int64)
+        statistik.anzahl = len(bewertung)
+        statistik.summe = int(bewertung.sum())
+        statistik.max_bewertung = int(bewertung.max())
+
+        # Ein int64-Schlüssel pro Ergebnis: Tag | Rechtsgebiet-Code | Schwierigkeit
+        tage = lernhistorie.datum.astype("datetime64[D]").astype(np.int64)
+        schluessel = (tage << 36) | (lernhistorie.codes("rechtsgebiet").astype(np.int64) << 8) \
+            | lernhistorie.schwierigkeit.astype(np.int64)
+        gruppen, zuordnung = np.unique(schluessel, return_inverse=True)
+        summen = np.bincount(zuordnung, weights=bewertung, minlength=len(gruppen))
+        anzahlen = np.bincount(zuordnung, minlength=len(gruppen))
+        epoche = date(1970, 1, 1)
+        for gruppe, summe, anzahl in zip(gruppen.tolist(), summen.tolist(), anzahlen.tolist()):
+            statistik._addiere(epoche + timedelta(days=gruppe >> 36), lernhistorie.text((gruppe >> 8) & 0xFFFFFFF),
+                               gruppe & 0xFF, int(summe), anzahl)
+        return statistik
+
+    # --- Abfragen für das Dashboard ---
+
+    def verlauf(self, periode="tag"):
+        """(Bucket-Daten, Durchschnitte) aufsteigend nach Datum."""
+        buckets = sorted(self.verlauf_buckets[periode].items())
+        return [b for b, _ in buckets], [s / n for _, (s, n) in buckets]
+
+    def rechtsgebiete(self):
+        return sorted({rg for _, rg, _ in self.gruppen_buckets["woche"]})
+
+    def verlauf_nach_rechtsgebiet(self, periode="woche", schwierigkeit=None):
+        """{Rechtsgebiet: {Bucket-Datum: Durchschnitt}}, optional nur für eine Schwierigkeit."""
+        summen = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+        for (bucket, rechtsgebiet, stufe), (s, n) in self.gruppen_buckets[periode].items():
+            if schwierigkeit is None or stufe == schwierigkeit:
+                eintrag = summen[rechtsgebiet][bucket]
+                eintrag[0] += s
+                eintrag[1] += n
+        return {rg: {b: s / n for b, (s, n) in werte.items()} for rg, werte in summen.items()}
+
+    def uebersicht(self):
+        """Liste von (Rechtsgebiet, Schwierigkeit, Anzahl, Durchschnitt) über den ganzen Zeitraum."""
+        summen = defaultdict(lambda: [0, 0])
+        for (_, rechtsgebiet, stufe), (s, n) in self.gruppen_buckets["woche"].items():
+            summen[(rechtsgebiet, stufe)][0] += s
+            summen[(rechtsgebiet, stufe)][1] += n
+        return [(rg, stufe, n, s / n) for (rg, stufe), (s, n) in sorted(summen.items())]
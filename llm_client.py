@@ -0,0 +1,170 @@
+# llm_client.py
+"""
+Gemeinsame Client-Schicht für alle Gemini-Aufrufe.
+
+- google-generativeai wird erst beim ersten Aufruf importiert und dann einmal pro Prozess
+  konfiguriert (st.secrets oder Umgebungsvariable); der Import kostet beim Kaltstart spürbar Zeit.
+- Pro (Modell, System-Prompt) wird genau ein `GenerativeModel` gebaut und wiederverwendet.
+  Alle Modelle teilen sich den Standard-Client von google-generativeai und damit einen
+  dauerhaften gRPC-Kanal (HTTP/2 mit Keep-Alive) statt neuer Verbindungen pro Anfrage.
+- Jeder Aufruf misst getrennt die Setup-Zeit (Modell holen/bauen) und die Netzwerkzeit.
+- Alle Aufrufe laufen über das `llm_gateway` (Parallelitätslimit, Prioritäten, Wiederholungen).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+import streamlit as st
+
+from einstellungen import GEMINI_MODELL
+from llm_gateway import PRIORITAET_INTERAKTIV, hole_gateway
+from messung import span, erfasse_dauer
+
+
+def konfiguriere_api(genai):
+    """Setzt den API-Key aus st.secrets, ersatzweise aus der Umgebungsvariable GOOGLE_API_KEY."""
+    try:
+        # Greift auf den Key aus der secrets.toml zu
+        api_key = st.secrets["GOOGLE_API_KEY"]
+    except (AttributeError, KeyError, FileNotFoundError):
+        api_key = os.environ.get("GOOGLE_API_KEY")
+    if api_key:
+        genai.configure(api_key=api_key)
+
+
+_genai = None
+_genai_lock = threading.Lock()
+
+
+def lade_genai():
+    """Importiert und konfiguriert google-generativeai beim ersten Bedarf (thread-sicher)."""
+    global _genai
+    if _genai is None:
+        with _genai_lock:
+            if _genai is None:
+                import google.generativeai as genai
+                konfiguriere_api(genai)
+                _genai = genai
+    return _genai
+
+
+def chunk_text(chunk):
+    """Text eines Stream-Chunks; Chunks ohne Text-Teile (z.B. nur finish_reason) ergeben ""."""
+    try:
+        return chunk.text
+    except ValueError:
+        return ""
+
+
+# --- MODELL-CACHE ---
+
+_modelle = {}
+_modelle_lock = threading.Lock()
+
+
+def hole_modell(system_instruction, model_name=GEMINI_MODELL):
+    """Gibt das (einmalig gebaute) GenerativeModel für diese Kombination zurück."""
+    schluessel = (model_name, system_instruction)
+    modell = _modelle.get(schluessel)
+    if modell is None:
+        with _modelle_lock:
+            modell = _modelle.get(schluessel)
+            if modell is None:
+                modell = lade_genai().GenerativeModel(model_name=model_name, system_instruction=system_instruction)
+                _modelle[schluessel] = modell
+    return modell
+
+
+# --- MESSUNG ---
+
+class LLMStatistik:
+    """Summiert Setup- und Netzwerkzeiten pro Aufrufstelle."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._daten = {}
+
+    def erfasse(self, name, setup_s, netzwerk_s):
+        with self._lock:
+            eintrag = self._daten.setdefault(name, {"aufrufe": 0, "setup_s": 0.0, "netzwerk_s": 0.0, "max_setup_s": 0.0})
+            eintrag["aufrufe"] += 1
+            eintrag["setup_s"] += setup_s
+            eintrag["netzwerk_s"] += netzwerk_s
+            eintrag["max_setup_s"] = max(eintrag["max_setup_s"], setup_s)
+
+    def statistik(self):
+        """Pro Aufrufstelle: Anzahl sowie mittlere Setup- und Netzwerkzeit in Millisekunden."""
+        with self._lock:
+            return {
+                name: {
+                    "aufrufe": e["aufrufe"],
+                    "setup_ms_mittel": e["setup_s"] / e["aufrufe"] * 1000,
+                    "setup_ms_max": e["max_setup_s"] * 1000,
+                    "netzwerk_ms_mittel": e["netzwerk_s"] / e["aufrufe"] * 1000,
+                }
+                for name, e in self._daten.items()
+            }
+
+
+llm_statistik = LLMStatistik()
+
+
+def _anfrage_schluessel(system_instruction, prompt, kwargs):
+    """Schlüssel für das Zusammenfassen identischer Anfragen im Gateway."""
+    roh = json.dumps([GEMINI_MODELL, system_instruction, prompt, kwargs], sort_keys=True, default=repr)
+    return hashlib.sha256(roh.encode("utf-8")).hexdigest()
+
+
+def _generiere_direkt(name, system_instruction, prompt, **kwargs):
+    # Ein Span pro Versuch; Wiederholungen des Gateways erscheinen als eigene Kind-Spans
+    with span("gemini_versuch", aufruf=name):
+        start = time.perf_counter()
+        modell = hole_modell(system_instruction)
+        setup_ende = time.perf_counter()
+        try:
+            return modell.generate_content(prompt, **kwargs)
+        finally:
+            llm_statistik.erfasse(name, setup_ende - start, time.perf_counter() - setup_ende)
+
+
+def _generiere_stream_direkt(name, system_instruction, prompt, **kwargs):
+    start = time.perf_counter()
+    modell = hole_modell(system_instruction)
+    setup_ende = time.perf_counter()
+    erster_chunk = True
+    try:
+        for chunk in modell.generate_content(prompt, stream=True, **kwargs):
+            text = chunk_text(chunk)
+            if text:
+                if erster_chunk:
+                    erfasse_dauer("gemini_erster_chunk", time.perf_counter() - start)
+                    erster_chunk = False
+                yield text
+    finally:
+        ende = time.perf_counter()
+        llm_statistik.erfasse(name, setup_ende - start, ende - setup_ende)
+        # Über mehrere yields hinweg kein Kontextmanager: Dauer bis zum letzten Chunk direkt eintragen
+        erfasse_dauer("gemini_stream", ende - start)
+
+
+def generiere(name, system_instruction, prompt, prioritaet=PRIORITAET_INTERAKTIV, zusammenfassen=True, **kwargs):
+    """
+    generate_content über das geteilte Modell; `name` kennzeichnet die Aufrufstelle in der Statistik.
+    Mit `zusammenfassen` teilen sich gleichzeitige, identische Anfragen eine Antwort – für
+    Aufrufe, die bewusst verschiedene Ergebnisse liefern sollen (Fallgenerierung), abschalten.
+    """
+    schluessel = _anfrage_schluessel(system_instruction, prompt, kwargs) if zusammenfassen else None
+    # Gesamtzeit inklusive Warteschlange, Rate-Limit und Wiederholungen
+    with span("gemini", aufruf=name):
+        return hole_gateway().ausfuehren(
+            lambda: _generiere_direkt(name, system_instruction, prompt, **kwargs), prioritaet, schluessel
+        )
+
+
+def generiere_stream(name, system_instruction, prompt, prioritaet=PRIORITAET_INTERAKTIV, **kwargs):
+    """Wie generiere, aber gestreamt; liefert die Texte der Chunks. Netzwerkzeit bis zum letzten Chunk."""
+    return hole_gateway().ausfuehren_stream(
+        lambda: _generiere_stream_direkt(name, system_instruction, prompt, **kwargs), prioritaet
+    )
@@ -0,0 +1,367 @@
+# llm_gateway.py
+"""
+Asynchrones Gateway vor allen Gemini-Aufrufen.
+
+Die Streamlit-Threads reichen ihre (blockierenden) Aufrufe an eine asyncio-Schleife in einem
+eigenen Thread weiter. Dort gelten prozessweit:
+
+- ein Limit für gleichzeitige Anfragen mit Prioritätsklassen (Chat vor Hintergrundarbeit),
+- ein Token-Bucket für die Anfragerate,
+- Zusammenfassen identischer, gleichzeitig laufender Anfragen (ein gemeinsames Future),
+- ein Circuit Breaker, der bei einer Störung des Anbieters sofort ablehnt statt zu stauen,
+- Wiederholungen mit Jitter, begrenzt durch ein gemeinsames Retry-Budget.
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from einstellungen import (
+    GATEWAY_MAX_PARALLEL, GATEWAY_RATE_PRO_S, GATEWAY_BURST, GATEWAY_MAX_VERSUCHE, GATEWAY_RETRY_BUDGET,
+    GATEWAY_TIMEOUT_S, GATEWAY_BREAKER_SCHWELLE, GATEWAY_BREAKER_PAUSE_S,
+)
+from messung import messwerte, mit_kontext, zaehle
+
+PRIORITAET_INTERAKTIV = 0   # Chat-Antworten
+PRIORITAET_BEWERTUNG = 1    # Klausurbewertung und vom Nutzer angestoßene Fallgenerierung
+PRIORITAET_HINTERGRUND = 2  # Auffüllen des Fall-Pools und andere Vorarbeiten
+
+# Fehler, bei denen eine Wiederholung nichts ändert (Klassennamen aus google.api_core / genai)
+NICHT_WIEDERHOLBAR = {
+    "InvalidArgument", "PermissionDenied", "Unauthenticated", "NotFound",
+    "BlockedPromptException", "StopCandidateException",
+}
+# Fehler, die auf eine Störung des Anbieters hindeuten und den Circuit Breaker öffnen dürfen
+# (TooManyRequests/ServerError sind die Basisklassen für 429 bzw. 5xx in google.api_core)
+STOERUNGEN = {"TooManyRequests", "ServerError", "RetryError", "TimeoutError", "Timeout", "ConnectionError"}
+
+
+class GatewayUeberlastet(Exception):
+    """Der Circuit Breaker ist offen; die Anfrage wurde ohne Aufruf abgelehnt."""
+
+
+def ist_wiederholbar(fehler):
+    return type(fehler).__name__ not in NICHT_WIEDERHOLBAR
+
+
+def ist_stoerung(fehler):
+    """429, 5xx, Timeouts und Verbindungsfehler (auch Unterklassen, z.B. DeadlineExceeded als GatewayTimeout)."""
+    return any(klasse.__name__ in STOERUNGEN for klasse in type(fehler).__mro__)
+
+
+def _schliesse(iterator):
+    schliessen = getattr(iterator, "close", None)
+    if schliessen is not None:
+        schliessen()
+
+
+class PrioritaetsSemaphore:
+    """Semaphore, die freie Plätze in Prioritätsreihenfolge (dann FIFO) vergibt."""
+
+    def __init__(self, kapazitaet):
+        self.frei = kapazitaet
+        self._wartend = []
+        self._zaehler = itertools.count()
+
+    def wartend(self):
+        return sum(1 for _, _, f in self._wartend if not f.done())
+
+    async def erwerbe(self, prioritaet):
+        if self.frei > 0 and not self._wartend:
+            self.frei -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._wartend, (prioritaet, next(self._zaehler), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Platz wurde schon zugeteilt, aber niemand nimmt ihn mehr an
+            if future.done() and not future.cancelled():
+                self.freigeben()
+            raise
+
+    def freigeben(self):
+        while self._wartend:
+            _, _, future = heapq.heappop(self._wartend)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.frei += 1
+
+
+class TokenBucket:
+    """Begrenzt die Anfragerate auf `rate` pro Sekunde mit Bursts bis `kapazitaet`."""
+
+    def __init__(self, rate, kapazitaet):
+        self.rate = rate
+        self.kapazitaet = kapazitaet
+        self.tokens = kapazitaet
+        self._zeit = time.monotonic()
+
+    async def nimm(self):
+        while True:
+            jetzt = time.monotonic()
+            self.tokens = min(self.kapazitaet, self.tokens + (jetzt - self._zeit) * self.rate)
+            self._zeit = jetzt
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """geschlossen -> (n Fehler in Folge) -> offen -> (Pause) -> halboffen -> ein Testaufruf."""
+
+    def __init__(self, schwelle, pause_s):
+        self.schwelle = schwelle
+        self.pause_s = pause_s
+        self.zustand = "geschlossen"
+        self.fehler_in_folge = 0
+        self._offen_bis = 0.0
+        self._test_laeuft = False
+
+    def erlaube(self):
+        if self.zustand == "offen" and time.monotonic() >= self._offen_bis:
+            self.zustand = "halboffen"
+            self._test_laeuft = False
+        if self.zustand == "geschlossen":
+            return True
+        if self.zustand == "halboffen" and not self._test_laeuft:
+            self._test_laeuft = True
+            return True
+        return False
+
+    def neutral(self):
+        """Antwort ohne Aussage über den Anbieter (z.B. blockierter Prompt): gibt nur den Testaufruf frei."""
+        if self.zustand == "halboffen":
+            self._test_laeuft = False
+
+    def erfolg(self):
+        self.zustand = "geschlossen"
+        self.fehler_in_folge = 0
+        self._test_laeuft = False
+
+    def fehler(self):
+        self.fehler_in_folge += 1
+        if self.zustand == "halboffen" or self.fehler_in_folge >= self.schwelle:
+            self.zustand = "offen"
+            self._offen_bis = time.monotonic() + self.pause_s
+            self._test_laeuft = False
+
+
+class RetryBudget:
+    """Jede Anfrage zahlt `quote` Token ein, jede Wiederholung kostet eins: max. ~quote Wiederholungen pro Anfrage."""
+
+    def __init__(self, quote, minimum=5.0, maximum=50.0):
+        self.quote = quote
+        self.maximum = maximum
+        self.tokens = minimum
+
+    def anfrage(self):
+        self.tokens = min(self.maximum, self.tokens + self.quote)
+
+    def erlaube_wiederholung(self):
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+_ENDE = object()
+
+
+class LLMGateway:
+    """Alle Zustände werden ausschließlich im Thread der Event-Loop verändert."""
+
+    def __init__(self, max_parallel=8, rate_pro_s=5.0, burst=10, max_versuche=3, retry_budget=0.2,
+                 breaker_schwelle=5, breaker_pause_s=30.0, timeout_s=120.0, basis_wartezeit_s=1.0, max_wartezeit_s=20.0):
+        self.max_versuche = max_versuche
+        self.timeout_s = timeout_s
+        self.basis_wartezeit_s = basis_wartezeit_s
+        self.max_wartezeit_s = max_wartezeit_s
+        self._semaphore = PrioritaetsSemaphore(max_parallel)
+        self._bucket = TokenBucket(rate_pro_s, burst)
+        self._breaker = CircuitBreaker(breaker_schwelle, breaker_pause_s)
+        self._budget = RetryBudget(retry_budget)
+        self._laufend = {}
+        self._zaehler = {"anfragen": 0, "zusammengefasst": 0, "wiederholungen": 0, "abgelehnt": 0, "fehler": 0}
+        self._executor = ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="llm-gateway")
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="llm-gateway-loop", daemon=True).start()
+
+    # --- Öffentliche, synchrone API (aus beliebigen Threads) ---
+
+    def ausfuehren(self, funktion, prioritaet=PRIORITAET_INTERAKTIV, schluessel=None):
+        """
+        Führt `funktion()` über das Gateway aus und blockiert bis zum Ergebnis.
+        Gleichzeitige Aufrufe mit demselben `schluessel` teilen sich einen einzigen Aufruf.
+        """
+        # Im Worker-Thread gelten die Spans des Aufrufers als Eltern
+        funktion = mit_kontext(funktion)
+        zukunft = asyncio.run_coroutine_threadsafe(self._ausfuehren(funktion, prioritaet, schluessel), self._loop)
+        try:
+            return zukunft.result(timeout=self.timeout_s)
+        except TimeoutError:
+            zukunft.cancel()
+            raise
+
+    def ausfuehren_stream(self, erzeuge_iterator, prioritaet=PRIORITAET_INTERAKTIV):
+        """
+        Generator über `erzeuge_iterator()`. Wiederholt wird nur bis zum ersten Chunk;
+        der Platz im Parallelitätslimit bleibt belegt, bis der Stream zu Ende gelesen ist.
+        """
+        @mit_kontext
+        def starte():
+            iterator = iter(erzeuge_iterator())
+            return iterator, next(iterator, _ENDE)
+
+        # Eigenes Future statt run_coroutine_threadsafe: die Übergabe an den Aufrufer und sein
+        # Abbruch per Timeout schließen sich über set_running_or_notify_cancel() gegenseitig aus
+        zukunft = Future()
+        aufgabe = []
+
+        def plane():
+            aufgabe.append(self._loop.create_task(self._mit_wiederholung(starte, prioritaet, platz_behalten=True)))
+            aufgabe[0].add_done_callback(lambda a: self._uebergib_stream(a, zukunft))
+
+        self._loop.call_soon_threadsafe(plane)
+        try:
+            iterator, erstes = zukunft.result(timeout=self.timeout_s)
+        except TimeoutError:
+            if zukunft.cancel():
+                # Gewinnt der Versuch den Platz trotzdem noch, gibt _uebergib_stream ihn frei
+                self._loop.call_soon_threadsafe(lambda: aufgabe[0].cancel())
+                raise
+            # Zwischen Timeout und Abbruch übergeben: der Platz gehört schon diesem Aufrufer
+            iterator, erstes = zukunft.result()
+        try:
+            if erstes is not _ENDE:
+                yield erstes
+            yield from iterator
+        except Exception as e:
+            self._loop.call_soon_threadsafe(self._melde_fehler, e)
+            raise
+        finally:
+            _schliesse(iterator)
+            self._loop.call_soon_threadsafe(self._semaphore.freigeben)
+
+    def statistik(self):
+        async def lesen():
+            return {
+                **self._zaehler,
+                "laufend": len(self._laufend),
+                "wartend": self._semaphore.wartend(),
+                "freie_plaetze": self._semaphore.frei,
+                "breaker": self._breaker.zustand,
+                "retry_budget": round(self._budget.tokens, 2),
+            }
+        return asyncio.run_coroutine_threadsafe(lesen(), self._loop).result(timeout=5)
+
+    # --- Innerhalb der Event-Loop ---
+
+    def _uebergib_stream(self, aufgabe, zukunft):
+        """Reicht den Stream-Start an den Aufrufer weiter oder verwirft ihn, wenn der schon aufgegeben hat."""
+        if aufgabe.cancelled():
+            zukunft.cancel()
+            return
+        if not zukunft.set_running_or_notify_cancel():
+            if aufgabe.exception() is None:
+                iterator, _ = aufgabe.result()
+                _schliesse(iterator)
+                self._semaphore.freigeben()
+            return
+        if aufgabe.exception() is not None:
+            zukunft.set_exception(aufgabe.exception())
+        else:
+            zukunft.set_result(aufgabe.result())
+
+    def _melde_fehler(self, fehler):
+        """Nur Störungen des Anbieters zählen für den Breaker; abgelehnte oder ungültige Prompts nicht."""
+        if ist_stoerung(fehler):
+            self._breaker.fehler()
+        else:
+            self._breaker.neutral()
+
+    async def _ausfuehren(self, funktion, prioritaet, schluessel):
+        if schluessel is None:
+            return await self._mit_wiederholung(funktion, prioritaet)
+
+        laufend = self._laufend.get(schluessel)
+        if laufend is not None:
+            self._zaehler["zusammengefasst"] += 1
+            zaehle("juraki_llm_zusammengefasst_gesamt")
+            return await asyncio.shield(laufend)
+
+        gemeinsam = self._loop.create_future()
+        # Verhindert "exception was never retrieved", falls niemand mitwartet
+        gemeinsam.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._laufend[schluessel] = gemeinsam
+        try:
+            ergebnis = await self._mit_wiederholung(funktion, prioritaet)
+            gemeinsam.set_result(ergebnis)
+            return ergebnis
+        except BaseException as e:
+            gemeinsam.set_exception(e if isinstance(e, Exception) else RuntimeError("LLM-Aufruf abgebrochen"))
+            raise
+        finally:
+            self._laufend.pop(schluessel, None)
+
+    async def _mit_wiederholung(self, funktion, prioritaet, platz_behalten=False):
+        self._zaehler["anfragen"] += 1
+        self._budget.anfrage()
+        versuch = 0
+        while True:
+            versuch += 1
+            if not self._breaker.erlaube():
+                self._zaehler["abgelehnt"] += 1
+                zaehle("juraki_llm_abgelehnt_gesamt")
+                raise GatewayUeberlastet("Der KI-Dienst ist vorübergehend überlastet.")
+            await self._semaphore.erwerbe(prioritaet)
+            erfolgreich = False
+            try:
+                await self._bucket.nimm()
+                ergebnis = await self._loop.run_in_executor(self._executor, funktion)
+                erfolgreich = True
+            except Exception as e:
+                self._melde_fehler(e)
+                self._zaehler["fehler"] += 1
+                zaehle("juraki_llm_versuche_gesamt", ergebnis="fehler", art=type(e).__name__)
+                if versuch >= self.max_versuche or not ist_wiederholbar(e) or not self._budget.erlaube_wiederholung():
+                    raise
+                self._zaehler["wiederholungen"] += 1
+                zaehle("juraki_llm_wiederholungen_gesamt")
+            finally:
+                if not (erfolgreich and platz_behalten):
+                    self._semaphore.freigeben()
+            if erfolgreich:
+                self._breaker.erfolg()
+                zaehle("juraki_llm_versuche_gesamt", ergebnis="ok")
+                return ergebnis
+            # Exponentielles Backoff mit vollem Jitter
+            await asyncio.sleep(random.uniform(0, min(self.max_wartezeit_s, self.basis_wartezeit_s * 2 ** (versuch - 1))))
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def hole_gateway():
+    """Prozessweites Gateway, beim ersten Aufruf aus den Einstellungen erzeugt."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway(
+                    max_parallel=GATEWAY_MAX_PARALLEL, rate_pro_s=GATEWAY_RATE_PRO_S, burst=GATEWAY_BURST,
+                    max_versuche=GATEWAY_MAX_VERSUCHE, retry_budget=GATEWAY_RETRY_BUDGET, timeout_s=GATEWAY_TIMEOUT_S,
+                    breaker_schwelle=GATEWAY_BREAKER_SCHWELLE, breaker_pause_s=GATEWAY_BREAKER_PAUSE_S,
+                )
+                gateway = _gateway
+                for wert in ("laufend", "wartend", "freie_plaetze"):
+                    messwerte.registriere_gauge(f"juraki_llm_gateway_{wert}", lambda w=wert: gateway.statistik()[w])
+                messwerte.registriere_gauge("juraki_llm_gateway_breaker_offen",
+                                            lambda: float(gateway.statistik()["breaker"] != "geschlossen"))
+    return _gateway
@@ -0,0 +1,273 @@
+# messung.py
+"""
+Messpunkte im heißen Pfad: Dauer-Histogramme, Zähler und (stichprobenartig) Trace-Spans.
+
+- `span(name, **attribute)` misst jede Ausführung in ein Histogramm
+  `juraki_span_dauer_sekunden{span=...}` und zählt Ausnahmen. Das kostet pro Aufruf zwei
+  Zeitstempel und ein kurzes Lock. Trace-Spans mit IDs und Eltern-Beziehung entstehen nur
+  für einen Anteil der Wurzel-Spans (JURAKI_MESSUNG_TRACE_RATE); Kind-Spans folgen der
+  Entscheidung ihrer Wurzel, damit Traces vollständig bleiben.
+- Gesampelte Spans landen in einem Ringpuffer (Felder wie bei OpenTelemetry) oder, mit
+  JURAKI_MESSUNG_OTEL=1 und installiertem `opentelemetry-api`, direkt beim OTel-Tracer.
+- `prometheus_text()` liefert alle Messwerte im Prometheus-Textformat, optional über einen
+  kleinen HTTP-Server (JURAKI_MESSUNG_METRIK_PORT).
+"""
+import contextvars
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from einstellungen import MESSUNG_AKTIV, MESSUNG_TRACE_RATE, MESSUNG_OTEL, MESSUNG_SPAN_PUFFER
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+DAUER_GRENZEN = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_GRENZEN = (50, 100, 200, 400, 800, 1600, 3200, 6400, 12800)
+
+
+class Histogramm:
+    """Kumulierbare Bucket-Zähler wie beim Prometheus-Histogramm."""
+
+    def __init__(self, grenzen=DAUER_GRENZEN):
+        self.grenzen = grenzen
+        self.buckets = [0] * (len(grenzen) + 1)
+        self.summe = 0.0
+        self.anzahl = 0
+
+    def beobachte(self, wert):
+        self.buckets[bisect_left(self.grenzen, wert)] += 1
+        self.summe += wert
+        self.anzahl += 1
+
+
+class Messwerte:
+    """Prozessweite Sammlung aller Histogramme, Zähler und Messfunktionen (Gauges)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogramme = {}
+        self._zaehler = {}
+        self._gauges = {}
+
+    @staticmethod
+    def _schluessel(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def beobachte(self, name, wert, grenzen=DAUER_GRENZEN, **labels):
+        schluessel = self._schluessel(name, labels)
+        with self._lock:
+            histogramm = self._histogramme.get(schluessel)
+            if histogramm is None:
+                histogramm = self._histogramme[schluessel] = Histogramm(grenzen)
+            histogramm.beobachte(wert)
+
+    def zaehle(self, name, wert=1, **labels):
+        schluessel = self._schluessel(name, labels)
+        with self._lock:
+            self._zaehler[schluessel] = self._zaehler.get(schluessel, 0) + wert
+
+    def registriere_gauge(self, name, funktion):
+        """`funktion()` liefert beim Export {Label-Dict als Tupel: Wert} oder einen einzelnen Wert."""
+        with self._lock:
+            self._gauges[name] = funktion
+
+    def prometheus_text(self):
+        with self._lock:
+            histogramme = {k: (list(h.buckets), h.summe, h.anzahl, h.grenzen) for k, h in self._histogramme.items()}
+            zaehler = dict(self._zaehler)
+            gauges = dict(self._gauges)
+
+        zeilen = []
+        for name in sorted({n for n, _ in zaehler}):
+            zeilen.append(f"# TYPE {name} counter")
+            for (n, labels), wert in sorted(zaehler.items()):
+                if n == name:
+                    zeilen.append(f"{name}{_labels(labels)} {wert}")
+        for name in sorted({n for n, _ in histogramme}):
+            zeilen.append(f"# TYPE {name} histogram")
+            for (n, labels), (buckets, summe, anzahl, grenzen) in sorted(histogramme.items()):
+                if n != name:
+                    continue
+                kumuliert = 0
+                for grenze, wert in zip(grenzen + (float("inf"),), buckets):
+                    kumuliert += wert
+                    le = "+Inf" if grenze == float("inf") else repr(grenze)
+                    zeilen.append(f"{name}_bucket{_labels(labels + (('le', le),))} {kumuliert}")
+                zeilen.append(f"{name}_sum{_labels(labels)} {summe:.6f}")
+                zeilen.append(f"{name}_count{_labels(labels)} {anzahl}")
+        for name, funktion in sorted(gauges.items()):
+            try:
+                werte = funktion()
+            except Exception as e:
+                zeilen.append(f"# Fehler beim Lesen von {name}: {e}")
+                continue
+            zeilen.append(f"# TYPE {name} gauge")
+            if not isinstance(werte, dict):
+                werte = {(): werte}
+            for labels, wert in sorted(werte.items()):
+                zeilen.append(f"{name}{_labels(labels)} {float(wert)}")
+        return "\n".join(zeilen) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    teile = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+    return "{" + teile + "}"
+
+
+def _escape(wert):
+    return str(wert).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+messwerte = Messwerte()
+
+# --- SPANS ---
+
+# (trace_id, span_id) des aktuellen gesampelten Spans, None = nicht gesampelt, leer = keine Wurzel
+_aktueller_span = contextvars.ContextVar("juraki_span", default=())
+letzte_spans = deque(maxlen=MESSUNG_SPAN_PUFFER)
+
+
+def _neue_id(bits):
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+@contextmanager
+def _gemessener_span(name, attribute):
+    eltern = _aktueller_span.get()
+    if eltern == ():
+        gesampelt = random.random() < MESSUNG_TRACE_RATE
+        trace_id, eltern_id = (_neue_id(128) if gesampelt else None), None
+    else:
+        gesampelt = eltern is not None
+        trace_id, eltern_id = eltern if gesampelt else (None, None)
+
+    otel_span = None
+    if gesampelt and MESSUNG_OTEL and otel_trace is not None:
+        otel_span = otel_trace.get_tracer("juraki").start_as_current_span(name, attributes=attribute)
+        otel_span.__enter__()
+    span_id = _neue_id(64) if gesampelt else None
+    token = _aktueller_span.set((trace_id, span_id) if gesampelt else None)
+    start_ns = time.time_ns()
+    start = time.perf_counter()
+    fehler = None
+    try:
+        yield
+    except Exception as e:
+        # st.rerun()/st.stop() sind BaseExceptions zur Ablaufsteuerung und zählen nicht als Fehler
+        fehler = e
+        raise
+    finally:
+        dauer = time.perf_counter() - start
+        _aktueller_span.reset(token)
+        messwerte.beobachte("juraki_span_dauer_sekunden", dauer, span=name)
+        if fehler is not None:
+            messwerte.zaehle("juraki_span_fehler_gesamt", span=name, art=type(fehler).__name__)
+        if otel_span is not None:
+            otel_span.__exit__(type(fehler) if fehler else None, fehler, None)
+        elif gesampelt:
+            letzte_spans.append({
+                "name": name, "trace_id": trace_id, "span_id": span_id, "parent_span_id": eltern_id,
+                "start_time_unix_nano": start_ns, "end_time_unix_nano": start_ns + int(dauer * 1e9),
+                "attributes": attribute, "status": "ERROR" if fehler is not None else "OK",
+                "thread": threading.current_thread().name,
+            })
+
+
+def span(name, **attribute):
+    """Kontextmanager um einen Abschnitt im heißen Pfad (wirkungslos mit JURAKI_MESSUNG=0)."""
+    return _gemessener_span(name, attribute) if MESSUNG_AKTIV else nullcontext()
+
+
+def gemessen(name=None):
+    """Dekorator: die ganze Funktion als Span."""
+    def dekorator(funktion):
+        span_name = name or funktion.__name__
+
+        @wraps(funktion)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return funktion(*args, **kwargs)
+        return wrapper
+    return dekorator
+
+
+def erfasse_dauer(name, dauer_s, **labels):
+    """Bereits gemessene Dauer eintragen (z.B. über mehrere yields eines Streams hinweg)."""
+    if MESSUNG_AKTIV:
+        messwerte.beobachte("juraki_span_dauer_sekunden", dauer_s, span=name, **labels)
+
+
+def erfasse_wert(name, wert, grenzen, **labels):
+    """Beliebige Größe als Histogramm (z.B. Prompt-Tokens pro Anfrage mit TOKEN_GRENZEN)."""
+    if MESSUNG_AKTIV:
+        messwerte.beobachte(name, wert, grenzen, **labels)
+
+
+def zaehle(name, wert=1, **labels):
+    if MESSUNG_AKTIV:
+        messwerte.zaehle(name, wert, **labels)
+
+
+def mit_kontext(funktion):
+    """Bindet den aktuellen Span-Kontext an `funktion`, damit sie in einem anderen Thread als Kind zählt."""
+    kontext = contextvars.copy_context()
+    return lambda: kontext.copy().run(funktion)
+
+
+def prometheus_text():
+    return messwerte.prometheus_text()
+
+
+# --- HTTP-EXPORT ---
+
+class _MetrikHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        daten = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(daten)))
+        self.end_headers()
+        self.wfile.write(daten)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_fehlgeschlagen = False  # Port belegt: nicht bei jedem Rerun erneut versuchen
+_server_lock = threading.Lock()
+
+
+def starte_metrik_server(port, host="0.0.0.0"):
+    """
+    Startet einmal pro Prozess einen HTTP-Server für /metrics (Prometheus-Scrape).
+    Schlägt das Binden fehl, bleibt es für diesen Prozess dabei; gemeldet wird einmal.
+    """
+    global _server, _server_fehlgeschlagen
+    with _server_lock:
+        if _server is None:
+            if _server_fehlgeschlagen:
+                return None
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetrikHandler)
+            except OSError as e:
+                # Mehrere Worker auf einem Host: nur der erste bekommt den Port
+                _server_fehlgeschlagen = True
+                print(f"Metrik-Server auf Port {port} nicht gestartet (PID {os.getpid()}): {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrik-server", daemon=True).start()
+    return _server
@@ -0,0 +1,119 @@
+# start_profil.py
+"""
+Profiling des Kaltstarts.
+
+Mit JURAKI_STARTPROFIL=1 misst die App die Dauer jedes erstmaligen Imports (inklusive der
+Module, die dieser nach sich zieht) und jeder benannten Startstufe, z.B. bis zum ersten
+fertigen Seitenaufbau. Ohne die Variable sind `stufe()` und `starte()` wirkungslos.
+
+Aufruf ohne Streamlit (frischer Prozess, misst Importe und Ladestufen der Embeddings):
+    python start_profil.py
+"""
+import builtins
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from einstellungen import STARTPROFIL
+
+
+class StartProfil:
+    """Sammelt Import- und Stufenzeiten; thread-sicher, da auch der Vorwärm-Thread importiert."""
+
+    def __init__(self):
+        self.beginn = time.perf_counter()
+        self.importe = []  # (modul, dauer_s, verschachtelungstiefe, thread)
+        self.stufen = []   # (lauf, name, dauer_s)
+        self.lauf = 0
+        self._lokal = threading.local()
+        self._lock = threading.Lock()
+        self._original_import = None
+
+    def installiere_import_hook(self):
+        if self._original_import is not None:
+            return
+        original = self._original_import = builtins.__import__
+
+        def messender_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if level != 0 or name in sys.modules:
+                return original(name, globals, locals, fromlist, level)
+            tiefe = getattr(self._lokal, "tiefe", 0)
+            self._lokal.tiefe = tiefe + 1
+            start = time.perf_counter()
+            try:
+                return original(name, globals, locals, fromlist, level)
+            finally:
+                self._lokal.tiefe = tiefe
+                with self._lock:
+                    self.importe.append((name, time.perf_counter() - start, tiefe, threading.current_thread().name))
+
+        builtins.__import__ = messender_import
+
+    def neuer_lauf(self):
+        with self._lock:
+            self.lauf += 1
+
+    def erfasse(self, name, dauer_s):
+        with self._lock:
+            self.stufen.append((self.lauf, name, dauer_s))
+
+    @contextmanager
+    def stufe(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.erfasse(name, time.perf_counter() - start)
+
+    def bericht(self, max_importe=15):
+        """Textbericht: Stufen des ersten und des letzten Laufs, langsamste Importe oberster Ebene."""
+        with self._lock:
+            stufen = list(self.stufen)
+            importe = sorted((i for i in self.importe if i[2] == 0), key=lambda i: -i[1])[:max_importe]
+        zeilen = ["Stufen (Lauf, Name, ms):"]
+        for lauf, name, dauer in stufen:
+            if lauf in (1, self.lauf) or lauf == 0:
+                zeilen.append(f"  {lauf:>3}  {name:<32} {dauer * 1000:9.1f}")
+        zeilen.append("Langsamste Importe (ms, inkl. Abhängigkeiten):")
+        for name, dauer, _, thread in importe:
+            zeilen.append(f"  {name:<36} {dauer * 1000:9.1f}  [{thread}]")
+        return "\n".join(zeilen)
+
+
+# Ein Profil pro Prozess; app.py wird bei jedem Rerun neu ausgeführt, dieses Modul nicht
+profil = StartProfil()
+
+
+def starte():
+    """Zu Beginn jedes Skriptlaufs aufrufen: installiert einmalig den Import-Hook und zählt den Lauf."""
+    if STARTPROFIL:
+        profil.installiere_import_hook()
+        profil.neuer_lauf()
+
+
+def stufe(name):
+    """Kontextmanager, der die Dauer einer Startstufe erfasst (nur im Profiling-Modus)."""
+    return profil.stufe(name) if STARTPROFIL else nullcontext()
+
+
+def main():
+    profil.installiere_import_hook()
+    with profil.stufe("import_streamlit"):
+        import streamlit  # noqa: F401
+    with profil.stufe("import_app_module"):
+        import klausur_logik, chatbot_logik, gamification_logik, lern_speicher  # noqa: F401
+        from datenbank import lade_faelle, lade_embedding_modell, erstelle_fall_index
+    with profil.stufe("lade_faelle"):
+        faelle = lade_faelle("zivilrecht-faelle-json.json")
+    with profil.stufe("lade_embedding_modell"):
+        modell = lade_embedding_modell()
+    with profil.stufe("erstelle_fall_index"):
+        erstelle_fall_index(faelle, modell)
+    with profil.stufe("import_pandas"):
+        import pandas  # noqa: F401
+    print(profil.bericht(max_importe=25))
+
+
+if __name__ == "__main__":
+    main()
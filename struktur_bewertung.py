@@ -0,0 +1,104 @@
+# struktur_bewertung.py
+"""
+Schnelle lokale Vorab-Bewertung der Gliederung einer Klausurlösung.
+
+Verglichen werden die Überschriften der Lösung mit den Punkten der Lösungsskizze über die
+Embeddings des ohnehin geladenen Satz-Modells (MiniLM), dazu die zitierten Normen:
+
+- Abdeckung:   wie gut jeder Skizzenpunkt von seiner ähnlichsten Überschrift getroffen wird
+- Reihenfolge: Anteil der getroffenen Punktpaare, die in derselben Reihenfolge stehen
+- Normen:      Anteil der in der Skizze zitierten §§/Art., die auch in der Lösung stehen
+
+Das Ergebnis liegt nach einem Forward-Pass vor (einige zehn Millisekunden) und wird angezeigt,
+bevor die LLM-Bewertung fertig ist. Es ersetzt sie nicht.
+"""
+import re
+from dataclasses import dataclass
+
+import numpy as np
+
+from hybrid_suche import zitierte_normen
+
+# Gliederungszeichen wie "A.", "II.", "1.", "a)", "aa)", "(1)" oder Markdown-Überschriften
+_GLIEDERUNG = re.compile(r"^\s*(?:#{1,6}\s*|(?:[A-H]|[IVX]{1,5}|\d{1,2})\.\s+|[a-z]{1,3}\)\s*|\(\d{1,2}\)\s*)(\S.*)$")
+# Kosinus-Ähnlichkeit, ab der ein Skizzenpunkt als vollständig bzw. gar nicht getroffen gilt
+AEHNLICH_OBEN = 0.75
+AEHNLICH_UNTEN = 0.35
+# Überschriften werden für das Embedding auf diese Länge gekürzt
+MAX_ZEICHEN = 200
+GEWICHTE = {"abdeckung": 0.6, "reihenfolge": 0.2, "normen": 0.2}
+
+
+@dataclass(frozen=True)
+class StrukturBewertung:
+    score: int              # 0-100
+    abdeckung: float
+    reihenfolge: float
+    normen: float           # None, wenn die Skizze keine Normen zitiert
+    fehlende_punkte: tuple
+    fehlende_normen: tuple
+
+
+def _ohne_gliederungszeichen(zeile):
+    treffer = _GLIEDERUNG.match(zeile)
+    return (treffer.group(1) if treffer else zeile).strip()
+
+
+def skizzen_punkte(loesungsskizze):
+    """Nicht-leere Punkte der Skizze ohne Einrückung und Gliederungszeichen (die Skizze ist ein String-Array)."""
+    if isinstance(loesungsskizze, str):
+        loesungsskizze = loesungsskizze.splitlines()
+    return [_ohne_gliederungszeichen(p) for p in loesungsskizze or () if p and p.strip()]
+
+
+def ueberschriften(loesungstext):
+    """
+    Gliederungspunkte der Lösung. Ohne erkennbare Gliederungszeichen dient der erste Satz
+    jedes Absatzes als Überschrift.
+    """
+    zeilen = [z for z in (loesungstext or "").splitlines() if z.strip()]
+    gefunden = [t.group(1).strip() for z in zeilen if (t := _GLIEDERUNG.match(z))]
+    if not gefunden:
+        absaetze = re.split(r"\n\s*\n", loesungstext or "")
+        gefunden = [re.split(r"(?<=[.!?:])\s", a.strip(), maxsplit=1)[0] for a in absaetze if a.strip()]
+    return [u[:MAX_ZEICHEN] for u in gefunden]
+
+
+def _normiert(vektoren):
+    vektoren = np.asarray(vektoren, dtype=np.float32)
+    return vektoren / np.maximum(np.linalg.norm(vektoren, axis=1, keepdims=True), 1e-12)
+
+
+def _reihenfolge(positionen):
+    """Anteil der Paare (i < j) mit positionen[i] <= positionen[j]; 1.0 bei weniger als zwei Punkten."""
+    positionen = np.asarray(positionen)
+    if len(positionen) < 2:
+        return 1.0
+    i, j = np.triu_indices(len(positionen), k=1)
+    return float(np.mean(positionen[i] <= positionen[j]))
+
+
+def bewerte_struktur(loesungsskizze, loesungstext, modell):
+    """Lokale Strukturbewertung; `modell` braucht nur `encode(liste)` (z.B. der Embedding-Dienst)."""
+    punkte = skizzen_punkte(loesungsskizze)
+    koepfe = ueberschriften(loesungstext)
+    soll_normen = zitierte_normen("\n".join(punkte))
+    fehlende_normen = tuple(sorted(soll_normen - zitierte_normen(loesungstext)))
+    normen = 1 - len(fehlende_normen) / len(soll_normen) if soll_normen else None
+
+    if punkte and koepfe:
+        vektoren = _normiert(modell.encode(punkte + koepfe, convert_to_numpy=True, show_progress_bar=False))
+        aehnlichkeit = vektoren[:len(punkte)] @ vektoren[len(punkte):].T
+        beste = aehnlichkeit.max(axis=1)
+        treffer = np.clip((beste - AEHNLICH_UNTEN) / (AEHNLICH_OBEN - AEHNLICH_UNTEN), 0.0, 1.0)
+        abdeckung = float(treffer.mean())
+        getroffen = beste >= AEHNLICH_UNTEN
+        reihenfolge = _reihenfolge(aehnlichkeit.argmax(axis=1)[getroffen])
+        fehlende_punkte = tuple(p for p, t in zip(punkte, treffer) if t == 0.0)
+    else:
+        abdeckung, reihenfolge, fehlende_punkte = 0.0, 0.0, tuple(punkte)
+
+    teile = {"abdeckung": abdeckung, "reihenfolge": reihenfolge, "normen": normen}
+    gewichte = {k: g for k, g in GEWICHTE.items() if teile[k] is not None}
+    score = sum(teile[k] * g for k, g in gewichte.items()) / sum(gewichte.values())
+    return StrukturBewertung(round(100 * score), abdeckung, reihenfolge, normen, fehlende_punkte, fehlende_normen)
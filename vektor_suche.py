@@ -0,0 +1,173 @@
+# vektor_suche.py
+"""
+Vektorsuche über die Fall-Embeddings.
+
+Alle Vektoren werden einmalig L2-normalisiert, sodass die Kosinus-Ähnlichkeit ein reines
+Skalarprodukt ist. Bereits normalisierte Matrizen (`normalisiert=True`, etwa aus dem
+Embedding-Speicher) werden unverändert übernommen, eine memory-mapped Matrix also nicht kopiert. Für kleine Datenbanken reicht die exakte Suche (eine Matrix-Vektor-
+Multiplikation), ab einer konfigurierbaren Größe wird automatisch ein ANN-Index verwendet:
+HNSW, falls `hnswlib` installiert ist, sonst ein eingebauter IVF-Index (k-Means-Listen).
+"""
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+def normalisiere(vektoren):
+    """Gibt eine float32-Kopie mit Zeilen der Länge 1 zurück (Nullvektoren bleiben null)."""
+    vektoren = np.asarray(vektoren, dtype=np.float32)
+    if vektoren.ndim == 1:
+        norm = np.linalg.norm(vektoren)
+        return vektoren / norm if norm > 0 else vektoren.copy()
+    normen = np.linalg.norm(vektoren, axis=1, keepdims=True)
+    normen[normen == 0] = 1.0
+    return vektoren / normen
+
+
+def _top_k(scores, top_k):
+    """Indizes der top_k größten Scores, absteigend sortiert, in O(N + k log k)."""
+    if top_k >= len(scores):
+        reihenfolge = np.argsort(-scores)
+    else:
+        kandidaten = np.argpartition(-scores, top_k)[:top_k]
+        reihenfolge = kandidaten[np.argsort(-scores[kandidaten])]
+    return reihenfolge
+
+
+def _filtere(indizes, scores, min_score):
+    return [(int(i), float(s)) for i, s in zip(indizes, scores) if s >= min_score]
+
+
+class BruteForceIndex:
+    """Exakte Suche: ein Skalarprodukt gegen alle Vektoren."""
+    name = "bruteforce"
+
+    def __init__(self, vektoren, normalisiert=False):
+        self.vektoren = vektoren if normalisiert else normalisiere(vektoren)
+
+    def __len__(self):
+        return len(self.vektoren)
+
+    def suche(self, query_vektor, top_k=5, min_score=0.0):
+        """Gibt eine Liste von (Index, Score) zurück, absteigend nach Score."""
+        if len(self.vektoren) == 0:
+            return []
+        scores = self.vektoren @ normalisiere(query_vektor)
+        indizes = _top_k(scores, top_k)
+        return _filtere(indizes, scores[indizes], min_score)
+
+
+class IVFIndex:
+    """
+    Inverted-File-Index: Die Vektoren werden per sphärischem k-Means in Listen aufgeteilt.
+    Eine Anfrage durchsucht nur die `n_probe` Listen mit den ähnlichsten Zentroiden.
+    """
+    name = "ivf"
+
+    def __init__(self, vektoren, n_listen=None, n_probe=8, iterationen=10, trainings_groesse=50_000, seed=0,
+                 normalisiert=False):
+        if not normalisiert:
+            vektoren = normalisiere(vektoren)
+        anzahl = self.anzahl = len(vektoren)
+        self.n_listen = max(1, min(anzahl, n_listen or int(np.sqrt(anzahl))))
+        self.n_probe = max(1, min(n_probe, self.n_listen))
+
+        rng = np.random.default_rng(seed)
+        training = vektoren
+        if anzahl > trainings_groesse:
+            training = vektoren[rng.choice(anzahl, trainings_groesse, replace=False)]
+        self.zentroide = self._trainiere(training, iterationen, rng)
+
+        zuordnung = self._ordne_zu(vektoren)
+        # Listen als eine sortierte Indexfolge plus Offsets statt vieler kleiner Arrays
+        self.reihenfolge = np.argsort(zuordnung, kind="stable")
+        self.offsets = np.searchsorted(zuordnung[self.reihenfolge], np.arange(self.n_listen + 1))
+        self.sortierte_vektoren = vektoren[self.reihenfolge]
+
+    def __len__(self):
+        return self.anzahl
+
+    def _ordne_zu(self, vektoren, block=65_536):
+        zuordnung = np.empty(len(vektoren), dtype=np.int64)
+        for start in range(0, len(vektoren), block):
+            zuordnung[start:start + block] = np.argmax(vektoren[start:start + block] @ self.zentroide.T, axis=1)
+        return zuordnung
+
+    def _trainiere(self, training, iterationen, rng):
+        zentroide = training[rng.choice(len(training), self.n_listen, replace=False)].copy()
+        for _ in range(iterationen):
+            zuordnung = np.argmax(training @ zentroide.T, axis=1)
+            groessen = np.bincount(zuordnung, minlength=self.n_listen)
+            starts = np.concatenate(([0], np.cumsum(groessen)[:-1]))
+            leer = groessen == 0
+            summen = np.zeros_like(zentroide)
+            summen[~leer] = np.add.reduceat(training[np.argsort(zuordnung, kind="stable")], starts[~leer], axis=0)
+            # Leere Listen mit zufälligen Trainingspunkten neu besetzen
+            summen[leer] = training[rng.choice(len(training), int(leer.sum()))]
+            zentroide = normalisiere(summen)
+        return zentroide
+
+    def suche(self, query_vektor, top_k=5, min_score=0.0):
+        """Gibt eine Liste von (Index, Score) zurück, absteigend nach Score."""
+        if self.anzahl == 0:
+            return []
+        query = normalisiere(query_vektor)
+        listen = _top_k(self.zentroide @ query, self.n_probe)
+        bereiche = [np.arange(self.offsets[l], self.offsets[l + 1]) for l in listen]
+        positionen = np.concatenate(bereiche) if bereiche else np.empty(0, dtype=np.int64)
+        if len(positionen) == 0:
+            return []
+        scores = self.sortierte_vektoren[positionen] @ query
+        beste = _top_k(scores, top_k)
+        return _filtere(self.reihenfolge[positionen[beste]], scores[beste], min_score)
+
+
+class HNSWIndex:
+    """Graphbasierter ANN-Index über die optionale Bibliothek `hnswlib`."""
+    name = "hnsw"
+
+    def __init__(self, vektoren, m=16, ef_construction=200, ef_suche=64, normalisiert=False):
+        if hnswlib is None:
+            raise ImportError("Für den HNSW-Index muss 'hnswlib' installiert sein.")
+        if not normalisiert:
+            vektoren = normalisiere(vektoren)
+        self.anzahl = len(vektoren)
+        self.index = hnswlib.Index(space="ip", dim=vektoren.shape[1])
+        self.index.init_index(max_elements=max(1, self.anzahl), M=m, ef_construction=ef_construction)
+        if self.anzahl:
+            self.index.add_items(vektoren, np.arange(self.anzahl))
+        self.ef_suche = ef_suche
+
+    def __len__(self):
+        return self.anzahl
+
+    def suche(self, query_vektor, top_k=5, min_score=0.0):
+        """Gibt eine Liste von (Index, Score) zurück, absteigend nach Score."""
+        if self.anzahl == 0:
+            return []
+        top_k = min(top_k, self.anzahl)
+        self.index.set_ef(max(self.ef_suche, top_k))
+        labels, distanzen = self.index.knn_query(normalisiere(query_vektor), k=top_k)
+        # hnswlib liefert für "ip" die Distanz 1 - Skalarprodukt
+        return _filtere(labels[0], 1.0 - distanzen[0], min_score)
+
+
+BACKENDS = {"bruteforce": BruteForceIndex, "ivf": IVFIndex, "hnsw": HNSWIndex}
+
+
+def baue_index(vektoren, backend="auto", ann_schwelle=50_000, **optionen):
+    """
+    Baut einen Suchindex über die Vektoren.
+    Mit backend="auto" wird bis `ann_schwelle` Vektoren exakt gesucht, darüber per ANN.
+    """
+    if backend == "auto":
+        if len(vektoren) < ann_schwelle:
+            backend = "bruteforce"
+        else:
+            backend = "hnsw" if hnswlib is not None else "ivf"
+    if backend not in BACKENDS:
+        raise ValueError(f"Unbekanntes Such-Backend: {backend}")
+    return BACKENDS[backend](vektoren, **optionen)